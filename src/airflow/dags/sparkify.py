@@ -4,142 +4,410 @@ from datetime import datetime, timedelta
 from airflow.operators.dummy_operator import DummyOperator
 from airflow.operators import (
     StageToRedshiftOperator,
+    ConvertToParquetOperator,
+    CompactLogsOperator,
     LoadFactOperator,
-    LoadDimensionOperator,
-    DataQualityOperator
+    LoadAggregateOperator,
+    LoadDimensionsOperator,
+    DataQualityOperator,
+    DropStagingTablesOperator,
+    TableMaintenanceOperator
 )
+from helpers.aggregates import DEFAULT_AGGREGATES
 
-# Loads the Sparkify configuration from the Airflow variables.
+# Loads the Sparkify configuration from the Airflow variables. It is read
+# once for all the DAGs, since every read is a query to the metadata
+# database, and the file is parsed again and again by the scheduler.
 config = Variable.get('sparkify_config', deserialize_json=True)
 
-# ---- #
-# Dag #
-# ---- #
 
-dag = DAG(
-    'sparkify',
-    description='Sparkify data pipeline',
-    schedule_interval='@hourly',
-    catchup=False,
-    default_args={
-        'owner': 'udacity',
-        'start_date': datetime(2019, 1, 12),
-        'depends_on_past': False,
-        'retries': config['dag']['retries'],
-        'retry_delay': timedelta(minutes=config['dag']['retry_delay']),
-        'email_on_retry': False
+# ------------- #
+# Configuration #
+# ------------- #
+
+def merge_config(base, overrides):
+
+    """
+    Merges the configuration of a tenant into the base configuration. The
+    nested dicts are merged key by key, and any other value is replaced.
+
+    Parameters:
+        base (dict): The base configuration.
+        overrides (dict): The configuration of the tenant.
+
+    Returns:
+        (dict): The merged configuration. The given dicts are not modified.
+    """
+
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def get_sources(config):
+
+    """
+    Gets the sources staged by the pipeline, by name. The key 'sources' of
+    the configuration lists them, and defaults to the log and song data of
+    the keys 's3' and 'redshift'.
+
+    Parameters:
+        config (dict): The configuration of the pipeline.
+
+    Returns:
+        (dict): The keys 's3_prefix', 'target_table', 'placeholder',
+            'json_path', 'format', 's3_key', 'parquet_prefix',
+            'compacted_prefix' and 'quarantine_prefix' of every source, by
+            name. The placeholder is the one that stands for the staging
+            table in the queries, 'staging_<name>' by default.
+    """
+
+    s3 = config['s3']
+    redshift = config['redshift']
+
+    sources = config.get('sources') or {
+        'events': {
+            's3_prefix': s3['log_data'],
+            'target_table': redshift['staging_events_table'],
+            'json_path': s3['log_data_json_path'],
+            's3_key': s3.get('log_data_key'),
+            'parquet_prefix': s3.get('log_data_parquet'),
+            'compacted_prefix': s3.get('log_data_compacted'),
+            'quarantine_prefix': s3.get('log_data_quarantine')
+        },
+        'songs': {
+            's3_prefix': s3['song_data'],
+            'target_table': redshift['staging_songs_table']
+        }
     }
-)
 
-# --------- #
-# Operators #
-# --------- #
+    return {
+        name: {
+            's3_prefix': source['s3_prefix'],
+            'target_table': source['target_table'],
+            'placeholder': source.get('placeholder', 'staging_{}'.format(name)),
+            'json_path': source.get('json_path', 'auto'),
+            'format': source.get('format', 'json'),
+            's3_key': source.get('s3_key'),
+            'parquet_prefix': source.get('parquet_prefix'),
+            'compacted_prefix': source.get('compacted_prefix'),
+            'quarantine_prefix': source.get('quarantine_prefix')
+        }
+        for name, source in sources.items()
+    }
 
-start_operator = DummyOperator(
-    task_id='Begin_execution',
-    dag=dag
-)
 
-stage_events_to_redshift = StageToRedshiftOperator(
-    task_id='Stage_events',
-    dag=dag,
-    provide_context=True,
-    redshift_conn_id='redshift',
-    iam_role_arn=config['iam']['role_arn'],
-    s3_prefix=config['s3']['log_data'],
-    target_table=config['redshift']['staging_events_table'],
-    json_path=config['s3']['log_data_json_path']
-)
+def get_dimensions(config):
 
-stage_songs_to_redshift = StageToRedshiftOperator(
-    task_id='Stage_songs',
-    dag=dag,
-    provide_context=True,
-    redshift_conn_id='redshift',
-    iam_role_arn=config['iam']['role_arn'],
-    s3_prefix=config['s3']['song_data'],
-    target_table=config['redshift']['staging_songs_table']
-)
+    """
+    Gets the dimensions loaded by the pipeline, as taken by the operator
+    LoadDimensionsOperator. The key 'dimensions' of the configuration lists
+    them, and defaults to the four Sparkify dimensions of the key 'redshift'.
+    Unless the staging tables are shared, they only hold the data of the
+    current run, so the dimensions are merged instead of rebuilt. Otherwise,
+    they are rebuilt as told by the key 'dag.dimension_rebuild': either
+    'truncate' or 'swap'.
 
-load_songplays_table = LoadFactOperator(
-    task_id='Load_songplays_fact_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    target_table=config['redshift']['songplays_table']
-)
+    Parameters:
+        config (dict): The configuration of the pipeline.
 
-load_user_dimension_table = LoadDimensionOperator(
-    task_id='Load_user_dim_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    target_table=config['redshift']['users_table'],
-    dimension=config['redshift']['users_table'],
-    truncate=True
-)
+    Returns:
+        (dict): The load of every dimension, by name.
+    """
 
-load_song_dimension_table = LoadDimensionOperator(
-    task_id='Load_song_dim_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    target_table=config['redshift']['songs_table'],
-    dimension=config['redshift']['songs_table'],
-    truncate=True
-)
+    redshift = config['redshift']
 
-load_artist_dimension_table = LoadDimensionOperator(
-    task_id='Load_artist_dim_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    target_table=config['redshift']['artists_table'],
-    dimension=config['redshift']['artists_table'],
-    truncate=True
-)
+    if config.get('dimensions'):
+        return config['dimensions']
 
-load_time_dimension_table = LoadDimensionOperator(
-    task_id='Load_time_dim_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    target_table=config['redshift']['time_table'],
-    dimension=config['redshift']['time_table'],
-    truncate=True
-)
+    shared = config['dag'].get('staging_mode', 'shared') == 'shared'
+    rebuild = config['dag'].get('dimension_rebuild', 'truncate')
+
+    def load(table, pk_field):
+        return {'target_table': table, 'mode': rebuild} if shared \
+            else {'target_table': table, 'mode': 'merge', 'pk_field': pk_field}
+
+    return {
+        'users': load(redshift['users_table'], 'userid'),
+        'songs': load(redshift['songs_table'], 'songid'),
+        'artists': load(redshift['artists_table'], 'artistid'),
+        'time': {
+            'target_table': redshift['time_table'],
+            'mode': 'incremental',
+            'pk_field': 'start_time'
+        }
+    }
+
+
+def get_aggregates(config):
+
+    """
+    Gets the aggregate tables refreshed by the pipeline, by name, as taken
+    by the operator LoadAggregateOperator. The key 'aggregates' of the
+    configuration lists them, or is true for the default rollups of
+    songplays: the plays of every user by day, the plays of every song by
+    hour and the sessions of every user.
+
+    Parameters:
+        config (dict): The configuration of the pipeline.
+
+    Returns:
+        (dict): The spec of every aggregate, by name. Empty when the key is
+            missing or false.
+
+    Raises:
+        ValueError: if there are aggregates but the fact load is not window
+            scoped, since they read the rows of the run interval as the
+            rows the run loaded.
+    """
+
+    aggregates = config.get('aggregates')
+    if not aggregates:
+        return {}
+
+    if not config['dag'].get('window_scoped', True):
+        raise ValueError('The aggregates require the key dag.window_scoped.')
+
+    return aggregates if isinstance(aggregates, dict) else DEFAULT_AGGREGATES
 
-run_quality_checks = DataQualityOperator(
-    task_id='Run_data_quality_checks',
-    dag=dag,
-    redshift_conn_id='redshift',
-    tables=(
-        'songs',
-        'artists',
-        'users',
-        'time',
-        'songplays'
+
+# ----------- #
+# DAG factory #
+# ----------- #
+
+def build_dag(dag_id, config):
+
+    """
+    Builds the Sparkify DAG of a given configuration: the sources are staged
+    in parallel, then the fact and dimension tables are loaded, the data
+    quality checks run on all of them and, optionally, the aggregate tables
+    are refreshed and all the tables are maintained.
+
+    Parameters:
+        dag_id (str): The DAG identifier.
+        config (dict): The configuration of the pipeline.
+
+    Returns:
+        (DAG): The DAG.
+    """
+
+    dag_config = config['dag']
+    redshift_conn_id = config['redshift'].get('conn_id', 'redshift')
+    metrics_sink = dag_config.get('metrics_sink')
+
+    dag = DAG(
+        dag_id,
+        description='Sparkify data pipeline',
+        schedule_interval=dag_config.get('schedule_interval', '@hourly'),
+        catchup=False,
+        default_args={
+            'owner': dag_config.get('owner', 'udacity'),
+            'start_date': datetime.strptime(dag_config.get('start_date', '2019-01-12'), '%Y-%m-%d'),
+            'depends_on_past': False,
+            'retries': dag_config['retries'],
+            'retry_delay': timedelta(minutes=dag_config['retry_delay']),
+            'email_on_retry': False
+        }
     )
-)
 
-end_operator = DummyOperator(
-    task_id='Stop_execution',
-    dag=dag
-)
+    start_operator = DummyOperator(
+        task_id='Begin_execution',
+        dag=dag
+    )
+
+    # The lines a COPY query rejects can be moved into quarantine, so the
+    # files that failed are copied once again without them.
+    load_errors_quarantine = config['s3'].get('load_errors_quarantine')
+
+    # Every run can copy into staging tables of its own, read by the tasks
+    # downstream through XCom, so they scan the data of the run only.
+    staging_mode = dag_config.get('staging_mode', 'shared')
+
+    staging_operators = []
+    staging_tasks = {}
+
+    for name, source in sorted(get_sources(config).items()):
 
-# ------------ #
-# DAG workflow #
-# ------------ #
+        upstream = start_operator
+        prefix, copy_format, s3_key = source['s3_prefix'], source['format'], source['s3_key']
 
-start_operator >> stage_events_to_redshift
-start_operator >> stage_songs_to_redshift
+        # The source can be converted to Parquet before it is staged, so
+        # the COPY query reads a fraction of the bytes.
+        if source['parquet_prefix'] is not None:
+            upstream = ConvertToParquetOperator(
+                task_id='Convert_{}_to_parquet'.format(name),
+                dag=dag,
+                provide_context=True,
+                redshift_conn_id=redshift_conn_id,
+                s3_prefix=source['s3_prefix'],
+                target_prefix=source['parquet_prefix'],
+                target_table=source['target_table'],
+                json_path=source['json_path'],
+                s3_key=source['s3_key']
+            )
+            start_operator >> upstream
+            prefix, copy_format = source['parquet_prefix'], 'parquet'
+
+        # Otherwise, it can be validated and compacted into a few large gzip
+        # files, so COPY spreads them evenly across the slices and the
+        # records Redshift would reject are quarantined instead.
+        elif source['compacted_prefix'] is not None:
+            upstream = CompactLogsOperator(
+                task_id='Compact_{}'.format(name),
+                dag=dag,
+                provide_context=True,
+                redshift_conn_id=redshift_conn_id,
+                s3_prefix=source['s3_prefix'],
+                target_prefix=source['compacted_prefix'],
+                quarantine_prefix=source['quarantine_prefix'],
+                target_table=source['target_table'],
+                json_path=source['json_path'],
+                s3_key=source['s3_key'],
+                target_size=dag_config.get('compaction_target_size', 128 * 1024 * 1024)
+            )
+            start_operator >> upstream
+            prefix, copy_format, s3_key = source['compacted_prefix'], 'json_gzip', '{ts_nodash}/'
+
+        stage_operator = StageToRedshiftOperator(
+            task_id='Stage_{}'.format(name),
+            dag=dag,
+            provide_context=True,
+            redshift_conn_id=redshift_conn_id,
+            iam_role_arn=config['iam']['role_arn'],
+            s3_prefix=prefix,
+            target_table=source['target_table'],
+            json_path=source['json_path'],
+            format=copy_format,
+            s3_key=s3_key,
+            manifest_prefix=config['s3'].get('manifest_prefix'),
+            ledger_table=config['redshift'].get('staging_files_table'),
+            fan_out=dag_config.get('staging_fan_out', 1),
+            max_errors=dag_config.get('copy_max_errors', 0),
+            fix_up='quarantine' if load_errors_quarantine is not None else None,
+            quarantine_prefix=load_errors_quarantine,
+            staging_mode=staging_mode,
+            metrics_sink=metrics_sink
+        )
+        upstream >> stage_operator
+        staging_operators.append(stage_operator)
+        staging_tasks[source['placeholder']] = stage_operator.task_id
+
+    load_songplays_table = LoadFactOperator(
+        task_id='Load_songplays_fact_table',
+        dag=dag,
+        redshift_conn_id=redshift_conn_id,
+        target_table=config['redshift']['songplays_table'],
+        window_scoped=dag_config.get('window_scoped', True),
+        staging_tasks=staging_tasks,
+        publish_mode=dag_config.get('fact_publish_mode', 'insert'),
+        metrics_sink=metrics_sink
+    )
 
-stage_events_to_redshift >> load_songplays_table
-stage_songs_to_redshift >> load_songplays_table
+    dimensions = get_dimensions(config)
 
-load_songplays_table >> load_song_dimension_table
-load_songplays_table >> load_user_dimension_table
-load_songplays_table >> load_artist_dimension_table
-load_songplays_table >> load_time_dimension_table
+    load_dimension_tables = LoadDimensionsOperator(
+        task_id='Load_dimension_tables',
+        dag=dag,
+        redshift_conn_id=redshift_conn_id,
+        dimensions=dimensions,
+        staging_tasks=staging_tasks,
+        window_scoped=dag_config.get('window_scoped', True),
+        metrics_sink=metrics_sink
+    )
+
+    # Every loaded table is checked, unless the tables are given.
+    tables = config.get('quality_tables') or [
+        load['target_table'] for _, load in sorted(dimensions.items())
+    ] + [config['redshift']['songplays_table']]
+
+    run_quality_checks = DataQualityOperator(
+        task_id='Run_data_quality_checks',
+        dag=dag,
+        redshift_conn_id=redshift_conn_id,
+        tables=tuple(tables),
+        checks=config.get('quality_checks'),
+        approximate=dag_config.get('approximate_quality_checks', False),
+        metrics_sink=metrics_sink
+    )
+
+    end_operator = DummyOperator(
+        task_id='Stop_execution',
+        dag=dag
+    )
+
+    staging_operators >> load_songplays_table
+    load_songplays_table >> load_dimension_tables
+    load_dimension_tables >> run_quality_checks
+
+    tail = run_quality_checks
+
+    # The aggregate tables are refreshed from the plays of the run once they
+    # pass the checks, each one in a task of its own.
+    aggregates = get_aggregates(config)
+    if aggregates:
+        aggregate_operators = [
+            LoadAggregateOperator(
+                task_id='Load_{}_aggregate'.format(name),
+                dag=dag,
+                redshift_conn_id=redshift_conn_id,
+                aggregate=aggregate,
+                source_table=config['redshift']['songplays_table'],
+                ledger_table=config['redshift'].get('aggregate_runs_table', 'aggregate_runs'),
+                metrics_sink=metrics_sink
+            )
+            for name, aggregate in sorted(aggregates.items())
+        ]
+        tail >> aggregate_operators
+        tail = aggregate_operators
+
+    # The loaded tables can be vacuumed and analyzed once they pass the
+    # checks, as far as their health requires it.
+    maintenance = dag_config.get('maintenance')
+    if maintenance:
+        table_maintenance = TableMaintenanceOperator(
+            task_id='Run_table_maintenance',
+            dag=dag,
+            redshift_conn_id=redshift_conn_id,
+            tables=tuple(tables) + tuple(aggregate['target_table'] for _, aggregate in sorted(aggregates.items())),
+            metrics_sink=metrics_sink,
+            **(maintenance if isinstance(maintenance, dict) else {})
+        )
+        tail >> table_maintenance
+        tail = table_maintenance
+
+    # The staging tables of the run are dropped once it succeeds. Those of
+    # a failed run are kept, so its retries can resume from them.
+    if staging_mode == 'run':
+        drop_staging_tables = DropStagingTablesOperator(
+            task_id='Drop_staging_tables',
+            dag=dag,
+            redshift_conn_id=redshift_conn_id,
+            staging_tasks=staging_tasks,
+            metrics_sink=metrics_sink
+        )
+        tail >> drop_staging_tables
+        tail = drop_staging_tables
+
+    tail >> end_operator
+
+    return dag
+
+
+# ---- #
+# DAGs #
+# ---- #
 
-load_song_dimension_table >> run_quality_checks
-load_user_dimension_table >> run_quality_checks
-load_artist_dimension_table >> run_quality_checks
-load_time_dimension_table >> run_quality_checks
+# Every tenant gets its own DAG, whose configuration overrides the base one.
+# Without tenants, there is a single DAG.
+tenants = config.get('tenants')
 
-run_quality_checks >> end_operator
+if tenants:
+    for tenant, overrides in sorted(tenants.items()):
+        dag_id = 'sparkify_{}'.format(tenant)
+        globals()[dag_id] = build_dag(dag_id, merge_config(config, overrides))
+else:
+    dag = build_dag('sparkify', config)
@@ -11,11 +11,18 @@ class UdacityPlugin(AirflowPlugin):
 
     operators = [
         operators.StageToRedshiftOperator,
+        operators.ConvertToParquetOperator,
+        operators.CompactLogsOperator,
         operators.LoadFactOperator,
+        operators.LoadAggregateOperator,
         operators.LoadDimensionOperator,
-        operators.DataQualityOperator
+        operators.LoadDimensionsOperator,
+        operators.DataQualityOperator,
+        operators.DropStagingTablesOperator,
+        operators.TableMaintenanceOperator
     ]
 
     helpers = [
-        helpers.SqlQueries
+        helpers.SqlQueries,
+        helpers.RedshiftSession
     ]
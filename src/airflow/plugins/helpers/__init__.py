@@ -1,3 +1,7 @@
 from helpers.sql_queries import SqlQueries
+from helpers.redshift_session import RedshiftSession
 
-__all__ = ['SqlQueries']
+__all__ = [
+    'SqlQueries',
+    'RedshiftSession'
+]
@@ -0,0 +1,247 @@
+from datetime import timedelta
+
+
+# The functions a measure accepts, with the expression that merges the value
+# of a bucket with the value computed from the new rows. Distinct counts are
+# not listed, since they cannot be merged.
+MERGE_EXPRESSIONS = {
+    'count': '{target} + {delta}',
+    'sum': '{target} + {delta}',
+    'min': 'LEAST({target}, {delta})',
+    'max': 'GREATEST({target}, {delta})'
+}
+
+# The units of the time buckets, along with their length.
+TIME_BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1)
+}
+
+# The name of the column that holds the start of the time bucket.
+BUCKET_COLUMN = 'bucket_start'
+
+# The rollups of songplays the analysts query the most: the plays of every
+# user by day, the plays of every song by hour, and the sessions of every
+# user, whose length is session_end - session_start.
+DEFAULT_AGGREGATES = {
+    'user_daily_plays': {
+        'target_table': 'user_daily_plays',
+        'time_bucket': 'day',
+        'group_by': ['userid'],
+        'measures': {
+            'plays': ['count', '*'],
+            'paid_plays': ['sum', 'CASE WHEN level = \'paid\' THEN 1 ELSE 0 END']
+        }
+    },
+    'song_hourly_plays': {
+        'target_table': 'song_hourly_plays',
+        'time_bucket': 'hour',
+        'group_by': ['songid'],
+        'measures': {
+            'plays': ['count', '*']
+        }
+    },
+    'user_sessions': {
+        'target_table': 'user_sessions',
+        'group_by': ['userid', 'sessionid'],
+        'measures': {
+            'session_start': ['min', 'start_time'],
+            'session_end': ['max', 'start_time'],
+            'plays': ['count', '*']
+        }
+    }
+}
+
+
+def validate_aggregate(spec):
+
+    """
+    Validates the spec of an aggregate, as described in compile_aggregate.
+
+    Parameters:
+        spec (dict): The spec of the aggregate.
+
+    Raises:
+        ValueError: if the spec is not valid.
+    """
+
+    if not isinstance(spec, dict):
+        raise ValueError('The aggregate spec must be a dict.')
+
+    if not isinstance(spec.get('target_table'), str) or spec['target_table'].strip() == '':
+        raise ValueError('The target table of the aggregate cannot be null or empty.')
+
+    if spec.get('time_bucket') is not None and spec['time_bucket'] not in TIME_BUCKETS:
+        message = 'Available values for the time bucket: {}'
+        raise ValueError(message.format(', '.join(sorted(TIME_BUCKETS))))
+
+    group_by = spec.get('group_by') or []
+    if spec.get('time_bucket') is None and len(group_by) == 0:
+        raise ValueError('The aggregate needs a time bucket or some group by columns.')
+
+    measures = spec.get('measures')
+    if not isinstance(measures, dict) or len(measures) == 0:
+        raise ValueError('The measures of the aggregate cannot be null or empty.')
+
+    for name, measure in measures.items():
+        if name in group_by or name == BUCKET_COLUMN:
+            raise ValueError('The measure {} has the name of a key of the aggregate.'.format(name))
+        if len(measure) != 2 or measure[0] not in MERGE_EXPRESSIONS:
+            message = 'The measure {} must be a function and an expression. Available functions: {}'
+            raise ValueError(message.format(name, ', '.join(sorted(MERGE_EXPRESSIONS))))
+
+
+def bucket_range(spec, start, end):
+
+    """
+    Gets the range of time buckets that overlap a time interval.
+
+    Parameters:
+        spec (dict): The spec of the aggregate.
+        start (datetime): The start (included) of the interval.
+        end (datetime): The end (excluded) of the interval.
+
+    Returns:
+        (tuple): The start of the first bucket (included) and the end of the
+            last one (excluded), or None when the aggregate has no time
+            bucket.
+    """
+
+    unit = spec.get('time_bucket')
+    if unit is None:
+        return None
+
+    def truncate(value):
+        value = value.replace(minute=0, second=0, microsecond=0)
+        return value.replace(hour=0) if unit == 'day' else value
+
+    return truncate(start), truncate(end - timedelta(microseconds=1)) + TIME_BUCKETS[unit]
+
+
+def aggregate_keys(spec):
+
+    """
+    Gets the key columns of an aggregate: the start of the time bucket, if
+    any, followed by the group by columns.
+
+    Parameters:
+        spec (dict): The spec of the aggregate.
+
+    Returns:
+        (list): The names of the key columns.
+    """
+
+    keys = [BUCKET_COLUMN] if spec.get('time_bucket') is not None else []
+    return keys + list(spec.get('group_by') or [])
+
+
+def compile_aggregate(spec, source_table, time_column, start, end, delta_table=None):
+
+    """
+    Compiles the query that computes an aggregate from the rows of a source
+    table, either those of a time interval or, when a delta table is given,
+    those whose group by columns match one of its rows.
+
+    The spec is a dict that accepts the following keys:
+
+        target_table (str): The name of the aggregate table.
+        time_bucket (str): Either 'hour' or 'day', the unit of the time
+            buckets the rows are grouped into, by the time column. The start
+            of the bucket is stored in the column 'bucket_start'. Optional.
+        group_by (iterable): The columns the rows are grouped by. The rows
+            with a null value in any of them are left out. Optional, as long
+            as there is a time bucket.
+        measures (dict): The function ('count', 'sum', 'min' or 'max') and
+            the expression ('*' or any SQL expression of the source columns)
+            of every measure, as a list, by column name. Those are the
+            functions whose value can be merged with a later one.
+        where (str): A SQL condition the rows must meet. Optional.
+
+    Parameters:
+        spec (dict): The spec of the aggregate.
+        source_table (str): The name of the source table.
+        time_column (str): The timestamp column of the source table.
+        start (datetime): The start (included) of the interval.
+        end (datetime): The end (excluded) of the interval.
+        delta_table (str): The name of a table with the group by columns,
+            whose groups are computed over the whole source table instead of
+            the interval.
+
+    Returns:
+        (tuple): The query, and the names of the columns it computes, in
+            order.
+    """
+
+    columns = []
+    expressions = []
+
+    if spec.get('time_bucket') is not None:
+        columns.append(BUCKET_COLUMN)
+        expressions.append('DATE_TRUNC(\'{}\', src.{})'.format(spec['time_bucket'], time_column))
+
+    filters = []
+    for column in spec.get('group_by') or []:
+        columns.append(column)
+        expressions.append('src.{}'.format(column))
+        filters.append('src.{} IS NOT NULL'.format(column))
+
+    for name, (function, expression) in sorted(spec['measures'].items()):
+        columns.append(name)
+        aggregate = '{}({})'.format(function.upper(), expression)
+        expressions.append('COALESCE({}, 0)'.format(aggregate) if function == 'sum' else aggregate)
+
+    if delta_table is None:
+        filters.append('src.{column} >= \'{start}\' AND src.{column} < \'{end}\''.format(
+            column=time_column,
+            start=start.strftime('%Y-%m-%d %H:%M:%S'),
+            end=end.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+    else:
+        filters.append('EXISTS (SELECT 1 FROM {} AS delta WHERE {})'.format(
+            delta_table,
+            ' AND '.join('delta.{0} = src.{0}'.format(column) for column in spec['group_by'])
+        ))
+
+    if spec.get('where'):
+        filters.append('({})'.format(spec['where']))
+
+    key_count = len(aggregate_keys(spec))
+    query = """
+        SELECT {expressions}
+          FROM {source_table} AS src
+         WHERE {filters}
+         GROUP BY {positions}
+    """.format(
+        expressions=',\n               '.join(
+            '{} AS {}'.format(expression, column) for expression, column in zip(expressions, columns)
+        ),
+        source_table=source_table,
+        filters='\n           AND '.join(filters),
+        positions=', '.join(str(i + 1) for i in range(key_count))
+    )
+
+    return query, columns
+
+
+def merge_expressions(spec, target_alias, delta_alias):
+
+    """
+    Gets the assignments that merge the measures of the new rows into the
+    existing buckets of an aggregate.
+
+    Parameters:
+        spec (dict): The spec of the aggregate.
+        target_alias (str): The alias of the aggregate table.
+        delta_alias (str): The alias of the table with the new rows.
+
+    Returns:
+        (list): The SET assignment of every measure.
+    """
+
+    return [
+        '{} = {}'.format(name, MERGE_EXPRESSIONS[function].format(
+            target='{}.{}'.format(target_alias, name),
+            delta='{}.{}'.format(delta_alias, name)
+        ))
+        for name, (function, _) in sorted(spec['measures'].items())
+    ]
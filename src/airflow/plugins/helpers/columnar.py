@@ -0,0 +1,173 @@
+import io
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+# pyarrow is only needed to write Parquet files.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+JSONPATH_PATTERN = re.compile(r'^\$(?:\[\'([^\']+)\'\]|\.(\w+))$')
+
+# The query that gets the columns of a table, in order.
+TABLE_COLUMNS_QUERY = """
+    SELECT column_name, data_type, character_maximum_length, numeric_precision, numeric_scale
+      FROM information_schema.columns
+     WHERE table_schema = %s
+       AND table_name = %s
+     ORDER BY ordinal_position
+"""
+
+
+def json_path_attributes(paths):
+
+    """
+    Gets the attributes read by the expressions of a JSONPaths file. Only
+    the top level attributes are supported, like "$['artist']" or "$.ts".
+
+    Parameters:
+        paths (list): The JSONPath expressions.
+
+    Returns:
+        (list): The attribute names.
+
+    Raises:
+        ValueError: if any expression is not supported.
+    """
+
+    attributes = []
+    for path in paths:
+        match = JSONPATH_PATTERN.match(path)
+        if match is None:
+            raise ValueError('Unsupported JSONPath expression: {}'.format(path))
+        attributes.append(match.group(1) or match.group(2))
+
+    return attributes
+
+
+def arrow_type(data_type, precision=None, scale=None):
+
+    """
+    Gets the Arrow type that Redshift loads into a given column type.
+
+    Parameters:
+        data_type (str): The column type, as named by information_schema.
+        precision (int): The precision of numeric columns.
+        scale (int): The scale of numeric columns.
+
+    Returns:
+        (DataType): The Arrow type.
+    """
+
+    if data_type in ('smallint', 'int2'):
+        return pyarrow.int16()
+    if data_type in ('integer', 'int', 'int4'):
+        return pyarrow.int32()
+    if data_type in ('bigint', 'int8'):
+        return pyarrow.int64()
+    if data_type in ('numeric', 'decimal'):
+        return pyarrow.decimal128(precision or 18, scale or 0)
+    if data_type in ('real', 'float4'):
+        return pyarrow.float32()
+    if data_type in ('double precision', 'float8', 'float'):
+        return pyarrow.float64()
+    if data_type in ('boolean', 'bool'):
+        return pyarrow.bool_()
+    if data_type.startswith('timestamp'):
+        return pyarrow.timestamp('us')
+    return pyarrow.string()
+
+
+def convert_value(value, data_type, max_length=None, scale=None):
+
+    """
+    Converts a JSON value the way the staging COPY queries do: blank
+    strings are null, strings are truncated to the column length and
+    timestamps are given in epoch milliseconds.
+
+    Parameters:
+        value (object): The JSON value.
+        data_type (str): The column type, as named by information_schema.
+        max_length (int): The length of character columns.
+        scale (int): The scale of numeric columns.
+
+    Returns:
+        (object): The converted value, or None when it cannot be converted.
+    """
+
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+
+    try:
+        if data_type in ('smallint', 'int2', 'integer', 'int', 'int4', 'bigint', 'int8'):
+            return int(value)
+        if data_type in ('numeric', 'decimal'):
+            return Decimal(str(value)).quantize(Decimal(1).scaleb(-(scale or 0)))
+        if data_type in ('real', 'float4', 'double precision', 'float8', 'float'):
+            return float(value)
+        if data_type in ('boolean', 'bool'):
+            return value if isinstance(value, bool) else str(value).lower() in ('true', 't', '1')
+        if data_type.startswith('timestamp'):
+            return datetime(1970, 1, 1) + timedelta(milliseconds=int(value))
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+    value = value if isinstance(value, str) else str(value)
+    return value[:max_length] if max_length is not None else value
+
+
+def build_table(documents, columns, attributes):
+
+    """
+    Builds an Arrow table out of JSON documents, with the columns of a
+    Redshift table, in the same order.
+
+    Parameters:
+        documents (iterable): The JSON documents.
+        columns (list): The columns of the table, as returned by the query
+            TABLE_COLUMNS_QUERY.
+        attributes (list): The JSON attribute read by every column, or None
+            to match them by name, regardless of the case.
+
+    Returns:
+        (Table): The Arrow table.
+    """
+
+    if attributes is None:
+        attributes = [column[0] for column in columns]
+        documents = ({key.lower(): value for key, value in document.items()} for document in documents)
+
+    values = [[] for _ in columns]
+    for document in documents:
+        for i, (attribute, column) in enumerate(zip(attributes, columns)):
+            values[i].append(convert_value(document.get(attribute), column[1], column[2], column[4]))
+
+    return pyarrow.Table.from_arrays(
+        [
+            pyarrow.array(column_values, type=arrow_type(column[1], column[3], column[4]))
+            for column_values, column in zip(values, columns)
+        ],
+        names=[column[0] for column in columns]
+    )
+
+
+def write_parquet(table, compression='snappy'):
+
+    """
+    Writes an Arrow table as a Parquet file.
+
+    Parameters:
+        table (Table): The Arrow table.
+        compression (str): The compression codec: 'snappy' or 'gzip'.
+
+    Returns:
+        (bytes): The content of the Parquet file.
+    """
+
+    output = io.BytesIO()
+    pyarrow.parquet.write_table(table, output, compression=compression)
+    return output.getvalue()
@@ -0,0 +1,229 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+from helpers.columnar import convert_value
+
+
+# The range of the integer column types.
+INTEGER_RANGES = {
+    'smallint': (-2 ** 15, 2 ** 15 - 1),
+    'integer': (-2 ** 31, 2 ** 31 - 1),
+    'bigint': (-2 ** 63, 2 ** 63 - 1)
+}
+
+
+def validate_document(document, columns, attributes=None):
+
+    """
+    Validates a JSON document against the columns of a staging table, the
+    same way the staging COPY query would load it: blank values are null,
+    strings are truncated and unknown attributes are ignored.
+
+    Parameters:
+        document (object): The JSON document.
+        columns (list): The columns of the table, as returned by the query
+            TABLE_COLUMNS_QUERY.
+        attributes (list): The JSON attribute read by every column, or None
+            to match them by name, regardless of the case.
+
+    Returns:
+        (str): The reason the document is invalid, or None when it is valid.
+    """
+
+    if not isinstance(document, dict):
+        return 'The record is not a JSON object.'
+
+    if attributes is None:
+        attributes = [column[0] for column in columns]
+        document = {key.lower(): value for key, value in document.items()}
+
+    for attribute, (name, data_type, max_length, _, scale) in zip(attributes, columns):
+
+        value = document.get(attribute)
+        if value is None or (isinstance(value, str) and value.strip() == ''):
+            continue
+
+        if isinstance(value, (dict, list)):
+            return 'The column {} cannot hold a nested value.'.format(name)
+
+        if data_type in INTEGER_RANGES and isinstance(value, float) and not value.is_integer():
+            return 'The column {} cannot hold the value {!r}.'.format(name, value)
+
+        converted = convert_value(value, data_type, max_length, scale)
+        if converted is None:
+            return 'The column {} cannot hold the value {!r}.'.format(name, value)
+
+        if data_type in INTEGER_RANGES:
+            low, high = INTEGER_RANGES[data_type]
+            if not low <= converted <= high:
+                return 'The value {!r} is out of the range of the column {}.'.format(value, name)
+
+    return None
+
+
+def validate_lines(content, columns, attributes=None):
+
+    """
+    Validates the records of a file of JSON lines.
+
+    Parameters:
+        content (str): The content of the file.
+        columns (list): The columns of the staging table.
+        attributes (list): The JSON attribute read by every column, or None
+            to match them by name.
+
+    Returns:
+        (generator): A tuple for every non empty line: its number, the line
+            itself and the reason it is invalid, or None when it is valid.
+    """
+
+    for number, line in enumerate(content.splitlines(), 1):
+
+        line = line.strip()
+        if line == '':
+            continue
+
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            yield number, line, 'Malformed JSON: {}'.format(e)
+            continue
+
+        yield number, line, validate_document(document, columns, attributes)
+
+
+def bounded_map(executor, function, items, window):
+
+    """
+    Maps a function over the given items through an executor, keeping at
+    most a window of them in flight, so the results of a long list never
+    pile up in memory. The results come in the order of the items.
+
+    Parameters:
+        executor (Executor): A concurrent.futures executor.
+        function (callable): The function, which takes an item.
+        items (iterable): The items.
+        window (int): The maximum number of items in flight.
+
+    Returns:
+        (generator): The results.
+    """
+
+    pending = deque()
+
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+class CompactedWriter:
+
+    """
+    Writes lines into gzip compressed files of a target size. The files are
+    built in a temporary directory and handed over, one at a time, as soon
+    as they reach the target size, so the memory used does not depend on
+    the amount of data. Used as a context manager, it hands over the last
+    file on success, and removes the temporary files whatever happens.
+    """
+
+    def __init__(self, target_size, publish):
+
+        """
+        Initializes a new instance of the class CompactedWriter.
+
+        Parameters:
+            target_size (int): The compressed size, in bytes, at which a
+                file is closed and a new one is started.
+            publish (callable): Called with the path and the number of
+                every finished file. The file is removed afterwards.
+        """
+
+        self._target_size = target_size
+        self._publish = publish
+        self._directory = tempfile.mkdtemp()
+        self._raw = None
+        self._file = None
+        self._path = None
+        self.files = 0
+        self.lines = 0
+
+    def write(self, line):
+
+        """
+        Writes a line, starting a new file when the current one is full.
+
+        Parameters:
+            line (str): The line, without line break.
+        """
+
+        if self._file is None:
+            self._path = os.path.join(self._directory, 'part-{:05d}.json.gz'.format(self.files))
+            self._raw = open(self._path, 'wb')
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb')
+
+        self._file.write(line.encode('utf-8'))
+        self._file.write(b'\n')
+        self.lines += 1
+
+        # The compressed size is known up to the buffer of the compressor.
+        if self._raw.tell() >= self._target_size:
+            self.flush()
+
+    def flush(self):
+
+        """
+        Closes the current file, if any, and hands it over.
+        """
+
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._raw.close()
+        self._file = None
+
+        try:
+            self._publish(self._path, self.files)
+        finally:
+            os.remove(self._path)
+
+        self.files += 1
+
+    def close(self):
+
+        """
+        Hands over the last file and removes the temporary directory.
+        """
+
+        self.flush()
+        os.rmdir(self._directory)
+
+    def discard(self):
+
+        """
+        Drops the current file, if any, without handing it over, and removes
+        the temporary directory.
+        """
+
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = None
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.close()
+        finally:
+            self.discard()
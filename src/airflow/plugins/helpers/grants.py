@@ -0,0 +1,105 @@
+import re
+
+
+# The privileges of an ACL item that can be granted on a table, by the
+# letter that stands for them.
+TABLE_PRIVILEGES = (
+    ('r', 'SELECT'),
+    ('a', 'INSERT'),
+    ('w', 'UPDATE'),
+    ('d', 'DELETE'),
+    ('x', 'REFERENCES')
+)
+
+# The names that can be used as identifiers without quotes.
+PLAIN_IDENTIFIER = re.compile(r'^[a-z_][a-z0-9_$]*$')
+
+
+def quote_identifier(name):
+
+    """
+    Quotes a user or group name, unless it is a plain lowercase identifier.
+
+    Parameters:
+        name (str): The name.
+
+    Returns:
+        (str): The name as written in a SQL statement.
+    """
+
+    if PLAIN_IDENTIFIER.match(name):
+        return name
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def unquote(name):
+
+    """
+    Removes the quotes of a name of an ACL item, if any.
+
+    Parameters:
+        name (str): The name, as written in the ACL.
+
+    Returns:
+        (str): The name.
+    """
+
+    if len(name) > 1 and name.startswith('"') and name.endswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name
+
+
+def parse_acl(acl):
+
+    """
+    Parses the ACL of a table, as returned by array_to_string(relacl, '|'),
+    e.g. 'sparkify=arwdRxt/sparkify|group analysts=r/sparkify|=r/sparkify'.
+
+    Parameters:
+        acl (str): The ACL of the table. Null when it has the default one.
+
+    Returns:
+        (list): The grantee and the privileges of every ACL item. The grantee
+            is 'PUBLIC', 'GROUP <name>' or a user name, quoted when needed,
+            and the privileges are SQL keywords. Grant options are not kept.
+    """
+
+    items = []
+    for item in (acl or '').split('|'):
+        if '=' not in item:
+            continue
+        grantee, _, rest = item.rpartition('=')
+        letters = rest.partition('/')[0]
+        privileges = [privilege for letter, privilege in TABLE_PRIVILEGES if letter in letters]
+        if not privileges:
+            continue
+        if grantee == '':
+            grantee = 'PUBLIC'
+        elif grantee.startswith('group '):
+            grantee = 'GROUP {}'.format(quote_identifier(unquote(grantee[len('group '):])))
+        else:
+            grantee = quote_identifier(unquote(grantee))
+        items.append((grantee, privileges))
+    return items
+
+
+def grant_statements(table, acl, owner):
+
+    """
+    Builds the GRANT statements that give another table the privileges of
+    a table, except those of its owner, which come with the ownership.
+
+    Parameters:
+        table (str): The name of the table to grant the privileges on.
+        acl (str): The ACL of the original table, as taken by parse_acl.
+        owner (str): The name of the owner of the original table.
+
+    Returns:
+        (list): The GRANT statements.
+    """
+
+    return [
+        'GRANT {} ON {} TO {};'.format(', '.join(privileges), table, grantee)
+        for grantee, privileges in parse_acl(acl)
+        if grantee != quote_identifier(owner)
+    ]
@@ -0,0 +1,302 @@
+import functools
+import itertools
+import json
+import re
+import socket
+import time
+from urllib.parse import urlparse
+
+
+# The length statements are cut to in the reports.
+STATEMENT_LENGTH = 200
+
+# The numbers of the labels of the statements, unique to the process.
+STATEMENT_NUMBERS = itertools.count()
+
+# The label a statement starts with, in a comment, so its Redshift query
+# identifier can be looked up afterwards.
+LABEL_PATTERN = re.compile(r'^/\* ([0-9a-f]+\.[0-9]+) \*/')
+
+
+class InstrumentedCursor:
+
+    """
+    Wraps a DB-API cursor to record the duration and the rows affected of
+    every statement it runs. Everything else is delegated to the wrapped
+    cursor.
+
+    Given a label, every statement starts with a comment holding the label
+    and a number, which report_statements looks for in the Redshift system
+    tables. This way the query identifiers are only read once, when the
+    statements are reported, instead of after each one of them.
+    """
+
+    def __init__(self, cursor, statements, label=None):
+
+        """
+        Initializes a new instance of the class InstrumentedCursor.
+
+        Parameters:
+            cursor (cursor): The wrapped cursor.
+            statements (list): The list the records are appended to.
+            label (str): The label of the statements, as hexadecimal
+                digits. The statements are not labelled when null.
+        """
+
+        self._cursor = cursor
+        self._statements = statements
+        self._label = label
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, vars=None):
+
+        """
+        Runs a statement and records it.
+
+        Parameters:
+            query (str): The statement.
+            vars (tuple): The optional parameters of the statement.
+        """
+
+        label = None
+        if self._label is not None:
+            label = '{}.{}'.format(self._label, next(STATEMENT_NUMBERS))
+            comment = '/* {} */ '.format(label)
+            query = comment.encode('utf-8') + query if isinstance(query, bytes) else comment + query
+
+        start = time.time()
+        try:
+            return self._cursor.execute(query, vars)
+        finally:
+            duration = time.time() - start
+            text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else query
+            if label is not None:
+                text = text[len(comment):]
+            self._statements.append({
+                'statement': ' '.join(text.split())[:STATEMENT_LENGTH],
+                'duration': round(duration, 3),
+                'rows': self._cursor.rowcount,
+                'label': label,
+                'query_id': None,
+                'bytes_scanned': None
+            })
+
+
+class StatsdSink:
+
+    """
+    Sends the metrics to a StatsD daemon, over UDP.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='sparkify'):
+
+        """
+        Initializes a new instance of the class StatsdSink.
+
+        Parameters:
+            host (str): The host of the daemon.
+            port (int): The port of the daemon.
+            prefix (str): The prefix of the metric names.
+        """
+
+        self._address = (host, port)
+        self._prefix = prefix
+
+    def emit(self, run, statements):
+
+        """
+        Sends the metrics of a task run.
+
+        Parameters:
+            run (dict): The DAG, task and execution date of the run.
+            statements (list): The recorded statements.
+        """
+
+        name = '{}.{}.{}'.format(self._prefix, run['dag_id'], run['task_id'])
+
+        lines = ['{}.statements:{}|c'.format(name, len(statements))]
+        for statement in statements:
+            lines.append('{}.statement_duration:{}|ms'.format(name, int(statement['duration'] * 1000)))
+            if statement['rows'] is not None and statement['rows'] >= 0:
+                lines.append('{}.rows:{}|c'.format(name, statement['rows']))
+            if statement['bytes_scanned'] is not None:
+                lines.append('{}.bytes_scanned:{}|c'.format(name, statement['bytes_scanned']))
+        lines.append('{}.duration:{}|ms'.format(name, int(sum(s['duration'] for s in statements) * 1000)))
+
+        # StatsD is best effort: a metric lost never fails the task.
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for line in lines:
+                udp.sendto(line.encode('utf-8'), self._address)
+        except OSError:
+            pass
+        finally:
+            udp.close()
+
+
+class FileSink:
+
+    """
+    Appends the metrics to a local file, one JSON document per statement.
+    """
+
+    def __init__(self, path):
+
+        """
+        Initializes a new instance of the class FileSink.
+
+        Parameters:
+            path (str): The path of the file.
+        """
+
+        self._path = path
+
+    def emit(self, run, statements):
+
+        """
+        Writes the metrics of a task run.
+
+        Parameters:
+            run (dict): The DAG, task and execution date of the run.
+            statements (list): The recorded statements.
+        """
+
+        with open(self._path, 'a') as f:
+            for statement in statements:
+                record = dict(run)
+                record.update(statement)
+                f.write(json.dumps(record, default=str))
+                f.write('\n')
+
+
+def get_sink(url):
+
+    """
+    Builds the metrics sink of a given URL: either 'statsd://host:port/prefix'
+    or 'file:///path/to/metrics.jsonl'.
+
+    Parameters:
+        url (str): The URL of the sink.
+
+    Returns:
+        (object): The metrics sink, or None when the URL is null.
+
+    Raises:
+        ValueError: if the scheme of the URL is not supported.
+    """
+
+    if url is None:
+        return None
+
+    parsed = urlparse(url)
+
+    if parsed.scheme == 'statsd':
+        return StatsdSink(
+            parsed.hostname or 'localhost',
+            parsed.port or 8125,
+            parsed.path.strip('/') or 'sparkify'
+        )
+
+    if parsed.scheme == 'file':
+        return FileSink(parsed.path)
+
+    raise ValueError('Available schemes for the metrics sink: statsd, file')
+
+
+def report_statements(operator, context, session, sink_url=None):
+
+    """
+    Reports the statements run by a task: the query identifier and the bytes
+    scanned of each one are read from the Redshift system tables in a single
+    query, and the records are pushed to XCom (key 'statements', along with
+    the total duration under the key 'statements_duration') and emitted to
+    the metrics sink, if any.
+
+    Parameters:
+        operator (BaseOperator): The operator of the task.
+        context (dict): Contains info related to the task instance.
+        session (RedshiftSession): The session that ran the statements.
+        sink_url (str): The URL of the metrics sink, as taken by get_sink.
+    """
+
+    statements = list(session.statements)
+
+    if len(statements) == 0:
+        return
+
+    # The labelled statements are looked up in a single query. Those that
+    # are not found, like the DDL statements, have no identifier.
+    labels = {s['label'].split('.')[0] for s in statements if s.get('label') is not None}
+    if labels:
+        try:
+            records = session.get_records("""
+                SELECT q.query, TRIM(SUBSTRING(q.querytxt, 1, 64)), SUM(s.bytes)
+                  FROM stl_query AS q
+                  LEFT JOIN svl_query_summary AS s
+                    ON s.query = q.query
+                   AND s.label LIKE 'scan%%'
+                 WHERE {}
+                 GROUP BY 1, 2
+            """.format(' OR '.join(['q.querytxt LIKE %s'] * len(labels))), tuple(
+                '/* {}.%'.format(label) for label in sorted(labels)
+            ))
+            found = {}
+            for query_id, text, total in records:
+                match = LABEL_PATTERN.match(text)
+                if match is not None:
+                    found[match.group(1)] = (query_id, None if total is None else int(total))
+            for statement in statements:
+                if statement.get('label') in found:
+                    statement['query_id'], statement['bytes_scanned'] = found[statement['label']]
+        except Exception as e:
+            operator.log.warning('The query identifiers could not be read: {}'.format(e))
+
+    duration = sum(s['duration'] for s in statements)
+    message = '{} statements run in {:.3f} seconds. The slowest one took {:.3f} seconds: {}'
+    slowest = max(statements, key=lambda s: s['duration'])
+    operator.log.info(message.format(len(statements), duration, slowest['duration'], slowest['statement']))
+
+    operator.xcom_push(context, 'statements', statements)
+    operator.xcom_push(context, 'statements_duration', round(duration, 3))
+
+    sink = get_sink(sink_url)
+    if sink is not None:
+        sink.emit({
+            'dag_id': operator.dag_id,
+            'task_id': operator.task_id,
+            'execution_date': context['execution_date']
+        }, statements)
+
+
+def reports_failures(execute):
+
+    """
+    Decorates the method execute of an operator, so the statements run by a
+    task are reported even when it fails: Airflow only calls post_execute
+    once execute succeeds.
+
+    Parameters:
+        execute (function): The method execute of the operator.
+
+    Returns:
+        (function): The decorated method.
+    """
+
+    @functools.wraps(execute)
+    def wrapper(operator, context):
+        try:
+            return execute(operator, context)
+        except Exception:
+            # A failure to report never hides the one of the task.
+            try:
+                operator.post_execute(context)
+            except Exception as e:
+                operator.log.warning('The statements of the failed task could not be reported: {}'.format(e))
+            raise
+
+    return wrapper
@@ -0,0 +1,78 @@
+from datetime import datetime
+from psycopg2.extras import execute_values
+
+
+def loaded_objects(cursor, ledger_table, target_table, prefixes):
+
+    """
+    Gets the objects already loaded into a target table, as recorded in the
+    ledger table.
+
+    Parameters:
+        cursor (cursor): A DB-API cursor.
+        ledger_table (str): The name of the ledger table.
+        target_table (str): The name of the table the objects were loaded to.
+        prefixes (iterable): The key prefixes the lookup is restricted to.
+
+    Returns:
+        (set): A (key, etag) tuple for every loaded object.
+    """
+
+    query = """
+        SELECT s3_key, etag
+          FROM {}
+         WHERE target_table = %s
+           AND s3_key LIKE %s
+    """.format(ledger_table)
+
+    loaded = set()
+    for prefix in prefixes:
+        cursor.execute(query, (target_table, prefix.replace('%', '\\%').replace('_', '\\_') + '%'))
+        loaded.update((key, etag) for key, etag in cursor.fetchall())
+
+    return loaded
+
+
+def new_objects(objects, loaded):
+
+    """
+    Filters out the objects that were already loaded. An object whose ETag
+    has changed since it was loaded is considered new.
+
+    Parameters:
+        objects (iterable): The objects, as returned by list_objects.
+        loaded (set): The (key, etag) tuples returned by loaded_objects.
+
+    Returns:
+        (list): The objects that were not loaded yet.
+    """
+
+    return [obj for obj in objects if (obj['key'], obj['etag']) not in loaded]
+
+
+def record_objects(cursor, ledger_table, target_table, objects):
+
+    """
+    Records the given objects in the ledger table. It must be called within
+    the same transaction as the COPY query that loads them.
+
+    Parameters:
+        cursor (cursor): A DB-API cursor.
+        ledger_table (str): The name of the ledger table.
+        target_table (str): The name of the table the objects were loaded to.
+        objects (iterable): The objects, as returned by list_objects.
+    """
+
+    query = """
+        INSERT INTO {} (target_table, s3_key, etag, size, loaded_at)
+        VALUES %s
+    """.format(ledger_table)
+
+    loaded_at = datetime.utcnow()
+
+    # A single multi-row INSERT per page, since Redshift is really slow
+    # with row by row inserts.
+    execute_values(cursor, query, [
+        (target_table, obj['key'], obj['etag'], obj['size'], loaded_at)
+        for obj in objects
+    ], page_size=1000)
@@ -0,0 +1,170 @@
+import gzip
+import json
+
+
+# The number of load errors read at once after a COPY query.
+LOAD_ERRORS_PAGE_SIZE = 1000
+
+
+class CopyError(Exception):
+
+    """
+    Raised when a COPY query fails, along with the load errors Redshift
+    recorded for it.
+    """
+
+    def __init__(self, message, errors):
+
+        """
+        Initializes a new instance of the class CopyError.
+
+        Parameters:
+            message (str): The error message.
+            errors (list): The load errors, as returned by get_load_errors.
+        """
+
+        super(CopyError, self).__init__(message)
+        self.errors = errors
+
+
+def copy_marker(cursor):
+
+    """
+    Gets the Redshift session and the last query identifier, right before a
+    COPY query runs. Every load error recorded for that session with a
+    greater query identifier belongs to the COPY query.
+
+    Parameters:
+        cursor (cursor): A DB-API cursor.
+
+    Returns:
+        (tuple): The session (process) identifier and the query identifier.
+    """
+
+    cursor.execute('SELECT pg_backend_pid(), pg_last_query_id();')
+    return cursor.fetchone()
+
+
+def get_load_errors(cursor, session, last_query, page_size=LOAD_ERRORS_PAGE_SIZE):
+
+    """
+    Gets all the load errors recorded in STL_LOAD_ERRORS after a given query
+    of a session, page by page. The system table is not transactional, so
+    the errors of a failed COPY query are there even though its transaction
+    was rolled back.
+
+    Parameters:
+        cursor (cursor): A DB-API cursor.
+        session (int): The session identifier returned by copy_marker.
+        last_query (int): The query identifier returned by copy_marker.
+        page_size (int): The number of errors read at once.
+
+    Returns:
+        (list): A dict for every error, with the file, line, column, type,
+            position, raw value, code and reason.
+    """
+
+    errors = []
+
+    while True:
+        cursor.execute("""
+            SELECT TRIM(filename),
+                   line_number,
+                   TRIM(colname),
+                   TRIM(type),
+                   position,
+                   TRIM(raw_field_value),
+                   err_code,
+                   TRIM(err_reason)
+              FROM stl_load_errors
+             WHERE session = %s
+               AND query > %s
+             ORDER BY query, filename, line_number, colname
+             LIMIT %s
+            OFFSET %s
+        """, (session, last_query, page_size, len(errors)))
+
+        page = cursor.fetchall()
+        errors.extend(
+            {
+                'file': file,
+                'line': line,
+                'column': column,
+                'type': column_type,
+                'position': position,
+                'value': value,
+                'code': code,
+                'reason': reason
+            }
+            for file, line, column, column_type, position, value, code, reason in page
+        )
+
+        if len(page) < page_size:
+            return errors
+
+
+def failing_files(errors):
+
+    """
+    Groups the load errors by file.
+
+    Parameters:
+        errors (list): The load errors, as returned by get_load_errors.
+
+    Returns:
+        (dict): The errors of every file, by S3 URL.
+    """
+
+    files = {}
+    for error in errors:
+        files.setdefault(error['file'], []).append(error)
+    return files
+
+
+def drop_rejected_lines(content, errors, compressed=False):
+
+    """
+    Removes the lines that Redshift rejected from the content of a file.
+
+    Parameters:
+        content (bytes): The content of the file.
+        errors (list): The load errors of the file.
+        compressed (bool): Whether the file is gzip compressed.
+
+    Returns:
+        (tuple): The new content of the file, and a dict for every removed
+            line, with its number, reason and content.
+    """
+
+    if compressed:
+        content = gzip.decompress(content)
+
+    reasons = {error['line']: error['reason'] for error in errors}
+
+    kept = []
+    removed = []
+    for number, line in enumerate(content.decode('utf-8').splitlines(), 1):
+        if number in reasons:
+            removed.append({'line': number, 'error': reasons[number], 'record': line})
+        else:
+            kept.append(line)
+
+    content = ('\n'.join(kept) + '\n' if kept else '').encode('utf-8')
+    return (gzip.compress(content) if compressed else content), removed
+
+
+def build_quarantine(url, removed):
+
+    """
+    Builds the content of a quarantine file, one JSON document per line, in
+    the same layout as the quarantine of the log compaction.
+
+    Parameters:
+        url (str): The S3 URL of the source file.
+        removed (list): The removed lines, as returned by drop_rejected_lines.
+
+    Returns:
+        (str): The content of the quarantine file.
+    """
+
+    return ''.join(json.dumps(dict(key=url, **line)) + '\n' for line in removed)
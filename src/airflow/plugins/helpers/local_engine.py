@@ -0,0 +1,435 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from helpers.columnar import json_path_attributes, pyarrow
+from psycopg2.extensions import cursor as BaseCursor
+from psycopg2.extras import execute_values
+
+
+# The rewrites of the Redshift specific syntax into PostgreSQL, in order.
+REWRITES = (
+
+    # Table attributes and column encodings have no counterpart.
+    (re.compile(r'\s+ENCODE\s+\w+', re.IGNORECASE), ''),
+    (re.compile(r'\s*\bDISTSTYLE\s+\w+', re.IGNORECASE), ''),
+    (re.compile(r'\s*\bDISTKEY\s*\([^)]*\)', re.IGNORECASE), ''),
+    (re.compile(r'\s*\b(COMPOUND\s+|INTERLEAVED\s+)?SORTKEY\s*\([^)]*\)', re.IGNORECASE), ''),
+
+    # PostgreSQL names the day of the week 'dow'.
+    (re.compile(r'\bEXTRACT\s*\(\s*dayofweek\s+FROM', re.IGNORECASE), 'EXTRACT(dow FROM'),
+
+    # Distinct counts are just exact.
+    (re.compile(r'\bAPPROXIMATE\s+COUNT\s*\(', re.IGNORECASE), 'COUNT('),
+
+    # PostgreSQL does not concatenate two non string values.
+    (
+        re.compile(r'\bmd5\((\w+\.\w+)\s*\|\|\s*(\w+\.\w+)\)', re.IGNORECASE),
+        r'md5(CAST(\1 AS varchar) || CAST(\2 AS varchar))'
+    )
+)
+
+# The formats of the staging COPY queries the local engine can read. The
+# CSV and ORC objects are only read by Redshift.
+LOCAL_FORMATS = ('json', 'json_gzip', 'parquet')
+
+COPY_PATTERN = re.compile(r'^\s*COPY\s+(\S+)\s+FROM\s+\'([^\']*)\'', re.IGNORECASE)
+FORMAT_PATTERN = re.compile(r'\b(FORMAT\s+(AS\s+)?)?(CSV|ORC|AVRO)\b', re.IGNORECASE)
+JSON_PATTERN = re.compile(r'\bJSON\s+(AS\s+)?\'([^\']*)\'', re.IGNORECASE)
+TIMEFORMAT_PATTERN = re.compile(r'\bTIMEFORMAT\s+(AS\s+)?\'([^\']*)\'', re.IGNORECASE)
+LAST_COPY_COUNT_PATTERN = re.compile(r'^\s*SELECT\s+pg_last_copy_count\(\)\s*;?\s*$', re.IGNORECASE)
+APPEND_PATTERN = re.compile(r'^\s*ALTER\s+TABLE\s+(\S+)\s+APPEND\s+FROM\s+([^\s;]+)\s*;?\s*$', re.IGNORECASE)
+LAST_QUERY_ID_PATTERN = re.compile(r'^\s*SELECT\s+pg_last_query_id\(\)\s*;?\s*$', re.IGNORECASE)
+
+# The number of rows inserted at once by a COPY query.
+COPY_BATCH_SIZE = 10000
+
+# The number of characters of a source file read at once by a COPY query.
+READ_CHUNK_SIZE = 1024 * 1024
+
+# The number of rows loaded by the last COPY query, by connection.
+_copy_counts = {}
+
+
+def translate_query(query):
+
+    """
+    Translates a Redshift query into PostgreSQL.
+
+    Parameters:
+        query (str): The Redshift query.
+
+    Returns:
+        (str): The PostgreSQL query.
+    """
+
+    for pattern, replacement in REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def resolve_s3_url(data_root, url):
+
+    """
+    Resolves an S3 URL into a path of the local directory that mirrors the
+    buckets, one subdirectory per bucket.
+
+    Parameters:
+        data_root (str): The local directory.
+        url (str): An URL like 's3://bucket/some/key'.
+
+    Returns:
+        (str): The local path.
+    """
+
+    path = url[len('s3://'):] if url.startswith('s3://') else url
+    return os.path.join(data_root, *path.split('/'))
+
+
+def list_local_objects(data_root, bucket, prefix):
+
+    """
+    Lists the local files stored under a given prefix, the same way
+    list_objects does with S3. The ETag is the MD5 of the content, as for
+    the objects uploaded in a single part.
+
+    Parameters:
+        data_root (str): The local directory that mirrors the buckets.
+        bucket (str): The bucket name.
+        prefix (str): The key prefix.
+
+    Returns:
+        (generator): A dict with the key, ETag and size of every file.
+    """
+
+    bucket_root = os.path.join(data_root, bucket)
+
+    for directory, _, names in sorted(os.walk(bucket_root)):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            key = os.path.relpath(path, bucket_root).replace(os.sep, '/')
+            if key.startswith(prefix):
+                with open(path, 'rb') as f:
+                    etag = hashlib.md5(f.read()).hexdigest()
+                yield {
+                    'key': key,
+                    'etag': etag,
+                    'size': os.path.getsize(path)
+                }
+
+
+def write_local_object(data_root, url, content):
+
+    """
+    Writes a local file at the path an S3 URL resolves to.
+
+    Parameters:
+        data_root (str): The local directory that mirrors the buckets.
+        url (str): The S3 URL.
+        content (str|bytes): The content of the file.
+    """
+
+    path = resolve_s3_url(data_root, url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb' if isinstance(content, bytes) else 'w') as f:
+        f.write(content)
+
+
+def parse_json_documents(content):
+
+    """
+    Parses the JSON documents of a file. A file may hold any number of them,
+    one after the other, like the objects copied by Redshift.
+
+    Parameters:
+        content (str): The content of the file.
+
+    Returns:
+        (generator): The documents.
+    """
+
+    decoder = json.JSONDecoder()
+
+    position = 0
+    while True:
+        while position < len(content) and content[position].isspace():
+            position += 1
+        if position == len(content):
+            return
+        document, position = decoder.raw_decode(content, position)
+        yield document
+
+
+def read_json_documents(path, compressed=False, chunk_size=READ_CHUNK_SIZE):
+
+    """
+    Reads the JSON documents of a local file, a chunk at a time, so only the
+    documents being parsed are held in memory, whatever the size of the file.
+
+    Parameters:
+        path (str): The path of the file.
+        compressed (bool): Whether the file is gzip compressed.
+        chunk_size (int): The number of characters read at once.
+
+    Returns:
+        (generator): The documents.
+    """
+
+    decoder = json.JSONDecoder()
+
+    with (gzip.open(path, 'rt') if compressed else open(path)) as f:
+        buffer = ''
+        position = 0
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer) and eof:
+                return
+
+            # A document that reaches the end of the buffer may go on in the
+            # next chunk, so it is only taken once something follows it.
+            try:
+                document, end = decoder.raw_decode(buffer, position)
+                complete = eof or end < len(buffer)
+            except ValueError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                yield document
+                position = end
+                continue
+
+            chunk = f.read(chunk_size)
+            eof = chunk == ''
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def get_source_files(data_root, source, manifest):
+
+    """
+    Gets the local files a COPY query reads.
+
+    Parameters:
+        data_root (str): The local directory that mirrors the buckets.
+        source (str): The S3 prefix or manifest URL of the query.
+        manifest (bool): Whether the source is a manifest.
+
+    Returns:
+        (list): The paths of the files.
+    """
+
+    if manifest:
+        with open(resolve_s3_url(data_root, source)) as f:
+            entries = json.load(f)['entries']
+        return [resolve_s3_url(data_root, entry['url']) for entry in entries]
+
+    path = source[len('s3://'):] if source.startswith('s3://') else source
+    bucket, _, prefix = path.partition('/')
+
+    return [
+        resolve_s3_url(data_root, 's3://{}/{}'.format(bucket, obj['key']))
+        for obj in list_local_objects(data_root, bucket, prefix)
+    ]
+
+
+def get_json_paths(data_root, json_path, columns):
+
+    """
+    Gets the JSON attribute read by every column of a COPY query.
+
+    Parameters:
+        data_root (str): The local directory that mirrors the buckets.
+        json_path (str): Either 'auto' or the URL of a JSONPaths file.
+        columns (list): The column names of the target table.
+
+    Returns:
+        (list): The attribute names, in the order of the columns.
+    """
+
+    if json_path.lower() == 'auto':
+        return columns
+
+    with open(resolve_s3_url(data_root, json_path)) as f:
+        paths = json.load(f)['jsonpaths']
+
+    return json_path_attributes(paths)
+
+
+def copy_files(cursor, data_root, query):
+
+    """
+    Runs a COPY query against the local files that mirror the buckets. Only
+    the JSON and Parquet formats are supported, along with the TIMEFORMAT,
+    MANIFEST, GZIP, TRUNCATECOLUMNS, BLANKSASNULL and EMPTYASNULL options.
+    Credentials and any other option are ignored.
+
+    Parameters:
+        cursor (cursor): A psycopg2 cursor.
+        data_root (str): The local directory that mirrors the buckets.
+        query (str): The COPY query.
+
+    Returns:
+        (int): The number of rows loaded.
+    """
+
+    copy_match = COPY_PATTERN.match(query)
+    table, source = copy_match.groups()
+    upper_query = query.upper()
+
+    if 'FORMAT AS PARQUET' in ' '.join(upper_query.split()):
+        return copy_parquet_files(cursor, data_root, table, source, 'MANIFEST' in upper_query)
+
+    # The options follow the source, whose URL may hold any word.
+    format_match = FORMAT_PATTERN.search(query, copy_match.end())
+    if format_match is not None:
+        message = 'The {} format is not supported by the local engine, only JSON and Parquet are.'
+        raise ValueError(message.format(format_match.group(3).upper()))
+
+    json_match = JSON_PATTERN.search(query)
+    if json_match is None:
+        raise ValueError('Only the JSON and Parquet formats are supported by the local engine.')
+
+    timeformat_match = TIMEFORMAT_PATTERN.search(query)
+    epoch_millis = timeformat_match is not None and timeformat_match.group(2).lower() == 'epochmillisecs'
+    truncate_columns = 'TRUNCATECOLUMNS' in upper_query
+    blanks_as_null = 'BLANKSASNULL' in upper_query
+    empty_as_null = 'EMPTYASNULL' in upper_query
+    compressed = re.search(r'\bGZIP\b', upper_query) is not None
+
+    # The columns of the target table, in order.
+    schema, _, name = table.rpartition('.')
+    BaseCursor.execute(cursor, """
+        SELECT column_name, data_type, character_maximum_length
+          FROM information_schema.columns
+         WHERE table_schema = %s
+           AND table_name = %s
+         ORDER BY ordinal_position
+    """, (schema or 'public', name.strip('"')))
+    columns = cursor.fetchall()
+
+    attributes = get_json_paths(data_root, json_match.group(2), [c[0] for c in columns])
+
+    def convert(value, data_type, max_length):
+        if isinstance(value, str):
+            if (blanks_as_null and value.strip() == '' and value != '') or (empty_as_null and value == ''):
+                return None
+            if truncate_columns and max_length is not None:
+                return value[:max_length]
+        if epoch_millis and data_type.startswith('timestamp') and isinstance(value, (int, float)):
+            return datetime(1970, 1, 1) + timedelta(milliseconds=value)
+        return value
+
+    query = 'INSERT INTO {} ({}) VALUES %s'.format(
+        table,
+        ', '.join('"{}"'.format(c[0]) for c in columns[:len(attributes)])
+    )
+
+    # The files are read a chunk at a time and the rows are inserted in
+    # batches, so large files are never held in memory at once.
+    count = 0
+    rows = []
+    for path in get_source_files(data_root, source, 'MANIFEST' in upper_query):
+        for document in read_json_documents(path, compressed):
+            if json_match.group(2).lower() == 'auto':
+                document = {key.lower(): value for key, value in document.items()}
+            rows.append(tuple(
+                convert(document.get(attribute), data_type, max_length)
+                for attribute, (_, data_type, max_length) in zip(attributes, columns)
+            ))
+            if len(rows) == COPY_BATCH_SIZE:
+                execute_values(cursor, query, rows, page_size=1000)
+                count += len(rows)
+                rows = []
+
+    if rows:
+        execute_values(cursor, query, rows, page_size=1000)
+        count += len(rows)
+
+    return count
+
+
+def copy_parquet_files(cursor, data_root, table, source, manifest):
+
+    """
+    Loads the local Parquet files of a COPY query. Their columns are loaded
+    by position, like Redshift does.
+
+    Parameters:
+        cursor (cursor): A psycopg2 cursor.
+        data_root (str): The local directory that mirrors the buckets.
+        table (str): The target table.
+        source (str): The S3 prefix or manifest URL of the query.
+        manifest (bool): Whether the source is a manifest.
+
+    Returns:
+        (int): The number of rows loaded.
+    """
+
+    if pyarrow is None:
+        raise ImportError('The package pyarrow is needed to read Parquet files.')
+
+    count = 0
+    for path in get_source_files(data_root, source, manifest):
+        parquet = pyarrow.parquet.read_table(path)
+        rows = list(zip(*[column.to_pylist() for column in parquet.columns]))
+        if rows:
+            execute_values(cursor, 'INSERT INTO {} VALUES %s'.format(table), rows, page_size=1000)
+            count += len(rows)
+
+    return count
+
+
+def local_cursor_factory(data_root):
+
+    """
+    Builds a psycopg2 cursor class that runs the Redshift queries against
+    PostgreSQL: the queries are translated, and the COPY queries read from
+    the local directory that mirrors the buckets.
+
+    Parameters:
+        data_root (str): The local directory that mirrors the buckets.
+
+    Returns:
+        (type): The cursor class.
+    """
+
+    class LocalCursor(BaseCursor):
+
+        def execute(self, query, vars=None):
+
+            # The queries built by execute_values are already translated.
+            if not isinstance(query, str):
+                return super(LocalCursor, self).execute(query, vars)
+
+            if COPY_PATTERN.match(query):
+                count = copy_files(self, data_root, query)
+                _copy_counts[id(self.connection)] = count
+                return
+
+            if LAST_COPY_COUNT_PATTERN.match(query):
+                return super(LocalCursor, self).execute(
+                    'SELECT %s;',
+                    (_copy_counts.get(id(self.connection), 0),)
+                )
+
+            # The blocks of a table cannot be moved, so its rows are.
+            append_match = APPEND_PATTERN.match(query)
+            if append_match is not None:
+                target, source = append_match.groups()
+                return super(LocalCursor, self).execute(
+                    'INSERT INTO {0} SELECT * FROM {1}; TRUNCATE TABLE {1};'.format(target, source)
+                )
+
+            # There are no query identifiers.
+            if LAST_QUERY_ID_PATTERN.match(query):
+                return super(LocalCursor, self).execute('SELECT CAST(NULL AS int4);')
+
+            return super(LocalCursor, self).execute(translate_query(query), vars)
+
+    return LocalCursor
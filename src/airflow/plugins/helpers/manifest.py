@@ -0,0 +1,154 @@
+import json
+from datetime import datetime, timedelta
+
+
+def split_s3_url(url):
+
+    """
+    Splits an S3 URL into its bucket and key parts.
+
+    Parameters:
+        url (str): An URL like 's3://bucket/some/key'.
+
+    Returns:
+        (tuple): The bucket name and the key (without leading slash).
+    """
+
+    path = url[len('s3://'):] if url.startswith('s3://') else url
+    bucket, _, key = path.partition('/')
+    return bucket, key
+
+
+def join_s3_url(prefix, key):
+
+    """
+    Joins an S3 prefix and a key with exactly one slash between them.
+
+    Parameters:
+        prefix (str): The S3 prefix, like 's3://bucket/log-data'.
+        key (str): The key relative to the prefix.
+
+    Returns:
+        (str): The resulting S3 URL.
+    """
+
+    return '{}/{}'.format(prefix.rstrip('/'), key.lstrip('/'))
+
+
+def render_key(pattern, context):
+
+    """
+    Renders a key pattern using the values of the task context. The pattern
+    follows the str.format syntax, so format specs are allowed, e.g.
+    'log-data/{execution_date:%Y/%m}/{ds}-events.json'.
+
+    Parameters:
+        pattern (str): The key pattern.
+        context (dict): Contains info related to the task instance.
+
+    Returns:
+        (str): The rendered key.
+    """
+
+    return pattern.format(**context)
+
+
+def parse_date(value):
+
+    """
+    Parses a date given either as a datetime or as a 'YYYY-MM-DD' string.
+
+    Parameters:
+        value (datetime|str): The date to parse.
+
+    Returns:
+        (datetime): The parsed date.
+    """
+
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def window_contexts(context, start_date, end_date, interval=timedelta(days=1)):
+
+    """
+    Builds a copy of the task context for every step of a date window, so
+    a key pattern can be rendered once per step. Both ends are included.
+
+    Parameters:
+        context (dict): Contains info related to the task instance.
+        start_date (datetime|str): The first date of the window.
+        end_date (datetime|str): The last date of the window.
+        interval (timedelta): The distance between two steps.
+
+    Returns:
+        (generator): The context of every step of the window.
+    """
+
+    current = parse_date(start_date)
+    end_date = parse_date(end_date)
+
+    while current <= end_date:
+        step_context = dict(context)
+        step_context.update({
+            'execution_date': current,
+            'ds': current.strftime('%Y-%m-%d'),
+            'ds_nodash': current.strftime('%Y%m%d'),
+            'ts': current.isoformat(),
+            'ts_nodash': current.strftime('%Y%m%dT%H%M%S')
+        })
+        yield step_context
+        current += interval
+
+
+def list_objects(client, bucket, prefix):
+
+    """
+    Lists the objects stored under a given prefix.
+
+    Parameters:
+        client (S3.Client): A boto3 S3 client.
+        bucket (str): The bucket name.
+        prefix (str): The key prefix.
+
+    Returns:
+        (generator): A dict with the key, ETag and size of every object.
+    """
+
+    paginator = client.get_paginator('list_objects_v2')
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get('Contents', []):
+            yield {
+                'key': item['Key'],
+                'etag': item['ETag'].strip('"'),
+                'size': item['Size']
+            }
+
+
+def build_manifest(bucket, objects):
+
+    """
+    Builds the content of a Redshift COPY manifest.
+
+    Parameters:
+        bucket (str): The bucket where the objects are stored.
+        objects (iterable): The objects, as returned by list_objects. An
+            object with the keys 'url' and 'content_length' is read from
+            that URL instead, e.g. a fixed copy of a source object.
+
+    Returns:
+        (str): The manifest as a JSON document.
+    """
+
+    return json.dumps({
+        'entries': [
+            {
+                'url': obj.get('url') or 's3://{}/{}'.format(bucket, obj['key']),
+                'mandatory': True,
+                'meta': {'content_length': obj.get('content_length', obj['size'])}
+            }
+            for obj in objects
+        ]
+    }, indent=2)
@@ -0,0 +1,170 @@
+import os
+from airflow.hooks.S3_hook import S3Hook
+from helpers.local_engine import (
+    list_local_objects,
+    resolve_s3_url,
+    write_local_object
+)
+from helpers.manifest import list_objects, split_s3_url
+
+
+class ObjectStore:
+
+    """
+    Reads and writes the objects of S3, or of the local directory that
+    mirrors the buckets when the Redshift connection targets the local
+    engine.
+    """
+
+    def __init__(self, aws_conn_id='aws_default', data_root=None):
+
+        """
+        Initializes a new instance of the class ObjectStore.
+
+        Parameters:
+            aws_conn_id (str): The AWS connection identifier.
+            data_root (str): The local directory that mirrors the buckets,
+                or None to use S3.
+        """
+
+        self._aws_conn_id = aws_conn_id
+        self._data_root = data_root
+
+    def read(self, bucket, key):
+
+        """
+        Reads the content of an object, as text.
+
+        Parameters:
+            bucket (str): The bucket name.
+            key (str): The key of the object.
+
+        Returns:
+            (str): The content of the object.
+        """
+
+        if self._data_root is not None:
+            with open(resolve_s3_url(self._data_root, 's3://{}/{}'.format(bucket, key))) as f:
+                return f.read()
+
+        return S3Hook(aws_conn_id=self._aws_conn_id).read_key(key, bucket_name=bucket)
+
+    def read_bytes(self, bucket, key):
+
+        """
+        Reads the content of an object, as is.
+
+        Parameters:
+            bucket (str): The bucket name.
+            key (str): The key of the object.
+
+        Returns:
+            (bytes): The content of the object.
+        """
+
+        if self._data_root is not None:
+            with open(resolve_s3_url(self._data_root, 's3://{}/{}'.format(bucket, key)), 'rb') as f:
+                return f.read()
+
+        return S3Hook(aws_conn_id=self._aws_conn_id).get_key(key, bucket_name=bucket).get()['Body'].read()
+
+    def write(self, url, content):
+
+        """
+        Writes the content of an object.
+
+        Parameters:
+            url (str): The S3 URL of the object.
+            content (str|bytes): The content of the object.
+        """
+
+        if self._data_root is not None:
+            write_local_object(self._data_root, url, content)
+            return
+
+        bucket, key = split_s3_url(url)
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        S3Hook(aws_conn_id=self._aws_conn_id).get_conn().put_object(Bucket=bucket, Key=key, Body=body)
+
+    def upload(self, url, path):
+
+        """
+        Uploads a local file as an object, without reading it into memory.
+
+        Parameters:
+            url (str): The S3 URL of the object.
+            path (str): The path of the local file.
+        """
+
+        if self._data_root is not None:
+            target = resolve_s3_url(self._data_root, url)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(path, 'rb') as source, open(target, 'wb') as f:
+                while True:
+                    chunk = source.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            return
+
+        bucket, key = split_s3_url(url)
+        S3Hook(aws_conn_id=self._aws_conn_id).get_conn().upload_file(path, bucket, key)
+
+    def list_objects(self, url):
+
+        """
+        Lists the objects stored under a given prefix.
+
+        Parameters:
+            url (str): The S3 prefix.
+
+        Returns:
+            (list): A dict with the key, ETag and size of every object.
+        """
+
+        bucket, prefix = split_s3_url(url)
+
+        if self._data_root is not None:
+            return list(list_local_objects(self._data_root, bucket, prefix))
+
+        client = S3Hook(aws_conn_id=self._aws_conn_id).get_conn()
+        return list(list_objects(client, bucket, prefix))
+
+    def list_keys(self, url):
+
+        """
+        Lists the keys stored under a given prefix.
+
+        Parameters:
+            url (str): The S3 prefix.
+
+        Returns:
+            (list): The keys.
+        """
+
+        return [obj['key'] for obj in self.list_objects(url)]
+
+    def delete_prefix(self, url):
+
+        """
+        Deletes the objects stored under a given prefix.
+
+        Parameters:
+            url (str): The S3 prefix.
+        """
+
+        bucket, _ = split_s3_url(url)
+        keys = self.list_keys(url)
+
+        if self._data_root is not None:
+            for key in keys:
+                os.remove(resolve_s3_url(self._data_root, 's3://{}/{}'.format(bucket, key)))
+            return
+
+        # S3 deletes up to 1000 objects per request.
+        client = S3Hook(aws_conn_id=self._aws_conn_id).get_conn()
+        for i in range(0, len(keys), 1000):
+            client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]]}
+            )
@@ -0,0 +1,238 @@
+from datetime import timedelta
+
+
+def compile_checks(table, spec, approximate=False, window=None, sample_rate=None, tolerance=0.02):
+
+    """
+    Compiles every check of a table into a single aggregate query, so the
+    whole suite of the table costs one scan.
+
+    In approximate mode, the uniqueness check relies on APPROXIMATE COUNT
+    (DISTINCT), and the scan can be restricted to a window of the table, or
+    to its latest part as a sample. Both are ranges of literal values, so
+    when the window column is the sort key of the table, the blocks out of
+    range are skipped by their zone maps. The rate checks then accept the
+    given error tolerance on top of their thresholds. Note that the row count
+    check counts the scanned records only.
+
+    The spec is a dict that accepts the following keys, all of them optional:
+
+        min_rows (int): The minimum number of records.
+        max_rows (int): The maximum number of records.
+        null_rates (dict): The maximum rate of null values, from 0 to 1, by
+            column name.
+        unique (iterable): The columns that, together, must be unique.
+        references (dict): The table and column referenced by a column, as
+            a tuple, by column name. The non null values of the column must
+            exist in the referenced one.
+        freshness (tuple): A column name and the maximum age of its newest
+            value, as a timedelta or a number of seconds, compared with the
+            end of the run interval.
+        window (str): A timestamp column used in approximate mode to restrict
+            the scan to the run interval. It is read by DataQualityOperator.
+
+    Parameters:
+        table (str): The name of the table to check.
+        spec (dict): The checks of the table.
+        approximate (bool): Whether the approximate mode is enabled.
+        window (tuple): In approximate mode, an optional column name, along
+            with the start (included) and end (excluded) of the range of
+            values scanned, as datetimes.
+        sample_rate (float): In approximate mode, the optional rate of the
+            window scanned, from 0 to 1, the latest part of it. It is ignored
+            when there is no window.
+        tolerance (float): In approximate mode, the error tolerance of the
+            rate checks.
+
+    Returns:
+        (tuple): The query, and the list of checks it computes. Each check is
+            a dict with its kind, its name, the columns of the query it reads
+            and its threshold.
+    """
+
+    expressions = ['COUNT(*)']
+    joins = []
+    filters = []
+    checks = []
+
+    tolerance = tolerance if approximate else 0
+
+    if approximate and window is not None:
+        column, start, end = window
+        if sample_rate is not None:
+            start = end - (end - start) * float(sample_rate)
+        filters.append('src.{column} >= \'{start}\' AND src.{column} < \'{end}\''.format(
+            column=column,
+            start=start.strftime('%Y-%m-%d %H:%M:%S'),
+            end=end.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+
+    def add_expression(expression):
+        expressions.append(expression)
+        return len(expressions) - 1
+
+    if spec.get('min_rows') is not None or spec.get('max_rows') is not None:
+        checks.append({
+            'kind': 'row_count',
+            'check': 'row_count',
+            'columns': (0,),
+            'threshold': (spec.get('min_rows'), spec.get('max_rows'))
+        })
+
+    for column, max_rate in sorted(spec.get('null_rates', {}).items()):
+        checks.append({
+            'kind': 'null_rate',
+            'check': 'null_rate:{}'.format(column),
+            'columns': (0, add_expression('SUM(CASE WHEN src.{} IS NULL THEN 1 ELSE 0 END)'.format(column))),
+            'threshold': max_rate,
+            'tolerance': tolerance
+        })
+
+    if spec.get('unique'):
+        columns = tuple(spec['unique'])
+        key = key_expression(columns)
+        if approximate:
+            checks.append({
+                'kind': 'approximate_unique',
+                'check': 'unique:{}'.format(','.join(columns)),
+                'columns': (0, add_expression('APPROXIMATE COUNT(DISTINCT {})'.format(key))),
+                'threshold': 0,
+                'tolerance': tolerance
+            })
+        else:
+            checks.append({
+                'kind': 'unique',
+                'check': 'unique:{}'.format(','.join(columns)),
+                'columns': (0, add_expression('COUNT(DISTINCT {})'.format(key))),
+                'threshold': 0
+            })
+
+    for i, (column, reference) in enumerate(sorted(spec.get('references', {}).items())):
+        ref_table, ref_column = reference[0], reference[1]
+        max_rate = reference[2] if len(reference) > 2 else 0
+        alias = 'ref_{}'.format(i)
+        joins.append(
+            'LEFT JOIN (SELECT DISTINCT {ref_column} AS ref_key FROM {ref_table}) AS {alias}\n'
+            '            ON src.{column} = {alias}.ref_key'.format(
+                ref_column=ref_column,
+                ref_table=ref_table,
+                alias=alias,
+                column=column
+            )
+        )
+        checks.append({
+            'kind': 'references',
+            'check': 'references:{}->{}.{}'.format(column, ref_table, ref_column),
+            'columns': (0, add_expression(
+                'SUM(CASE WHEN src.{} IS NOT NULL AND {}.ref_key IS NULL THEN 1 ELSE 0 END)'.format(column, alias)
+            )),
+            'threshold': max_rate,
+            'tolerance': tolerance
+        })
+
+    if spec.get('freshness'):
+        column, max_age = spec['freshness']
+        if isinstance(max_age, timedelta):
+            max_age = max_age.total_seconds()
+        checks.append({
+            'kind': 'freshness',
+            'check': 'freshness:{}'.format(column),
+            'columns': (add_expression('MAX(src.{})'.format(column)),),
+            'threshold': max_age
+        })
+
+    query = 'SELECT {}\n          FROM {} AS src{}{}'.format(
+        ',\n               '.join(expressions),
+        table,
+        ''.join('\n     ' + join for join in joins),
+        '\n         WHERE ' + '\n           AND '.join(filters) if filters else ''
+    )
+
+    return query, checks
+
+
+def key_expression(columns):
+
+    """
+    Gets an expression that turns the values of some columns into a single
+    string, distinct for every distinct tuple of values. Every value is
+    prefixed by its length, so neither a separator within a value nor a null
+    value, which stands for '-', can make two tuples collide.
+
+    Parameters:
+        columns (iterable): The column names.
+
+    Returns:
+        (str): The SQL expression.
+    """
+
+    value = 'CAST(src.{} AS varchar)'
+
+    return ' || \'|\' || '.join(
+        'COALESCE(CAST(LENGTH({0}) AS varchar) || \':\' || {0}, \'-\')'.format(value.format(column))
+        for column in columns
+    )
+
+
+def evaluate_checks(table, checks, row, context=None):
+
+    """
+    Evaluates the checks of a table against the row returned by its query.
+
+    Parameters:
+        table (str): The name of the checked table.
+        checks (list): The checks, as returned by compile_checks.
+        row (tuple): The result of the compiled query.
+        context (dict): Contains info related to the task instance. It is
+            needed by the freshness check.
+
+    Returns:
+        (list): A dict with the table, check, value, threshold and outcome
+            of every check.
+    """
+
+    results = []
+
+    for check in checks:
+
+        kind = check['kind']
+        threshold = check['threshold']
+        values = [row[c] for c in check['columns']]
+
+        if kind == 'row_count':
+            value = values[0]
+            passed = (threshold[0] is None or value >= threshold[0]) \
+                and (threshold[1] is None or value <= threshold[1])
+
+        elif kind in ('null_rate', 'references'):
+            total, failing = values[0], values[1] or 0
+            value = float(failing) / total if total else 0.0
+            passed = value <= threshold + check['tolerance']
+
+        elif kind == 'unique':
+            total, distinct = values
+            value = total - distinct
+            passed = value <= threshold
+
+        elif kind == 'approximate_unique':
+            total, distinct = values
+            value = float(total - distinct) / total if total else 0.0
+            passed = value <= threshold + check['tolerance']
+
+        else:
+            newest = values[0]
+            reference = context['next_execution_date'] if context else None
+            value = None if newest is None or reference is None \
+                else (reference.replace(tzinfo=None) - newest).total_seconds()
+            passed = value is not None and value <= threshold
+
+        results.append({
+            'table': table,
+            'check': check['check'],
+            'value': value,
+            'threshold': threshold,
+            'passed': bool(passed)
+        })
+
+    return results
+
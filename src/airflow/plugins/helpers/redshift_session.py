@@ -0,0 +1,377 @@
+import os
+import threading
+import uuid
+from airflow.hooks.postgres_hook import PostgresHook
+from contextlib import contextmanager
+from helpers.instrumentation import InstrumentedCursor
+from helpers.local_engine import local_cursor_factory
+from psycopg2.extensions import connection as BaseConnection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+
+class SessionConnection(BaseConnection):
+
+    """
+    A psycopg2 connection that remembers the statement timeout set on it, in
+    milliseconds, so it is only set again when it changes.
+    """
+
+    statement_timeout = 0
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+
+    """
+    A thread safe connection pool that waits for a connection to be given
+    back when all of them are in use, instead of failing at once.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+
+        """
+        Initializes a new instance of the class BlockingConnectionPool.
+
+        Parameters:
+            minconn (int): The number of connections opened up front.
+            maxconn (int): The maximum number of connections.
+            wait_timeout (int): The maximum number of seconds to wait for a
+                connection, after which PoolError is raised.
+        """
+
+        self.wait_timeout = kwargs.pop('wait_timeout')
+        self._available = threading.BoundedSemaphore(maxconn)
+        super(BlockingConnectionPool, self).__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+
+        """
+        Borrows a connection, waiting for one to be given back if needed.
+
+        Parameters:
+            key (object): The optional key the connection is assigned to.
+
+        Returns:
+            (connection): A psycopg2 connection.
+
+        Raises:
+            PoolError: if no connection is given back in time.
+        """
+
+        if not self._available.acquire(timeout=self.wait_timeout):
+            message = 'None of the {} connections of the pool was given back within {} seconds.'
+            raise PoolError(message.format(self.maxconn, self.wait_timeout))
+        try:
+            return super(BlockingConnectionPool, self).getconn(key)
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+
+        """
+        Gives a connection back, so a waiting thread can borrow it.
+
+        Parameters:
+            conn (connection): The psycopg2 connection.
+            key (object): The optional key the connection is assigned to.
+            close (bool): Whether the connection is closed instead of kept.
+        """
+
+        try:
+            super(BlockingConnectionPool, self).putconn(conn, key, close)
+        finally:
+            self._available.release()
+
+
+class RedshiftSession:
+
+    """
+    Gives access to a Redshift cluster through a pool of keep-alive
+    connections, shared by every session of the same worker process for a
+    given connection identifier. Setting up a connection against a remote
+    cluster takes hundreds of milliseconds, so reusing them pays off as soon
+    as a task runs more than one statement, or several tasks share a worker.
+
+    A connection whose extra field holds {"engine": "local", "data_root":
+    "/some/dir"} targets a local PostgreSQL database instead. The queries
+    are translated on the fly, and the COPY queries read the files of the
+    given directory, which mirrors the S3 buckets (one subdirectory per
+    bucket). This way the whole DAG can run offline against sample data.
+    """
+
+    # The pools of the current process, by process, connection identifier
+    # and size, and the Airflow connections they were built from.
+    _pools = {}
+    _connections = {}
+    _pools_lock = threading.Lock()
+
+    # The number of seconds a session waits for a connection of its pool
+    # when all of them are in use.
+    pool_wait_timeout = 300
+
+    def __init__(self, redshift_conn_id, statement_timeout=None, max_connections=8):
+
+        """
+        Initializes a new instance of the class RedshiftSession.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            max_connections (int): The maximum number of connections of the
+                pool. The sessions that ask for another size get a pool of
+                their own.
+        """
+
+        self._redshift_conn_id = redshift_conn_id
+        self._statement_timeout = statement_timeout
+        self._max_connections = max_connections
+        self._statements = []
+        self._label = uuid.uuid4().hex[:16]
+
+    def get_connection(self):
+
+        """
+        Gets the Airflow connection of the session, reading it from the
+        metadata database only the first time in the current process.
+
+        Returns:
+            (Connection): The Airflow connection.
+        """
+
+        key = (os.getpid(), self._redshift_conn_id)
+
+        with self._pools_lock:
+            if key not in self._connections:
+                self._connections[key] = PostgresHook.get_connection(self._redshift_conn_id)
+
+        return self._connections[key]
+
+    def get_pool(self):
+
+        """
+        Gets the connection pool of the current process, creating it the
+        first time. The pools are keyed by process too, since a connection
+        cannot be shared across a fork.
+
+        Returns:
+            (BlockingConnectionPool): The connection pool.
+        """
+
+        key = (os.getpid(), self._redshift_conn_id, self._max_connections)
+        conn = self.get_connection()
+
+        with self._pools_lock:
+            if key not in self._pools:
+                data_root = self.get_data_root(conn)
+                options = {} if data_root is None else {'cursor_factory': local_cursor_factory(data_root)}
+                self._pools[key] = BlockingConnectionPool(
+                    1,
+                    self._max_connections,
+                    wait_timeout=self.pool_wait_timeout,
+                    connection_factory=SessionConnection,
+                    host=conn.host,
+                    port=conn.port or (5439 if data_root is None else 5432),
+                    dbname=conn.schema,
+                    user=conn.login,
+                    password=conn.password,
+                    connect_timeout=30,
+                    keepalives=1,
+                    keepalives_idle=60,
+                    keepalives_interval=10,
+                    keepalives_count=5,
+                    **options
+                )
+
+        return self._pools[key]
+
+    @staticmethod
+    def get_data_root(conn):
+
+        """
+        Gets the local directory read by the COPY queries when a connection
+        targets the local engine.
+
+        Parameters:
+            conn (Connection): The Airflow connection.
+
+        Returns:
+            (str): The local directory, or None when the connection targets
+                a Redshift cluster.
+        """
+
+        extra = conn.extra_dejson
+        if extra.get('engine') != 'local':
+            return None
+        return extra.get('data_root', os.getcwd())
+
+    @property
+    def statements(self):
+
+        """
+        Gets the statements run by the session so far, with their duration,
+        rows affected and label.
+
+        Returns:
+            (list): A dict for every statement.
+        """
+
+        return self._statements
+
+    @property
+    def label(self):
+
+        """
+        Gets the label the statements of the session start with, so their
+        query identifiers can be looked up when they are reported. The
+        statements run by the local engine are not labelled.
+
+        Returns:
+            (str): The label, or None when the session targets the local
+                engine.
+        """
+
+        return self._label if self.data_root is None else None
+
+    @property
+    def data_root(self):
+
+        """
+        Gets the local directory that mirrors the S3 buckets, when the
+        session targets the local engine.
+
+        Returns:
+            (str): The local directory, or None when the session targets a
+                Redshift cluster.
+        """
+
+        return self.get_data_root(self.get_connection())
+
+    @contextmanager
+    def connection(self):
+
+        """
+        Borrows a connection from the pool, and gives it back when done. A
+        broken connection is discarded instead. When all the connections are
+        in use, it waits for one to be given back.
+
+        Yields:
+            (SessionConnection): A psycopg2 connection.
+
+        Raises:
+            PoolError: if no connection is given back in time.
+        """
+
+        pool = self.get_pool()
+        conn = pool.getconn()
+
+        # The pool may hand out a connection closed by the server.
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+
+        try:
+            self.set_statement_timeout(conn)
+            yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def set_statement_timeout(self, conn, statement_timeout=None):
+
+        """
+        Sets the statement timeout of the session on a given connection, if
+        it is not set already.
+
+        Parameters:
+            conn (SessionConnection): A psycopg2 connection.
+            statement_timeout (float): A number of seconds that replaces the
+                timeout of the session, if given.
+        """
+
+        if statement_timeout is None:
+            statement_timeout = self._statement_timeout
+        timeout = int(statement_timeout * 1000) if statement_timeout else 0
+
+        if conn.statement_timeout != timeout:
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute('SET statement_timeout TO {};'.format(timeout))
+            conn.autocommit = autocommit
+            conn.statement_timeout = timeout
+
+    @contextmanager
+    def transaction(self):
+
+        """
+        Runs a block in a single transaction, committed when the block ends
+        or rolled back if it raises.
+
+        Yields:
+            (cursor): A cursor of the transaction.
+        """
+
+        with self.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cursor:
+                    yield InstrumentedCursor(cursor, self._statements, self.label)
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+
+    def run(self, query, autocommit=False, statement_timeout=None):
+
+        """
+        Runs a statement, in its own transaction or in autocommit mode. The
+        latter is needed by those statements that cannot run within a
+        transaction block, like VACUUM.
+
+        Parameters:
+            query (str): The statement.
+            autocommit (bool): Whether the statement runs in autocommit mode.
+            statement_timeout (float): The maximum number of seconds this
+                statement can run, in place of the timeout of the session.
+                Only used in autocommit mode.
+
+        Returns:
+            (int): The number of rows affected by the statement.
+        """
+
+        if not autocommit:
+            with self.transaction() as cursor:
+                cursor.execute(query)
+                return cursor.rowcount
+
+        # The timeout of the session is set back the next time the
+        # connection is borrowed.
+        with self.connection() as conn:
+            self.set_statement_timeout(conn, statement_timeout)
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    cursor = InstrumentedCursor(cursor, self._statements, self.label)
+                    cursor.execute(query)
+                    return cursor.rowcount
+            finally:
+                if not conn.closed:
+                    conn.autocommit = False
+
+    def get_records(self, query, parameters=None):
+
+        """
+        Runs a query and fetches all its records.
+
+        Parameters:
+            query (str): The query.
+            parameters (tuple): The optional parameters of the query.
+
+        Returns:
+            (list): The records.
+        """
+
+        with self.transaction() as cursor:
+            cursor.execute(query, parameters)
+            return cursor.fetchall()
@@ -1,17 +1,89 @@
 class SqlQueries:
 
+    # The default name of the staging tables, by the name of the placeholder
+    # used by the queries below.
+    staging_tables = {
+        'staging_events': 'staging_events',
+        'staging_songs': 'staging_songs'
+    }
+
+    # The default name of the table that matches the staged events with
+    # their songs, by a hash of the normalized title, artist and duration.
+    song_lookup_table = 'song_lookup'
+
     staging_table_copy = """
                    COPY {}
                    FROM '{}'
             CREDENTIALS 'aws_iam_role={}'
+{}
+    """
+
+    staging_table_manifest_copy = """
+                   COPY {}
+                   FROM '{}'
+            CREDENTIALS 'aws_iam_role={}'
+               MANIFEST
+{}
+    """
+
+    # The options of the staging COPY queries, by source format. The
+    # columnar formats accept no conversion options: their columns are
+    # loaded by position, already typed.
+    staging_table_copy_formats = {
+        'json': """
+          TIMEFORMAT AS 'epochmillisecs'
+                   JSON '{json_path}'
+        TRUNCATECOLUMNS
+           BLANKSASNULL
+            EMPTYASNULL
+         COMPUPDATE OFF""",
+        'json_gzip': """
+          TIMEFORMAT AS 'epochmillisecs'
+                   JSON '{json_path}'
+                   GZIP
+        TRUNCATECOLUMNS
+           BLANKSASNULL
+            EMPTYASNULL
+         COMPUPDATE OFF""",
+        'csv': """
           TIMEFORMAT AS 'epochmillisecs'
-                   JSON '{}'
+                    CSV
+                   GZIP
         TRUNCATECOLUMNS
            BLANKSASNULL
             EMPTYASNULL
-         COMPUPDATE OFF
+         COMPUPDATE OFF""",
+        'parquet': """
+              FORMAT AS PARQUET""",
+        'orc': """
+              FORMAT AS ORC"""
+    }
+
+    # The statements that prepare the staging table of a run, either the
+    # shared one or one of its own, with the same columns and keys.
+    staging_table_truncate = """
+        TRUNCATE TABLE {};
     """
 
+    staging_table_create_like = """
+        CREATE TABLE IF NOT EXISTS {} (LIKE {});
+    """
+
+    staging_table_drop = """
+        DROP TABLE IF EXISTS {};
+    """
+
+    # The option appended to the staging COPY queries that accept some
+    # rejected records.
+    staging_table_copy_max_errors = """
+               MAXERROR {}"""
+
+    # The key that matches an event with its song: a hash of the normalized
+    # title, artist name and rounded duration, given their columns.
+    match_key_expression = """md5(lower(trim({title}))
+                           || '|' || lower(trim({artist}))
+                           || '|' || CAST(ROUND({duration}) AS int8))"""
+
     songplays_table_insert = """
         SELECT md5(events.sessionid || events.start_time) songplay_id,
                events.start_time,
@@ -22,23 +94,295 @@ class SqlQueries:
                events.sessionid,
                events.location,
                events.useragent
-          FROM (SELECT TIMESTAMP 'epoch' + ts/1000 * interval '1 second' AS start_time, *
-                  FROM staging_events
-                 WHERE page='NextSong') events
-     LEFT JOIN staging_songs songs
-            ON events.song = songs.title
-           AND events.artist = songs.artist_name
-           AND events.length = songs.duration
+          FROM (SELECT TIMESTAMP 'epoch' + ts/1000 * interval '1 second' AS start_time,
+                       """ + match_key_expression.format(
+                           title='song',
+                           artist='artist',
+                           duration='length'
+                       ) + """ AS match_key,
+                       *
+                  FROM {staging_events}
+                 WHERE page='NextSong'
+                   AND ts >= {start_ts}
+                   AND ts < {end_ts}) events
+     LEFT JOIN {song_lookup} songs
+            ON events.match_key = songs.match_key
+    """
+
+    songplays_match_count = """
+        SELECT COUNT(*),
+               COUNT(songs.match_key)
+          FROM (SELECT """ + match_key_expression.format(
+                           title='song',
+                           artist='artist',
+                           duration='length'
+                       ) + """ AS match_key
+                  FROM {staging_events}
+                 WHERE page='NextSong'
+                   AND ts >= {start_ts}
+                   AND ts < {end_ts}) events
+     LEFT JOIN {song_lookup} songs
+            ON events.match_key = songs.match_key
+    """
+
+    song_lookup_table_insert = """
+        INSERT INTO {song_lookup} (match_key, song_id, artist_id)
+        SELECT src.match_key,
+               src.song_id,
+               src.artist_id
+          FROM (SELECT """ + match_key_expression.format(
+                           title='title',
+                           artist='artist_name',
+                           duration='duration'
+                       ) + """ AS match_key,
+                       song_id,
+                       artist_id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY lower(trim(title)), lower(trim(artist_name)), ROUND(duration)
+                           ORDER BY song_id
+                       ) AS version
+                  FROM {staging_songs}) AS src
+         WHERE src.version = 1
+           AND src.match_key IS NOT NULL
+           AND NOT EXISTS (SELECT 1
+                             FROM {song_lookup} AS lookup
+                            WHERE lookup.match_key = src.match_key)
+    """
+
+    songplays_table_delete = """
+        DELETE FROM {}
+         WHERE start_time >= TIMESTAMP 'epoch' + {}/1000 * interval '1 second'
+           AND start_time < TIMESTAMP 'epoch' + {}/1000 * interval '1 second'
+    """
+
+    # The ACL and the owner of a table, whose grants the swap gives to the
+    # rebuilt table, and the views bound to it, which stop the swap.
+    table_acl = """
+        SELECT array_to_string(cls.relacl, '|'),
+               pg_get_userbyid(cls.relowner)
+          FROM pg_class AS cls
+          JOIN pg_namespace AS nsp
+            ON nsp.oid = cls.relnamespace
+         WHERE nsp.nspname = %s
+           AND cls.relname = %s
+    """
+
+    table_dependent_views = """
+        SELECT DISTINCT nsp.nspname || '.' || dependent.relname
+          FROM pg_class AS cls
+          JOIN pg_namespace AS cls_nsp
+            ON cls_nsp.oid = cls.relnamespace
+          JOIN pg_depend AS dep
+            ON dep.refobjid = cls.oid
+          JOIN pg_rewrite AS rw
+            ON rw.oid = dep.objid
+          JOIN pg_class AS dependent
+            ON dependent.oid = rw.ev_class
+          JOIN pg_namespace AS nsp
+            ON nsp.oid = dependent.relnamespace
+         WHERE cls_nsp.nspname = %s
+           AND cls.relname = %s
+           AND dependent.oid <> cls.oid
+    """
+
+    # The table a dimension is rebuilt into, with the columns, keys and
+    # default values of the target table.
+    dimension_table_create_like = """
+        CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS);
+    """
+
+    # Swaps a rebuilt table in, keeping the previous version. Both renames
+    # take effect at once, when the transaction commits.
+    dimension_table_swap = """
+        ALTER TABLE {target_table} RENAME TO {old_name};
+        ALTER TABLE {new_table} RENAME TO {name};
+    """
+
+    # The validation of the fact records of a run before they are published:
+    # the number of records, of distinct keys and of records outside the run
+    # interval, when the load is window scoped, and then the number of
+    # records already in the target table.
+    songplays_publish_validation = """
+        SELECT COUNT(*),
+               COUNT(DISTINCT playid),
+               {1}
+          FROM {0}
+    """
+
+    songplays_publish_outside = """
+        COALESCE(SUM(CASE WHEN start_time < TIMESTAMP 'epoch' + {0}/1000 * interval '1 second'
+                            OR start_time >= TIMESTAMP 'epoch' + {1}/1000 * interval '1 second'
+                          THEN 1 ELSE 0 END), 0)
+    """
+
+    songplays_publish_overlap = """
+        SELECT COUNT(*)
+          FROM {0} AS src
+          JOIN {1} AS target
+            ON target.playid = src.playid
+           AND target.start_time = src.start_time
+    """
+
+    # Moves the storage blocks of a table into another one with the same
+    # columns, leaving the former empty.
+    fact_table_append = """
+        ALTER TABLE {} APPEND FROM {};
+    """
+
+    # The number of records of the fact table within the run interval, and
+    # the copy of the records of a run when they replace those.
+    songplays_window_count = """
+        SELECT COUNT(*)
+          FROM {}
+         WHERE start_time >= TIMESTAMP 'epoch' + {}/1000 * interval '1 second'
+           AND start_time < TIMESTAMP 'epoch' + {}/1000 * interval '1 second'
+    """
+
+    fact_table_insert_from = """
+        INSERT INTO {} SELECT * FROM {};
+    """
+
+    # The statements that maintain an aggregate table. It is created empty,
+    # with the columns of its query and sorted by its keys, the first time.
+    aggregate_table_exists = """
+        SELECT COUNT(*)
+          FROM information_schema.tables
+         WHERE table_schema = %s
+           AND table_name = %s
+    """
+
+    aggregate_table_create = """
+        CREATE TABLE {target_table} SORTKEY({keys}) AS SELECT * FROM ({query}) AS src LIMIT 0;
+    """
+
+    aggregate_table_lock = """
+        LOCK TABLE {};
+    """
+
+    aggregate_delta_create = """
+        CREATE TEMP TABLE {} AS {};
+    """
+
+    aggregate_table_merge = """
+        UPDATE {target_table} AS target
+           SET {assignments}
+          FROM {delta_table} AS delta
+         WHERE {conditions}
+    """
+
+    aggregate_table_insert_new = """
+        INSERT INTO {target_table} ({columns})
+        SELECT {delta_columns}
+          FROM {delta_table} AS delta
+          LEFT JOIN {target_table} AS target
+            ON {conditions}
+         WHERE target.{key} IS NULL
+    """
+
+    aggregate_table_delete_buckets = """
+        DELETE FROM {} WHERE bucket_start >= '{}' AND bucket_start < '{}'
+    """
+
+    aggregate_table_delete_groups = """
+        DELETE FROM {target_table} USING {delta_table} AS delta WHERE {conditions}
+    """
+
+    # The ledger of the run intervals merged into every aggregate table.
+    aggregate_run_lookup = """
+        SELECT COUNT(*) FROM {} WHERE target_table = %s AND window_start = %s
+    """
+
+    aggregate_run_insert = """
+        INSERT INTO {} (target_table, window_start, window_end, loaded_at) VALUES (%s, %s, %s, %s)
+    """
+
+    aggregate_run_update = """
+        UPDATE {} SET loaded_at = %s WHERE target_table = %s AND window_start = %s
+    """
+
+    # The health of some tables: the percent of unsorted rows, the staleness
+    # of the statistics, and the number of rows with and without those
+    # marked for deletion. The empty tables are not listed.
+    table_health = """
+        SELECT "schema", "table", unsorted, stats_off, tbl_rows, estimated_visible_rows
+          FROM svv_table_info
+         WHERE "table" IN %s
+    """
+
+    # The maintenance statements, which cannot run within a transaction.
+    table_vacuum_delete = """
+        VACUUM DELETE ONLY {};
+    """
+
+    table_vacuum_sort = """
+        VACUUM SORT ONLY {};
+    """
+
+    table_analyze = """
+        ANALYZE {} PREDICATE COLUMNS;
     """
 
     users_table_insert = """
-        SELECT DISTINCT src.userid,
+        SELECT src.userid,
                src.firstname,
                src.lastname,
                src.gender,
                src.level
-          FROM staging_events AS src
-         WHERE src.page='NextSong'
+          FROM (SELECT userid,
+                       firstname,
+                       lastname,
+                       gender,
+                       level,
+                       ROW_NUMBER() OVER (PARTITION BY userid ORDER BY ts DESC) AS version
+                  FROM {staging_events}
+                 WHERE page='NextSong') AS src
+         WHERE src.version = 1
+    """
+
+    users_table_versions = """
+        SELECT src.userid,
+               src.firstname,
+               src.lastname,
+               src.gender,
+               src.level,
+               TIMESTAMP 'epoch' + src.ts/1000 * interval '1 second' AS valid_from
+          FROM (SELECT userid,
+                       firstname,
+                       lastname,
+                       gender,
+                       level,
+                       ts,
+                       LAG(level) OVER (PARTITION BY userid ORDER BY ts) AS previous_level
+                  FROM {staging_events}
+                 WHERE page='NextSong'
+                   AND userid IS NOT NULL) AS src
+         WHERE src.previous_level IS NULL
+            OR src.previous_level <> src.level
+    """
+
+    staging_events_dimensions_source = """
+        SELECT userid,
+               firstname,
+               lastname,
+               gender,
+               level,
+               ts,
+               page
+          FROM {staging_events}
+         WHERE page='NextSong'
+    """
+
+    staging_songs_dimensions_source = """
+        SELECT DISTINCT song_id,
+               title,
+               artist_id,
+               year,
+               duration,
+               artist_name,
+               artist_location,
+               artist_latitude,
+               artist_longitude
+          FROM {staging_songs}
     """
 
     songs_table_insert = """
@@ -47,7 +391,7 @@ class SqlQueries:
                src.artist_id,
                src.year,
                src.duration
-          FROM staging_songs AS src
+          FROM {staging_songs} AS src
     """
 
     artists_table_insert = """
@@ -56,16 +400,35 @@ class SqlQueries:
                src.artist_location,
                src.artist_latitude,
                src.artist_longitude
-          FROM staging_songs AS src
+          FROM {staging_songs} AS src
     """
 
     time_table_insert = """
-        SELECT src.start_time,
-               EXTRACT(hour FROM src.start_time),
-               EXTRACT(day FROM src.start_time),
-               EXTRACT(week FROM src.start_time),
-               EXTRACT(month FROM src.start_time),
-               EXTRACT(year FROM src.start_time),
-               EXTRACT(dayofweek FROM src.start_time)
+        SELECT DISTINCT src.start_time,
+               EXTRACT(hour FROM src.start_time) AS hour,
+               EXTRACT(day FROM src.start_time) AS day,
+               EXTRACT(week FROM src.start_time) AS week,
+               EXTRACT(month FROM src.start_time) AS month,
+               EXTRACT(year FROM src.start_time) AS year,
+               EXTRACT(dayofweek FROM src.start_time) AS weekday
           FROM songplays AS src
     """
+
+    time_table_calendar = """
+        SELECT src.start_time,
+               EXTRACT(hour FROM src.start_time) AS hour,
+               EXTRACT(day FROM src.start_time) AS day,
+               EXTRACT(week FROM src.start_time) AS week,
+               EXTRACT(month FROM src.start_time) AS month,
+               EXTRACT(year FROM src.start_time) AS year,
+               EXTRACT(dayofweek FROM src.start_time) AS weekday
+          FROM (SELECT TIMESTAMP '{start_date}' + steps.step * {interval} * interval '1 second' AS start_time
+                  FROM (SELECT {step} AS step
+                          FROM {digits}) AS steps
+                 WHERE steps.step < {steps}) AS src
+    """
+
+    calendar_digits = """
+        (SELECT 0 AS d UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4
+         UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9)
+    """
@@ -0,0 +1,54 @@
+from helpers.sql_queries import SqlQueries
+
+
+# How the staging tasks write their target table: 'shared' appends to it,
+# 'truncate' empties it first and 'run' copies into a table of the run.
+STAGING_MODES = (
+    'shared',
+    'truncate',
+    'run'
+)
+
+
+def run_table_name(table, context):
+
+    """
+    Gets the name of the staging table of a given DAG run.
+
+    Parameters:
+        table (str): The name of the shared staging table.
+        context (dict): Contains info related to the task instance.
+
+    Returns:
+        (str): The name of the table of the run, e.g.
+            'staging_events_20190112t010000'.
+    """
+
+    return '{}_{}'.format(table, context['ts_nodash'].lower())
+
+
+def resolve_staging_tables(context, staging_tasks=None):
+
+    """
+    Gets the staging table every query placeholder stands for in the current
+    run. The staging tasks push the table they copied into to XCom, under
+    the key 'staging_table'; the default tables are used for the
+    placeholders with no task, or whose task pushed nothing.
+
+    Parameters:
+        context (dict): Contains info related to the task instance.
+        staging_tasks (dict): The identifier of the task that stages every
+            placeholder, by the name of the placeholder.
+
+    Returns:
+        (dict): The name of every staging table, by placeholder.
+    """
+
+    tables = dict(SqlQueries.staging_tables)
+
+    for placeholder, task_id in (staging_tasks or {}).items():
+        table = context['ti'].xcom_pull(task_ids=task_id, key='staging_table')
+        if table is not None:
+            tables[placeholder] = table
+
+    return tables
@@ -1,11 +1,23 @@
 from operators.stage_redshift import StageToRedshiftOperator
+from operators.convert_to_parquet import ConvertToParquetOperator
+from operators.compact_logs import CompactLogsOperator
 from operators.load_fact import LoadFactOperator
+from operators.load_aggregate import LoadAggregateOperator
 from operators.load_dimension import LoadDimensionOperator
+from operators.load_dimensions import LoadDimensionsOperator
 from operators.data_quality import DataQualityOperator
+from operators.drop_staging_tables import DropStagingTablesOperator
+from operators.table_maintenance import TableMaintenanceOperator
 
 __all__ = [
     'StageToRedshiftOperator',
+    'ConvertToParquetOperator',
+    'CompactLogsOperator',
     'LoadFactOperator',
+    'LoadAggregateOperator',
     'LoadDimensionOperator',
-    'DataQualityOperator'
+    'LoadDimensionsOperator',
+    'DataQualityOperator',
+    'DropStagingTablesOperator',
+    'TableMaintenanceOperator'
 ]
@@ -0,0 +1,232 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from concurrent.futures import ProcessPoolExecutor
+from helpers import RedshiftSession
+from helpers.columnar import TABLE_COLUMNS_QUERY, json_path_attributes
+from helpers.compaction import CompactedWriter, bounded_map, validate_lines
+from helpers.manifest import join_s3_url, render_key, split_s3_url
+from helpers.object_store import ObjectStore
+import json
+import os
+import tempfile
+
+
+def validate_object(task):
+
+    """
+    Reads and validates a source object. It runs in the worker processes of
+    CompactLogsOperator, so it lives at module level.
+
+    Parameters:
+        task (tuple): The AWS connection identifier, the local directory
+            that mirrors the buckets (or None), the bucket, the key, the
+            columns of the staging table and the JSON attributes read by
+            them.
+
+    Returns:
+        (tuple): The key, the valid lines and a dict for every rejected
+            record, with its key, line number, reason and content.
+    """
+
+    aws_conn_id, data_root, bucket, key, columns, attributes = task
+
+    content = ObjectStore(aws_conn_id, data_root).read(bucket, key)
+
+    valid = []
+    rejected = []
+    for number, line, error in validate_lines(content, columns, attributes):
+        if error is None:
+            valid.append(line)
+        else:
+            rejected.append({'key': key, 'line': number, 'error': error, 'record': line})
+
+    return key, valid, rejected
+
+
+class CompactLogsOperator(BaseOperator):
+
+    ui_color = '#C9B3E2'
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        s3_prefix=None,
+        target_prefix=None,
+        quarantine_prefix=None,
+        target_table=None,
+        json_path='auto',
+        s3_key=None,
+        target_size=128 * 1024 * 1024,
+        processes=None,
+        aws_conn_id='aws_default',
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class CompactLogsOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier, used
+                to read the columns of the target table.
+            s3_prefix (str): The S3 prefix where the source JSON lines are
+                stored.
+            target_prefix (str): The S3 prefix where the compacted files are
+                written, under a subdirectory named after the run timestamp
+                (ts_nodash).
+            quarantine_prefix (str): The S3 prefix where the rejected records
+                are written, under a subdirectory named after the run
+                timestamp, along with the reason they were rejected.
+            target_table (str): The name of the staging table the records are
+                validated against.
+            json_path (str): The path to the JSONPaths file that maps the
+                JSON attributes to the columns of the target table, or 'auto'
+                to match them by name.
+            s3_key (str): An optional key pattern, relative to the S3 prefix,
+                rendered with the task context using the str.format syntax.
+                When given, only the matching partition is compacted.
+            target_size (int): The compressed size, in bytes, of the
+                compacted files. The last one is usually smaller.
+            processes (int): The number of processes that read and validate
+                the source objects. The number of CPUs when null.
+            aws_conn_id (str): The AWS connection identifier.
+        """
+
+        super(CompactLogsOperator, self).__init__(*args, **kwargs)
+        self._redshift_conn_id = redshift_conn_id
+        self._s3_prefix = s3_prefix
+        self._target_prefix = target_prefix
+        self._quarantine_prefix = quarantine_prefix
+        self._target_table = target_table
+        self._json_path = json_path
+        self._s3_key = s3_key
+        self._target_size = target_size
+        self._processes = processes
+        self._aws_conn_id = aws_conn_id
+        self._session = RedshiftSession(redshift_conn_id)
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the S3 prefixes are valid.
+        for name, prefix in (
+            ('S3 prefix', self._s3_prefix),
+            ('target prefix', self._target_prefix),
+            ('quarantine prefix', self._quarantine_prefix)
+        ):
+            if prefix is None \
+                    or not isinstance(prefix, str) \
+                    or prefix.strip() == '':
+                raise ValueError('The {} cannot be null or empty.'.format(name))
+
+        # Checks if the target table is valid.
+        if self._target_table is None \
+                or not isinstance(self._target_table, str) \
+                or self._target_table.strip() == '':
+            raise ValueError('The target table cannot be null or empty.')
+
+        # Checks if the target size is valid.
+        if not isinstance(self._target_size, int) or self._target_size < 1:
+            raise ValueError('The target size must be a positive integer.')
+
+        # Checks if the number of processes is valid.
+        if self._processes is not None \
+                and (not isinstance(self._processes, int) or self._processes < 1):
+            raise ValueError('The number of processes must be a positive integer.')
+
+    def execute(self, context):
+
+        """
+        Validates the records of the source objects, writes the valid ones
+        into compacted gzip files and the rest into the quarantine prefix.
+        The objects are read and validated by a pool of processes, a few at
+        a time, while the compacted files are written and uploaded one by
+        one, so the memory used does not depend on the amount of data.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        data_root = self._session.data_root
+        store = ObjectStore(self._aws_conn_id, data_root)
+
+        schema, _, table = self._target_table.rpartition('.')
+        columns = self._session.get_records(TABLE_COLUMNS_QUERY, (schema or 'public', table))
+
+        attributes = None
+        if self._json_path != 'auto':
+            bucket, key = split_s3_url(self._json_path)
+            attributes = json_path_attributes(json.loads(store.read(bucket, key))['jsonpaths'])
+
+        source = self._s3_prefix if self._s3_key is None \
+            else join_s3_url(self._s3_prefix, render_key(self._s3_key, context))
+        bucket, _ = split_s3_url(self._s3_prefix)
+        keys = store.list_keys(source)
+
+        # The output of a previous try of the same run is replaced.
+        run_prefix = join_s3_url(self._target_prefix, context['ts_nodash']) + '/'
+        quarantine_prefix = join_s3_url(self._quarantine_prefix, context['ts_nodash']) + '/'
+        store.delete_prefix(run_prefix)
+        store.delete_prefix(quarantine_prefix)
+
+        # The rejected records are spooled to a local file.
+        quarantine = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        rejected_count = 0
+
+        processes = self._processes or os.cpu_count() or 1
+        tasks = (
+            (self._aws_conn_id, data_root, bucket, key, columns, attributes)
+            for key in keys
+        )
+
+        # The temporary files of the writer are removed even on failure.
+        try:
+            writer = CompactedWriter(
+                self._target_size,
+                lambda path, number: store.upload(join_s3_url(run_prefix, 'part-{:05d}.json.gz'.format(number)), path)
+            )
+            with writer, ProcessPoolExecutor(max_workers=processes) as executor:
+                for key, valid, rejected in bounded_map(executor, validate_object, tasks, processes * 2):
+                    for line in valid:
+                        writer.write(line)
+                    for record in rejected:
+                        quarantine.write(json.dumps(record))
+                        quarantine.write('\n')
+                    rejected_count += len(rejected)
+            quarantine.close()
+            if rejected_count > 0:
+                store.upload(join_s3_url(quarantine_prefix, 'rejected.json'), quarantine.name)
+        finally:
+            quarantine.close()
+            os.remove(quarantine.name)
+
+        message = 'Compacted {} records of {} objects into {} files under {}. {} records quarantined under {}.'
+        self.log.info(message.format(
+            writer.lines,
+            len(keys),
+            writer.files,
+            run_prefix,
+            rejected_count,
+            quarantine_prefix
+        ))
+
+        self.xcom_push(context, 'source_objects', len(keys))
+        self.xcom_push(context, 'compacted_records', writer.lines)
+        self.xcom_push(context, 'compacted_files', writer.files)
+        self.xcom_push(context, 'rejected_records', rejected_count)
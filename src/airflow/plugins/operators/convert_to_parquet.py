@@ -0,0 +1,191 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import RedshiftSession
+from helpers.columnar import (
+    TABLE_COLUMNS_QUERY,
+    build_table,
+    json_path_attributes,
+    pyarrow,
+    write_parquet
+)
+from helpers.local_engine import parse_json_documents
+from helpers.manifest import join_s3_url, render_key, split_s3_url
+from helpers.object_store import ObjectStore
+import json
+
+
+class ConvertToParquetOperator(BaseOperator):
+
+    ui_color = '#A3C9E2'
+
+    compressions = ('snappy', 'gzip')
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        s3_prefix=None,
+        target_prefix=None,
+        target_table=None,
+        json_path='auto',
+        s3_key=None,
+        compression='snappy',
+        aws_conn_id='aws_default',
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class ConvertToParquetOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier, used
+                to read the columns of the target table.
+            s3_prefix (str): The S3 prefix where the source JSON data is
+                stored.
+            target_prefix (str): The S3 prefix where the Parquet files are
+                written. Every source object gets its own file, with the same
+                key relative to the prefix and the suffix '.parquet', so the
+                key patterns of the source data select them too.
+            target_table (str): The name of the staging table the Parquet
+                files are loaded into. Their columns follow its columns, in
+                the same order and with the same types.
+            json_path (str): The path to the JSONPaths file that maps the
+                JSON attributes to the columns of the target table, or 'auto'
+                to match them by name.
+            s3_key (str): An optional key pattern, relative to the S3 prefix,
+                rendered with the task context using the str.format syntax.
+                When given, only the matching partition is converted.
+            compression (str): The compression codec of the Parquet files:
+                'snappy' or 'gzip'.
+            aws_conn_id (str): The AWS connection identifier.
+        """
+
+        super(ConvertToParquetOperator, self).__init__(*args, **kwargs)
+        self._redshift_conn_id = redshift_conn_id
+        self._s3_prefix = s3_prefix
+        self._target_prefix = target_prefix
+        self._target_table = target_table
+        self._json_path = json_path
+        self._s3_key = s3_key
+        self._compression = compression
+        self._aws_conn_id = aws_conn_id
+        self._session = RedshiftSession(redshift_conn_id)
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the S3 prefix is valid.
+        if self._s3_prefix is None \
+                or not isinstance(self._s3_prefix, str) \
+                or self._s3_prefix.strip() == '':
+            raise ValueError('The S3 prefix cannot be null or empty.')
+
+        # Checks if the target prefix is valid.
+        if self._target_prefix is None \
+                or not isinstance(self._target_prefix, str) \
+                or self._target_prefix.strip() == '':
+            raise ValueError('The target prefix cannot be null or empty.')
+
+        # Checks if the target table is valid.
+        if self._target_table is None \
+                or not isinstance(self._target_table, str) \
+                or self._target_table.strip() == '':
+            raise ValueError('The target table cannot be null or empty.')
+
+        # Checks if the compression codec is valid.
+        if self._compression not in self.compressions:
+            message = 'Available values for the compression: {}'
+            raise ValueError(message.format(', '.join(self.compressions)))
+
+    def get_attributes(self, store):
+
+        """
+        Gets the JSON attribute read by every column of the target table.
+
+        Parameters:
+            store (ObjectStore): The store of the JSONPaths file.
+
+        Returns:
+            (list): The attribute names, or None to match them by name.
+        """
+
+        if self._json_path == 'auto':
+            return None
+
+        bucket, key = split_s3_url(self._json_path)
+        return json_path_attributes(json.loads(store.read(bucket, key))['jsonpaths'])
+
+    def execute(self, context):
+
+        """
+        Converts the JSON objects of the source prefix not converted yet
+        into Parquet files, typed after the target table.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        if pyarrow is None:
+            raise ImportError('The package pyarrow is needed to write Parquet files.')
+
+        schema, _, table = self._target_table.rpartition('.')
+        columns = self._session.get_records(TABLE_COLUMNS_QUERY, (schema or 'public', table))
+        store = ObjectStore(self._aws_conn_id, self._session.data_root)
+        attributes = self.get_attributes(store)
+
+        # The source objects of the run, and those already converted.
+        source = self._s3_prefix if self._s3_key is None \
+            else join_s3_url(self._s3_prefix, render_key(self._s3_key, context))
+        bucket, source_prefix = split_s3_url(self._s3_prefix)
+        _, target_prefix = split_s3_url(self._target_prefix)
+        target_bucket, _ = split_s3_url(self._target_prefix)
+
+        converted = set(store.list_keys(self._target_prefix))
+        keys = store.list_keys(source)
+
+        input_bytes = 0
+        output_bytes = 0
+        count = 0
+
+        for key in keys:
+
+            # The target key keeps the key relative to the source prefix.
+            relative_key = key[len(source_prefix):].lstrip('/')
+            target_key = join_s3_url(target_prefix, relative_key) + '.parquet' if target_prefix \
+                else relative_key + '.parquet'
+            if target_key in converted:
+                continue
+
+            content = store.read(bucket, key)
+            parquet = write_parquet(
+                build_table(parse_json_documents(content), columns, attributes),
+                self._compression
+            )
+            store.write('s3://{}/{}'.format(target_bucket, target_key), parquet)
+
+            input_bytes += len(content.encode('utf-8'))
+            output_bytes += len(parquet)
+            count += 1
+
+        message = 'Converted {} of {} objects into Parquet: {} bytes of JSON into {} bytes.'
+        self.log.info(message.format(count, len(keys), input_bytes, output_bytes))
+
+        self.xcom_push(context, 'converted_objects', count)
+        self.xcom_push(context, 'input_bytes', input_bytes)
+        self.xcom_push(context, 'output_bytes', output_bytes)
@@ -1,6 +1,9 @@
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from concurrent.futures import ThreadPoolExecutor
+from helpers import RedshiftSession
+from helpers.instrumentation import report_statements, reports_failures
+from helpers.quality_checks import compile_checks, evaluate_checks
 
 
 class DataQualityOperator(BaseOperator):
@@ -15,11 +18,34 @@ class DataQualityOperator(BaseOperator):
         'songplays'
     )
 
+    # The checks applied to every table when no spec is given. The keys of
+    # the tables are unique, and those sorted by time are only checked
+    # within the run interval in approximate mode.
+    checks = {
+        'artists': {'min_rows': 1, 'null_rates': {'artistid': 0}},
+        'users': {'min_rows': 1, 'null_rates': {'userid': 0}, 'unique': ('userid', 'valid_from')},
+        'songs': {'min_rows': 1, 'null_rates': {'songid': 0}, 'unique': ('songid',)},
+        'time': {'min_rows': 1, 'null_rates': {'start_time': 0}, 'unique': ('start_time',), 'window': 'start_time'},
+        'songplays': {
+            'min_rows': 1,
+            'null_rates': {'playid': 0, 'start_time': 0},
+            'unique': ('playid',),
+            'window': 'start_time'
+        }
+    }
+
     @apply_defaults
     def __init__(
         self,
         redshift_conn_id=None,
         tables=None,
+        checks=None,
+        parallelism=4,
+        approximate=False,
+        sample_rate=None,
+        tolerance=0.02,
+        statement_timeout=None,
+        metrics_sink=None,
         *args,
         **kwargs
     ):
@@ -30,11 +56,42 @@ class DataQualityOperator(BaseOperator):
             redshift_conn_id (str): The Redshift connection identifier.
             tables (iterable): A tuple with the name of those tables
                 which data must be validated.
+            checks (dict): The spec of the checks of every table, by table
+                name. The tables not found here get the default checks. See
+                compile_checks for the available checks.
+            parallelism (int): The maximum number of tables checked at once.
+            approximate (bool): When True, the checks are cheaper but not
+                exact: the uniqueness checks are estimated, and the tables
+                with a window column in their spec are only checked within the
+                run interval. Useful for hourly runs on large tables, leaving
+                the exact checks for a nightly run.
+            sample_rate (float): In approximate mode, the rate of the run
+                interval checked, from 0 to 1, the latest part of it. The
+                whole interval is checked when null, and the tables with no
+                window column are checked as a whole anyway.
+            tolerance (float): In approximate mode, the error tolerance added
+                to the thresholds of the rate checks.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
         """
 
         super(DataQualityOperator, self).__init__(*args, **kwargs)
         self._redshift_conn_id = redshift_conn_id
         self._tables = tables
+        self._checks = checks or {}
+        self._parallelism = parallelism
+        self._approximate = approximate
+        self._sample_rate = sample_rate
+        self._tolerance = tolerance
+        self._session = RedshiftSession(
+            redshift_conn_id,
+            statement_timeout=statement_timeout,
+            max_connections=parallelism if isinstance(parallelism, int) and parallelism > 0 else 1
+        )
+        self._metrics_sink = metrics_sink
 
     def check_invalid_params(self):
 
@@ -51,6 +108,10 @@ class DataQualityOperator(BaseOperator):
                 or self._redshift_conn_id.strip() == '':
             raise ValueError('The Redshift connection identifier cannot be null or empty.')
 
+        # Checks if the checks spec is valid.
+        if not isinstance(self._checks, dict):
+            raise ValueError('The checks spec must be a dict.')
+
         # Checks if the tables tuple is valid.
         if self._tables is None \
                 or not isinstance(self._tables, tuple) \
@@ -60,10 +121,44 @@ class DataQualityOperator(BaseOperator):
         for table in self._tables:
             if not isinstance(table, str) \
                     or table.strip() == '' \
-                    or table not in self.tables:
+                    or (table not in self.tables and table not in self._checks):
                 message = 'Available values for the tables tuple: {}'
                 raise ValueError(message.format(', '.join(self.tables)))
 
+        # Checks if the parallelism is valid.
+        if not isinstance(self._parallelism, int) or self._parallelism < 1:
+            raise ValueError('The parallelism must be a positive integer.')
+
+        # Checks if the approximate flag is valid.
+        if self._approximate is None \
+                or not isinstance(self._approximate, bool):
+            raise ValueError('The approximate flag must be boolean.')
+
+        # Checks if the sample rate is valid.
+        if self._sample_rate is not None \
+                and (
+                    not isinstance(self._sample_rate, (int, float))
+                    or not 0 < self._sample_rate <= 1
+                ):
+            raise ValueError('The sample rate must be a number between 0 and 1.')
+
+        # Checks if the tolerance is valid.
+        if not isinstance(self._tolerance, (int, float)) or self._tolerance < 0:
+            raise ValueError('The tolerance must be a non negative number.')
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
     def execute(self, context):
 
         """
@@ -76,20 +171,57 @@ class DataQualityOperator(BaseOperator):
         # Validates the operator parameteres.
         self.check_invalid_params()
 
-        postgres = PostgresHook(postgres_conn_id=self._redshift_conn_id)
+        # Runs every table suite concurrently, one aggregate query each.
+        with ThreadPoolExecutor(max_workers=min(self._parallelism, len(self._tables))) as executor:
+            reports = executor.map(lambda table: self.check_table(table, context), self._tables)
+            report = [result for results in reports for result in results]
 
-        for table in self._tables:
+        self.xcom_push(context, 'report', report)
+
+        failed = [r for r in report if not r['passed']]
+        for result in failed:
+            message = 'The table {} has not passed the check {}: {} (threshold {}).'
+            self.log.error(message.format(result['table'], result['check'], result['value'], result['threshold']))
+
+        if len(failed) > 0:
+            message = 'The tables {} have not passed the data quality checks.'
+            raise ValueError(message.format(', '.join(sorted(set(r['table'] for r in failed)))))
+
+    def check_table(self, table, context):
+
+        """
+        Runs every check of a given table with a single query.
+
+        Parameters:
+            table (str): The name of the table.
+            context (dict): Contains info related to the task instance.
+
+        Returns:
+            (list): The result of every check, as returned by evaluate_checks.
+        """
+
+        spec = self._checks.get(table, self.checks.get(table, {}))
+
+        # In approximate mode, the scan can be restricted to the run interval.
+        window = None
+        if self._approximate and spec.get('window'):
+            window = (spec['window'], context['execution_date'], context['next_execution_date'])
 
-            query = 'SELECT COUNT(*) FROM {}'.format(table)
+        query, checks = compile_checks(
+            table,
+            spec,
+            approximate=self._approximate,
+            window=window,
+            sample_rate=self._sample_rate,
+            tolerance=self._tolerance
+        )
 
-            self.log.info(query)
+        self.log.info(query)
 
-            records = postgres.get_records(query)
+        records = self._session.get_records(query)
+        results = evaluate_checks(table, checks, records[0], context)
 
-            if len(records) == 0 or len(records[0]) == 0 or records[0][0] == 0:
-                message = 'The table {} has not passed the data quality check.'.format(table)
-                self.log.error(message)
-                raise ValueError(message)
+        message = 'The table {} has passed {} of {} data quality checks with {} records.'
+        self.log.info(message.format(table, sum(r['passed'] for r in results), len(results), records[0][0]))
 
-            message = 'The table {} has passed the data quality check with {} records.'
-            self.log.info(message.format(table, records[0][0]))
+        return results
@@ -0,0 +1,107 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import RedshiftSession, SqlQueries
+from helpers.instrumentation import report_statements, reports_failures
+from helpers.staging import resolve_staging_tables
+
+
+class DropStagingTablesOperator(BaseOperator):
+
+    ui_color = '#E2A3A3'
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        staging_tasks=None,
+        statement_timeout=None,
+        metrics_sink=None,
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class DropStagingTablesOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier.
+            staging_tasks (dict): The identifier of the task that stages
+                every staging table, by the name of its placeholder (e.g.
+                {'staging_events': 'Stage_events'}). The tables of the run
+                those tasks pushed to XCom are dropped, while the shared
+                staging tables are always kept.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
+        """
+
+        super(DropStagingTablesOperator, self).__init__(*args, **kwargs)
+        self._redshift_conn_id = redshift_conn_id
+        self._staging_tasks = staging_tasks
+        self._session = RedshiftSession(redshift_conn_id, statement_timeout=statement_timeout)
+        self._metrics_sink = metrics_sink
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the staging tasks dict is valid.
+        if self._staging_tasks is None \
+                or not isinstance(self._staging_tasks, dict) \
+                or len(self._staging_tasks) == 0:
+            raise ValueError('The staging tasks dict cannot be null or empty.')
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
+    def execute(self, context):
+
+        """
+        Drops the staging tables of the current run, once the tables that
+        read them are loaded.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        tables = resolve_staging_tables(context, self._staging_tasks)
+        shared = set(SqlQueries.staging_tables.values())
+
+        dropped = sorted(set(tables.values()) - shared)
+        if len(dropped) == 0:
+            self.log.info('There are no staging tables of the run to drop.')
+            return
+
+        with self._session.transaction() as cursor:
+            for table in dropped:
+                query = SqlQueries.staging_table_drop.strip().format(table)
+                self.log.info(query)
+                cursor.execute(query)
+
+        self.log.info('Dropped the staging tables {}.'.format(', '.join(dropped)))
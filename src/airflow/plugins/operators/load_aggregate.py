@@ -0,0 +1,313 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from datetime import datetime
+from helpers import RedshiftSession, SqlQueries
+from helpers.aggregates import (
+    aggregate_keys,
+    bucket_range,
+    compile_aggregate,
+    merge_expressions,
+    validate_aggregate
+)
+from helpers.instrumentation import report_statements, reports_failures
+
+
+class LoadAggregateOperator(BaseOperator):
+
+    ui_color = '#A3C9A8'
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        aggregate=None,
+        source_table='songplays',
+        time_column='start_time',
+        ledger_table='aggregate_runs',
+        statement_timeout=None,
+        metrics_sink=None,
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class LoadAggregateOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier.
+            aggregate (dict): The spec of the aggregate, as described in
+                helpers.aggregates.compile_aggregate: its target table, time
+                bucket, group by columns and measures.
+            source_table (str): The name of the table the aggregate is
+                computed from. Its rows of the run interval must be loaded
+                by the run, as a window scoped fact load does.
+            time_column (str): The timestamp column of the source table that
+                tells the run interval of its rows.
+            ledger_table (str): The name of the table that records the run
+                intervals merged into every aggregate table, so a rerun
+                recomputes the buckets it touches instead of merging them
+                twice.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
+        """
+
+        super(LoadAggregateOperator, self).__init__(*args, **kwargs)
+        self._redshift_conn_id = redshift_conn_id
+        self._aggregate = aggregate
+        self._source_table = source_table
+        self._time_column = time_column
+        self._ledger_table = ledger_table
+        self._session = RedshiftSession(redshift_conn_id, statement_timeout=statement_timeout)
+        self._metrics_sink = metrics_sink
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the aggregate spec is valid.
+        validate_aggregate(self._aggregate)
+
+        # Checks if the source table is valid.
+        if self._source_table is None \
+                or not isinstance(self._source_table, str) \
+                or self._source_table.strip() == '':
+            raise ValueError('The source table cannot be null or empty.')
+
+        # Checks if the time column is valid.
+        if self._time_column is None \
+                or not isinstance(self._time_column, str) \
+                or self._time_column.strip() == '':
+            raise ValueError('The time column cannot be null or empty.')
+
+        # Checks if the ledger table is valid.
+        if self._ledger_table is None \
+                or not isinstance(self._ledger_table, str) \
+                or self._ledger_table.strip() == '':
+            raise ValueError('The ledger table cannot be null or empty.')
+
+    def run_statement(self, cursor, query, parameters=None):
+
+        """
+        Logs and executes a statement.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statement.
+            query (str): The statement.
+            parameters (tuple): The parameters of the statement, if any.
+
+        Returns:
+            (int): The number of rows affected by the statement.
+        """
+
+        self.log.info(query)
+        cursor.execute(query, parameters)
+        return cursor.rowcount
+
+    def create_target_table(self, cursor, target_table, query):
+
+        """
+        Creates the aggregate table, empty, with the columns of its query and
+        sorted by its keys, unless it exists.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            target_table (str): The name of the aggregate table.
+            query (str): The query that computes the aggregate.
+        """
+
+        schema, _, name = target_table.rpartition('.')
+        cursor.execute(SqlQueries.aggregate_table_exists, (schema or 'public', name))
+        if cursor.fetchone()[0] > 0:
+            return
+
+        self.run_statement(cursor, SqlQueries.aggregate_table_create.strip().format(
+            target_table=target_table,
+            keys=', '.join(aggregate_keys(self._aggregate)),
+            query=query.strip()
+        ))
+
+    def merge_statements(self, cursor, target_table, delta_table, columns):
+
+        """
+        Merges the rows of the delta table into the aggregate table: the
+        measures of the existing buckets are combined with the new ones, and
+        the new buckets are inserted.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            target_table (str): The name of the aggregate table.
+            delta_table (str): The name of the table with the new rows.
+            columns (list): The columns of the aggregate.
+
+        Returns:
+            (tuple): The number of buckets updated and inserted.
+        """
+
+        keys = aggregate_keys(self._aggregate)
+        conditions = ' AND '.join('target.{0} = delta.{0}'.format(key) for key in keys)
+
+        updated = self.run_statement(cursor, SqlQueries.aggregate_table_merge.strip().format(
+            target_table=target_table,
+            assignments=',\n               '.join(merge_expressions(self._aggregate, 'target', 'delta')),
+            delta_table=delta_table,
+            conditions=conditions
+        ))
+
+        inserted = self.run_statement(cursor, SqlQueries.aggregate_table_insert_new.strip().format(
+            target_table=target_table,
+            columns=', '.join(columns),
+            delta_columns=', '.join('delta.{}'.format(column) for column in columns),
+            delta_table=delta_table,
+            conditions=conditions,
+            key=keys[0]
+        ))
+
+        return updated, inserted
+
+    def recompute_statements(self, cursor, target_table, delta_table, columns, start, end):
+
+        """
+        Recomputes the buckets of the aggregate table the run touches, from
+        the whole source table. The time bucketed aggregates recompute every
+        bucket that overlaps the run interval, and the others every group of
+        the delta table.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            target_table (str): The name of the aggregate table.
+            delta_table (str): The name of the table with the new rows.
+            columns (list): The columns of the aggregate.
+            start (datetime): The start (included) of the run interval.
+            end (datetime): The end (excluded) of the run interval.
+
+        Returns:
+            (tuple): The number of buckets deleted and inserted.
+        """
+
+        buckets = bucket_range(self._aggregate, start, end)
+
+        if buckets is not None:
+            deleted = self.run_statement(cursor, SqlQueries.aggregate_table_delete_buckets.strip().format(
+                target_table,
+                buckets[0].strftime('%Y-%m-%d %H:%M:%S'),
+                buckets[1].strftime('%Y-%m-%d %H:%M:%S')
+            ))
+            query, _ = compile_aggregate(self._aggregate, self._source_table, self._time_column, *buckets)
+        else:
+            deleted = self.run_statement(cursor, SqlQueries.aggregate_table_delete_groups.strip().format(
+                target_table=target_table,
+                delta_table=delta_table,
+                conditions=' AND '.join(
+                    '{0}.{1} = delta.{1}'.format(target_table, column) for column in self._aggregate['group_by']
+                )
+            ))
+            query, _ = compile_aggregate(
+                self._aggregate,
+                self._source_table,
+                self._time_column,
+                start,
+                end,
+                delta_table=delta_table
+            )
+
+        inserted = self.run_statement(cursor, 'INSERT INTO {} ({}) {}'.format(
+            target_table,
+            ', '.join(columns),
+            query.strip()
+        ))
+
+        return deleted, inserted
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
+    def execute(self, context):
+
+        """
+        Refreshes the aggregate table from the rows of the source table of
+        the run interval only. The first time an interval is loaded, its rows
+        are aggregated into a delta table and merged into the existing
+        buckets. When it was already loaded, e.g. by a retry or a backfill,
+        the buckets it touches are recomputed instead, so they are never
+        counted twice. The outcome is pushed to XCom under the key
+        'aggregate_rows'.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        target_table = self._aggregate['target_table']
+        delta_table = '{}_delta'.format(target_table.replace('.', '_'))
+        start, end = context['execution_date'], context['next_execution_date']
+        window = (start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+        query, columns = compile_aggregate(self._aggregate, self._source_table, self._time_column, start, end)
+
+        # The aggregate table is locked, so the runs that refresh it at the
+        # same time merge one after the other.
+        with self._session.transaction() as cursor:
+
+            self.create_target_table(cursor, target_table, query)
+            self.run_statement(cursor, SqlQueries.aggregate_table_lock.strip().format(target_table))
+
+            cursor.execute(
+                SqlQueries.aggregate_run_lookup.strip().format(self._ledger_table),
+                (target_table, window[0])
+            )
+            merged = cursor.fetchone()[0] > 0
+
+            self.run_statement(cursor, SqlQueries.staging_table_drop.strip().format(delta_table))
+            delta = self.run_statement(cursor, SqlQueries.aggregate_delta_create.strip().format(
+                delta_table,
+                query.strip()
+            ))
+
+            if not merged:
+                updated, inserted = self.merge_statements(cursor, target_table, delta_table, columns)
+                cursor.execute(
+                    SqlQueries.aggregate_run_insert.strip().format(self._ledger_table),
+                    (target_table, window[0], window[1], datetime.utcnow())
+                )
+                message = 'The table {} has been refreshed: {} buckets updated, {} buckets inserted.'
+                self.log.info(message.format(target_table, updated, inserted))
+                rows = {'delta': delta, 'updated': updated, 'inserted': inserted}
+            else:
+                deleted, inserted = self.recompute_statements(cursor, target_table, delta_table, columns, start, end)
+                cursor.execute(
+                    SqlQueries.aggregate_run_update.strip().format(self._ledger_table),
+                    (datetime.utcnow(), target_table, window[0])
+                )
+                message = 'The run interval was already merged into the table {}: {} buckets recomputed.'
+                self.log.info(message.format(target_table, inserted))
+                rows = {'delta': delta, 'deleted': deleted, 'inserted': inserted}
+
+            self.run_statement(cursor, SqlQueries.staging_table_drop.strip().format(delta_table))
+
+        self.xcom_push(context, 'aggregate_rows', rows)
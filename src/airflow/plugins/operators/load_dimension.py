@@ -1,7 +1,11 @@
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
-from helpers import SqlQueries
+from datetime import timedelta
+from helpers import RedshiftSession, SqlQueries
+from helpers.grants import grant_statements
+from helpers.instrumentation import report_statements, reports_failures
+from helpers.manifest import parse_date
+from helpers.staging import resolve_staging_tables
 
 
 class LoadDimensionOperator(BaseOperator):
@@ -15,6 +19,36 @@ class LoadDimensionOperator(BaseOperator):
         'time': 'start_time'
     }
 
+    modes = (
+        'truncate',
+        'swap',
+        'append',
+        'merge',
+        'scd2',
+        'incremental',
+        'calendar'
+    )
+
+    scd2_dimensions = {
+        'users': ('level',)
+    }
+
+    incremental_dimensions = (
+        'time',
+    )
+
+    # The order of the source records of a key in the merge mode, the first
+    # one winning. Every column takes part, so the winner is the same
+    # whatever the order of the staging data. The users are already the
+    # latest version of every key, by event time.
+    merge_orders = {
+        'artists': 'src.artist_location IS NULL, src.artist_location, src.artist_name, '
+                   'src.artist_latitude, src.artist_longitude',
+        'users': 'src.level, src.firstname, src.lastname, src.gender',
+        'songs': 'src.year DESC, src.title, src.artist_id, src.duration',
+        'time': 'src.start_time'
+    }
+
     @apply_defaults
     def __init__(
         self,
@@ -23,6 +57,15 @@ class LoadDimensionOperator(BaseOperator):
         dimension=None,
         truncate=True,
         pk_field=None,
+        mode=None,
+        merge_update=True,
+        calendar_start_date=None,
+        calendar_end_date=None,
+        calendar_interval=timedelta(seconds=1),
+        staging_tasks=None,
+        window_scoped=False,
+        statement_timeout=None,
+        metrics_sink=None,
         *args,
         **kwargs
     ):
@@ -40,6 +83,45 @@ class LoadDimensionOperator(BaseOperator):
             truncate (bool): When True, the target table will be truncated
                 before the dimension data is inserted. When False, the
                 dimension data is appended instead.
+            pk_field (str): The name of the PK field of the target table.
+                It is mandatory unless the target table is truncated or
+                swapped.
+            mode (str): How the dimension data is written. The available
+                options are: 'truncate', 'swap', 'append', 'merge', 'scd2',
+                'incremental' and 'calendar'. When null, it is taken from the
+                truncate flag. The 'swap' mode rebuilds the whole table, like
+                'truncate', but into a new table that replaces the target one
+                at commit time, so readers never find it empty; the previous
+                version is kept as '<table>__old'. The 'scd2' mode keeps the
+                history of the dimension as a slowly changing dimension of
+                type 2, and it is only available for 'users'. The
+                'incremental' mode only loads the records missing from the
+                target table, and the 'calendar' mode generates every
+                timestamp of a date range instead of extracting them, except
+                those already in the target table; both are only available
+                for 'time'.
+            merge_update (bool): When True, the merge mode updates those
+                records whose attributes have changed. When False, it only
+                inserts the new records.
+            calendar_start_date (datetime|str): The first timestamp generated
+                by the calendar mode.
+            calendar_end_date (datetime|str): The last timestamp (included)
+                generated by the calendar mode.
+            calendar_interval (timedelta): The distance between two
+                timestamps generated by the calendar mode.
+            staging_tasks (dict): The identifier of the task that stages
+                every staging table the queries read, by the name of its
+                placeholder (e.g. {'staging_events': 'Stage_events'}). The
+                table each task pushed to XCom is read instead of the default
+                one, so the queries only scan the data of the current run.
+            window_scoped (bool): When True, the incremental mode only scans
+                the facts of the run interval (from the execution date to
+                the next one), as loaded by a window scoped fact load.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
         """
 
         super(LoadDimensionOperator, self).__init__(*args, **kwargs)
@@ -48,6 +130,15 @@ class LoadDimensionOperator(BaseOperator):
         self._dimension = dimension
         self._truncate = truncate
         self._pk_field = pk_field
+        self._mode = mode if mode is not None else ('truncate' if truncate else 'append')
+        self._merge_update = merge_update
+        self._calendar_start_date = calendar_start_date
+        self._calendar_end_date = calendar_end_date
+        self._calendar_interval = calendar_interval
+        self._staging_tasks = staging_tasks
+        self._window_scoped = window_scoped
+        self._session = RedshiftSession(redshift_conn_id, statement_timeout=statement_timeout)
+        self._metrics_sink = metrics_sink
 
     def check_invalid_params(self):
 
@@ -64,37 +155,102 @@ class LoadDimensionOperator(BaseOperator):
                 or self._redshift_conn_id.strip() == '':
             raise ValueError('The Redshift connection identifier cannot be null or empty.')
 
+        # Checks if the truncate flag is valid.
+        if self._truncate is None \
+                or not isinstance(self._truncate, bool):
+            raise ValueError('The truncate flag must be boolean.')
+
+        # Checks if the merge update flag is valid.
+        if self._merge_update is None \
+                or not isinstance(self._merge_update, bool):
+            raise ValueError('The merge update flag must be boolean.')
+
+        self.check_invalid_load(self._dimension, self._target_table, self._pk_field, self._mode)
+
+    def check_invalid_load(self, dimension, target_table, pk_field, mode):
+
+        """
+        Checks if the parameters of a dimension load are properly defined.
+
+        Parameters:
+            dimension (str): The dimension to load.
+            target_table (str): The name of the table where the records
+                will be inserted.
+            pk_field (str): The name of the PK field of the target table.
+            mode (str): How the dimension data is written.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
         # Checks if the target table is valid.
-        if self._target_table is None \
-                or not isinstance(self._target_table, str) \
-                or self._target_table.strip() == '':
+        if target_table is None \
+                or not isinstance(target_table, str) \
+                or target_table.strip() == '':
             raise ValueError('The target table cannot be null or empty.')
 
         # Checks if the dimension is valid.
-        if self._dimension is None \
-                or not isinstance(self._dimension, str) \
-                or self._dimension.strip() == '':
+        if dimension is None \
+                or not isinstance(dimension, str) \
+                or dimension.strip() == '':
             raise ValueError('The dimension cannot be null or empty.')
 
         dimensions = list(self.dimensions.keys())
-        if self._dimension not in dimensions:
+        if dimension not in dimensions:
             message = 'Available values for the dimension: {}'
             raise ValueError(message.format(', '.join(dimensions)))
 
-        # Checks if the truncate flag is valid.
-        if self._truncate is None \
-                or not isinstance(self._truncate, bool):
-            raise ValueError('The truncate flag must be boolean.')
+        # Checks if the mode is valid.
+        if mode not in self.modes:
+            message = 'Available values for the mode: {}'
+            raise ValueError(message.format(', '.join(self.modes)))
+
+        if mode == 'scd2' and dimension not in self.scd2_dimensions:
+            message = 'The scd2 mode is only available for the dimensions: {}'
+            raise ValueError(message.format(', '.join(self.scd2_dimensions)))
+
+        if mode in ('incremental', 'calendar') and dimension not in self.incremental_dimensions:
+            message = 'The {} mode is only available for the dimensions: {}'
+            raise ValueError(message.format(mode, ', '.join(self.incremental_dimensions)))
+
+        # Checks if the calendar range is valid.
+        if mode == 'calendar' \
+                and (
+                    self._calendar_start_date is None
+                    or self._calendar_end_date is None
+                    or parse_date(self._calendar_start_date) > parse_date(self._calendar_end_date)
+                ):
+            raise ValueError('The calendar mode needs a start date not later than the end date.')
+
+        if mode == 'calendar' \
+                and (
+                    not isinstance(self._calendar_interval, timedelta)
+                    or self._calendar_interval.total_seconds() < 1
+                ):
+            raise ValueError('The calendar interval must be a timedelta of one second at least.')
 
         # Checks if the PK field is valid.
-        if not self._truncate \
+        if mode not in ('truncate', 'swap') \
                 and (
-                    self._pk_field is None
-                    or not isinstance(self._pk_field, str)
-                    or self._pk_field.strip() == ''
+                    pk_field is None
+                    or not isinstance(pk_field, str)
+                    or pk_field.strip() == ''
                 ):
-            raise ValueError('The PK field cannot be null or empty when truncate is False.')
+            raise ValueError('The PK field cannot be null or empty unless the mode is truncate or swap.')
+
+    def post_execute(self, context, result=None):
 
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
     def execute(self, context):
 
         """
@@ -108,29 +264,150 @@ class LoadDimensionOperator(BaseOperator):
         # Validates the operator parameteres.
         self.check_invalid_params()
 
-        # Gets the select query corresponding the given dimension.
-        select_query = getattr(
+        # Loads the dimension in a single transaction.
+        with self._session.transaction() as cursor:
+            self.load_statements(
+                cursor,
+                self._dimension,
+                self._target_table,
+                self._pk_field,
+                self._mode,
+                resolve_staging_tables(context, self._staging_tasks),
+                window=self.get_window(context)
+            )
+
+    def get_window(self, context):
+
+        """
+        Gets the run interval scanned by the incremental mode.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+
+        Returns:
+            (tuple): The start (included) and end (excluded) of the interval,
+                or None when the load is not window scoped.
+        """
+
+        if not self._window_scoped:
+            return None
+
+        return (
+            context['execution_date'].strftime('%Y-%m-%d %H:%M:%S'),
+            context['next_execution_date'].strftime('%Y-%m-%d %H:%M:%S')
+        )
+
+    def get_select_query(self, dimension, mode, sources):
+
+        """
+        Gets the query that extracts the data of a given dimension.
+
+        Parameters:
+            dimension (str): The dimension to extract.
+            mode (str): How the dimension data is written.
+            sources (dict): The name of every staging table the query reads,
+                by the name of its placeholder.
+
+        Returns:
+            (str): The select query.
+        """
+
+        name = 'versions' if mode == 'scd2' else 'insert'
+
+        return getattr(
             SqlQueries,
-            '{}_table_insert'.format(self._dimension)
-        ).strip()
+            '{}_table_{}'.format(dimension, name)
+        ).strip().format(**sources)
+
+    def load_statements(self, cursor, dimension, target_table, pk_field, mode, sources, transactional=False,
+                        window=None):
+
+        """
+        Runs the statements that load a given dimension with a given cursor,
+        without committing them.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            dimension (str): The dimension to load.
+            target_table (str): The name of the table where the records
+                will be inserted.
+            pk_field (str): The name of the PK field of the target table.
+            mode (str): How the dimension data is written.
+            sources (dict): The name of every staging table the queries read,
+                by the name of its placeholder.
+            transactional (bool): When True, the truncate mode deletes the
+                records instead, since TRUNCATE commits the transaction
+                in Redshift.
+            window (tuple): The start (included) and end (excluded) of the
+                interval of the source records scanned by the incremental
+                mode, or None to scan them all.
+        """
+
+        # Gets the select query corresponding the given dimension.
+        select_query = self.get_select_query(dimension, mode, sources)
+
+        # The merge, scd2 and calendar modes run several statements.
+        if mode == 'merge':
+            self.merge_statements(cursor, dimension, target_table, pk_field, select_query)
+            return
+
+        if mode == 'scd2':
+            self.scd2_statements(cursor, dimension, target_table, pk_field, select_query)
+            return
+
+        if mode == 'calendar':
+            self.calendar_statements(cursor, dimension, target_table, pk_field)
+            return
+
+        if mode == 'swap':
+            self.swap_statements(cursor, target_table, select_query)
+            return
 
         # Builds the query.
-        if self._truncate:
+        if mode == 'truncate':
 
-            # If the truncate flag is True, we must truncate the target
+            # If the mode is truncate, we must truncate the target
             # table first, and then do the UPSERT.
             query = """
-                TRUNCATE TABLE {target_table};
+                {truncate} {target_table};
                 INSERT INTO {target_table}
                 {select_query};
             """.format(
-                target_table=self._target_table,
+                truncate='DELETE FROM' if transactional else 'TRUNCATE TABLE',
+                target_table=target_table,
+                select_query=select_query
+            )
+
+        elif mode == 'incremental':
+
+            # If the mode is incremental, only those records missing from
+            # the target table are inserted, late or backfilled ones too.
+            # When the load is window scoped, only the source records of the
+            # run interval are scanned, so the cost of the load depends on
+            # the new records, not on the whole history.
+            query = """
+                INSERT INTO {target_table}
+                {select_query}
+                {clause} {window}NOT EXISTS (
+                    SELECT 1
+                    FROM {target_table}
+                    WHERE src.{src_pk_field} = {target_table}.{pk_field}
+                );
+            """.format(
+                clause='AND' if 'WHERE' in select_query else 'WHERE',
+                window='' if window is None else "src.{0} >= '{1}' AND src.{0} < '{2}' AND ".format(
+                    self.dimensions[dimension],
+                    *window
+                ),
+                target_table=target_table,
+                src_pk_field=self.dimensions[dimension],
+                pk_field=pk_field,
                 select_query=select_query
             )
 
         else:
 
-            # If the truncate flag is False, we must do the UPSERT handling
+            # If the mode is append, we must do the UPSERT handling
             # those records that already exists.
             query = """
                 INSERT INTO {target_table}
@@ -142,12 +419,416 @@ class LoadDimensionOperator(BaseOperator):
                 );
             """.format(
                 clause='AND' if 'WHERE' in select_query else 'WHERE',
-                target_table=self._target_table,
-                src_pk_field=self.dimensions[self._dimension],
-                pk_field=self._pk_field,
+                target_table=target_table,
+                src_pk_field=self.dimensions[dimension],
+                pk_field=pk_field,
                 select_query=select_query
             )
 
         # Logs and executes the query.
+        self.run_statement(cursor, query)
+
+    def run_statement(self, cursor, query):
+
+        """
+        Logs and executes a statement.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statement.
+            query (str): The statement.
+
+        Returns:
+            (int): The number of rows affected by the statement.
+        """
+
         self.log.info(query)
-        PostgresHook(postgres_conn_id=self._redshift_conn_id).run(query)
+        cursor.execute(query)
+        return cursor.rowcount
+
+    def merge_statements(self, cursor, dimension, target_table, pk_field, select_query):
+
+        """
+        Runs the statements of the merge mode with a given cursor, without
+        committing them.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            dimension (str): The dimension to load.
+            target_table (str): The name of the table where the records
+                will be inserted.
+            pk_field (str): The name of the PK field of the target table.
+            select_query (str): The query that extracts the dimension data.
+
+        Returns:
+            (tuple): The number of records inserted and updated.
+        """
+
+        merge_table = '{}_merge'.format(target_table.replace('.', '_'))
+        src_pk_field = self.dimensions[dimension]
+
+        # Stages the source records, keeping just one of them per key, the
+        # same one on every run.
+        self.run_statement(cursor, """
+            CREATE TEMPORARY TABLE {merge_table} AS
+            SELECT src.*,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY src.{src_pk_field}
+                       ORDER BY {merge_order}
+                   ) AS merge_row
+              FROM ({select_query}) AS src;
+        """.format(
+            merge_table=merge_table,
+            src_pk_field=src_pk_field,
+            merge_order=self.merge_orders[dimension],
+            select_query=select_query
+        ))
+        self.run_statement(cursor, 'DELETE FROM {} WHERE merge_row > 1;'.format(merge_table))
+
+        # Gets the column names of both tables, so they can be paired.
+        cursor.execute('SELECT * FROM {} LIMIT 0;'.format(merge_table))
+        columns = [c[0] for c in cursor.description if c[0] != 'merge_row']
+        cursor.execute('SELECT * FROM {} LIMIT 0;'.format(target_table))
+        target_columns = [c[0] for c in cursor.description][:len(columns)]
+
+        # The new records are inserted first.
+        inserted = self.run_statement(cursor, """
+            INSERT INTO {target_table} ({target_columns})
+            SELECT {columns}
+              FROM {merge_table}
+             WHERE NOT EXISTS (
+                SELECT 1
+                  FROM {target_table}
+                 WHERE {merge_table}.{src_pk_field} = {target_table}.{pk_field}
+             );
+        """.format(
+            target_table=target_table,
+            target_columns=', '.join(target_columns),
+            columns=', '.join(columns),
+            merge_table=merge_table,
+            src_pk_field=src_pk_field,
+            pk_field=pk_field
+        ))
+
+        updated = 0
+        if self._merge_update:
+
+            # Those records that have not changed are left alone, and so are
+            # the new ones, already inserted.
+            self.run_statement(cursor, """
+                DELETE FROM {merge_table}
+                 USING {target_table}
+                 WHERE {merge_table}.{src_pk_field} = {target_table}.{pk_field}
+                   AND {unchanged};
+            """.format(
+                merge_table=merge_table,
+                target_table=target_table,
+                src_pk_field=src_pk_field,
+                pk_field=pk_field,
+                unchanged='\n                   AND '.join(
+                    '({m}.{c} = {t}.{tc} OR ({m}.{c} IS NULL AND {t}.{tc} IS NULL))'.format(
+                        m=merge_table,
+                        c=column,
+                        t=target_table,
+                        tc=target_column
+                    )
+                    for column, target_column in zip(columns, target_columns)
+                )
+            ))
+
+            # The changed records are deleted, and inserted again.
+            self.run_statement(cursor, """
+                DELETE FROM {target_table}
+                 USING {merge_table}
+                 WHERE {target_table}.{pk_field} = {merge_table}.{src_pk_field};
+            """.format(
+                merge_table=merge_table,
+                target_table=target_table,
+                src_pk_field=src_pk_field,
+                pk_field=pk_field
+            ))
+            updated = self.run_statement(cursor, """
+                INSERT INTO {target_table} ({target_columns})
+                SELECT {columns}
+                  FROM {merge_table};
+            """.format(
+                target_table=target_table,
+                target_columns=', '.join(target_columns),
+                columns=', '.join(columns),
+                merge_table=merge_table
+            ))
+
+        self.run_statement(cursor, 'DROP TABLE {};'.format(merge_table))
+
+        message = 'The table {} has been merged: {} records inserted, {} records updated.'
+        self.log.info(message.format(target_table, inserted, updated))
+
+        return inserted, updated
+
+    def scd2_statements(self, cursor, dimension, target_table, pk_field, versions_query):
+
+        """
+        Runs the statements of the scd2 mode with a given cursor, without
+        committing them. Only the keys found in the staging data are
+        touched: their current version is closed when a tracked field has
+        changed, and the new versions are opened.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            dimension (str): The dimension to load.
+            target_table (str): The name of the table where the records
+                will be inserted.
+            pk_field (str): The name of the PK field of the target table.
+            versions_query (str): The query that extracts every version of
+                the dimension data found in the staging data, along with the
+                time it came into effect, as 'valid_from'.
+
+        Returns:
+            (tuple): The number of versions closed and opened.
+        """
+
+        versions_table = '{}_versions'.format(target_table)
+        src_pk_field = self.dimensions[dimension]
+        tracked_fields = self.scd2_dimensions[dimension]
+
+        # Stages the versions found in the staging data.
+        self.run_statement(cursor, """
+            CREATE TEMPORARY TABLE {versions_table} AS
+            {versions_query};
+        """.format(
+            versions_table=versions_table,
+            versions_query=versions_query
+        ))
+
+        # Gets the column names of both tables, so they can be paired.
+        cursor.execute('SELECT * FROM {} LIMIT 0;'.format(versions_table))
+        columns = [c[0] for c in cursor.description if c[0] != 'valid_from']
+        cursor.execute('SELECT * FROM {} LIMIT 0;'.format(target_table))
+        target_columns = [c[0] for c in cursor.description][:len(columns)]
+        target_tracked_fields = [target_columns[columns.index(f)] for f in tracked_fields]
+
+        # Those versions already known by the target table are discarded.
+        self.run_statement(cursor, """
+            DELETE FROM {versions_table}
+             USING {target_table}
+             WHERE {versions_table}.{src_pk_field} = {target_table}.{pk_field}
+               AND {target_table}.is_current
+               AND {versions_table}.valid_from <= {target_table}.valid_from;
+        """.format(
+            versions_table=versions_table,
+            target_table=target_table,
+            src_pk_field=src_pk_field,
+            pk_field=pk_field
+        ))
+
+        # The first version of a key is discarded too when its tracked
+        # fields are the same as those of the current version.
+        self.run_statement(cursor, """
+            DELETE FROM {versions_table}
+             USING {target_table},
+                   (SELECT {src_pk_field}, MIN(valid_from) AS valid_from
+                      FROM {versions_table}
+                     GROUP BY {src_pk_field}) AS first_versions
+             WHERE {versions_table}.{src_pk_field} = {target_table}.{pk_field}
+               AND {versions_table}.{src_pk_field} = first_versions.{src_pk_field}
+               AND {versions_table}.valid_from = first_versions.valid_from
+               AND {target_table}.is_current
+               AND {unchanged};
+        """.format(
+            versions_table=versions_table,
+            target_table=target_table,
+            src_pk_field=src_pk_field,
+            pk_field=pk_field,
+            unchanged='\n               AND '.join(
+                '{v}.{f} = {t}.{tf}'.format(v=versions_table, f=field, t=target_table, tf=target_field)
+                for field, target_field in zip(tracked_fields, target_tracked_fields)
+            )
+        ))
+
+        # Closes the current version of the keys that have changed.
+        closed = self.run_statement(cursor, """
+            UPDATE {target_table}
+               SET valid_to = first_versions.valid_from,
+                   is_current = FALSE
+              FROM (SELECT {src_pk_field}, MIN(valid_from) AS valid_from
+                      FROM {versions_table}
+                     GROUP BY {src_pk_field}) AS first_versions
+             WHERE {target_table}.{pk_field} = first_versions.{src_pk_field}
+               AND {target_table}.is_current;
+        """.format(
+            versions_table=versions_table,
+            target_table=target_table,
+            src_pk_field=src_pk_field,
+            pk_field=pk_field
+        ))
+
+        # Opens the new versions. Each one is valid until the next one
+        # comes into effect, and only the last one is current.
+        opened = self.run_statement(cursor, """
+            INSERT INTO {target_table} ({target_columns}, valid_from, valid_to, is_current)
+            SELECT {columns},
+                   valid_from,
+                   COALESCE(next_valid_from, TIMESTAMP '9999-12-31 00:00:00'),
+                   next_valid_from IS NULL
+              FROM (SELECT {versions_table}.*,
+                           LEAD(valid_from) OVER (
+                               PARTITION BY {src_pk_field}
+                               ORDER BY valid_from
+                           ) AS next_valid_from
+                      FROM {versions_table}) AS src;
+        """.format(
+            target_table=target_table,
+            target_columns=', '.join(target_columns),
+            columns=', '.join(columns),
+            src_pk_field=src_pk_field,
+            versions_table=versions_table
+        ))
+
+        self.run_statement(cursor, 'DROP TABLE {};'.format(versions_table))
+
+        message = 'The table {} has been versioned: {} versions closed, {} versions opened.'
+        self.log.info(message.format(target_table, closed, opened))
+
+        return closed, opened
+
+    def calendar_statements(self, cursor, dimension, target_table, pk_field):
+
+        """
+        Runs the statements of the calendar mode with a given cursor, without
+        committing them. Every timestamp of the calendar range is generated,
+        except those already in the target table, so the range can be
+        extended later on, and the gaps left by sparse loads are filled.
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            dimension (str): The dimension to load.
+            target_table (str): The name of the table where the records
+                will be inserted.
+            pk_field (str): The name of the PK field of the target table.
+
+        Returns:
+            (int): The number of timestamps inserted.
+        """
+
+        start_date = parse_date(self._calendar_start_date)
+        end_date = parse_date(self._calendar_end_date)
+        interval = int(self._calendar_interval.total_seconds())
+        steps = int((end_date - start_date).total_seconds()) // interval + 1
+
+        # The steps are numbered crossing one table of digits per power of ten.
+        digits = len(str(steps - 1))
+
+        calendar_query = SqlQueries.time_table_calendar.strip().format(
+            start_date=start_date.strftime('%Y-%m-%d %H:%M:%S'),
+            interval=interval,
+            step=' + '.join('d{}.d * {}'.format(i, 10 ** i) for i in range(digits)),
+            digits=' CROSS JOIN '.join(
+                '{} AS d{}'.format(SqlQueries.calendar_digits.strip(), i)
+                for i in range(digits)
+            ),
+            steps=steps
+        )
+
+        query = """
+            INSERT INTO {target_table}
+            {calendar_query}
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM {target_table}
+                WHERE src.{src_pk_field} = {target_table}.{pk_field}
+            );
+        """.format(
+            target_table=target_table,
+            calendar_query=calendar_query,
+            src_pk_field=self.dimensions[dimension],
+            pk_field=pk_field
+        )
+
+        inserted = self.run_statement(cursor, query)
+
+        message = 'The calendar {} has been extended with {} timestamps.'
+        self.log.info(message.format(target_table, inserted))
+
+        return inserted
+
+    def swap_statements(self, cursor, target_table, select_query):
+
+        """
+        Runs the statements of the swap mode with a given cursor, without
+        committing them. The dimension is rebuilt into '<table>__new',
+        created like the target table, with its default values, and granted
+        the same privileges, which is then renamed to the target table,
+        while the target table is renamed to '<table>__old'. Until the
+        transaction commits, readers keep reading the previous version, and
+        a single INSERT into an empty table leaves it fully sorted, as a deep
+        copy does. The previous version can be restored by renaming the
+        tables back.
+
+        An ordinary view on the target table would follow it to
+        '<table>__old', and then stop the next swap from dropping it, so the
+        swap is refused when there is any. The views on a swapped dimension
+        must be late-binding ones (WITH NO SCHEMA BINDING).
+
+        Parameters:
+            cursor (cursor): The cursor used to run the statements.
+            target_table (str): The name of the table to rebuild.
+            select_query (str): The query that extracts the dimension data.
+
+        Returns:
+            (int): The number of records of the rebuilt table.
+
+        Raises:
+            ValueError: if an ordinary view depends on the target table.
+        """
+
+        schema, _, name = target_table.rpartition('.')
+        schema = schema or 'public'
+
+        cursor.execute(SqlQueries.table_dependent_views, (schema, name))
+        views = sorted(view for view, in cursor.fetchall())
+        if views:
+            message = 'The table {} cannot be swapped, since the views {} depend on it. ' \
+                'Create them WITH NO SCHEMA BINDING instead.'
+            raise ValueError(message.format(target_table, ', '.join(views)))
+
+        cursor.execute(SqlQueries.table_acl, (schema, name))
+        acl, owner = cursor.fetchone() or (None, None)
+
+        # The tables are renamed within their schema.
+        new_table = '{}__new'.format(target_table)
+        old_table = '{}__old'.format(target_table)
+
+        self.run_statement(cursor, SqlQueries.staging_table_drop.strip().format(new_table))
+        self.run_statement(cursor, SqlQueries.dimension_table_create_like.strip().format(new_table, target_table))
+
+        # The query may give fewer columns than the table has, like the
+        # validity columns of the users, which take their default values.
+        cursor.execute('SELECT * FROM ({}) AS src LIMIT 0;'.format(select_query))
+        columns = len(cursor.description)
+        cursor.execute('SELECT * FROM {} LIMIT 0;'.format(target_table))
+        target_columns = [c[0] for c in cursor.description][:columns]
+
+        inserted = self.run_statement(cursor, """
+            INSERT INTO {new_table} ({target_columns})
+            {select_query};
+        """.format(
+            new_table=new_table,
+            target_columns=', '.join(target_columns),
+            select_query=select_query
+        ))
+
+        # The grants of the target table are not copied by LIKE.
+        for query in grant_statements(new_table, acl, owner):
+            self.run_statement(cursor, query)
+
+        self.run_statement(cursor, SqlQueries.staging_table_drop.strip().format(old_table))
+        self.run_statement(cursor, SqlQueries.dimension_table_swap.strip().format(
+            target_table=target_table,
+            new_table=new_table,
+            old_name='{}__old'.format(name),
+            name=name
+        ))
+
+        message = 'The table {} has been rebuilt with {} records, and swapped in. The previous version is {}.'
+        self.log.info(message.format(target_table, inserted, old_table))
+
+        return inserted
@@ -0,0 +1,141 @@
+from airflow.utils.decorators import apply_defaults
+from helpers import SqlQueries
+from helpers.instrumentation import reports_failures
+from helpers.staging import resolve_staging_tables
+from operators.load_dimension import LoadDimensionOperator
+
+
+class LoadDimensionsOperator(LoadDimensionOperator):
+
+    ui_color = '#80BD9E'
+
+    # The staging table every dimension is extracted from.
+    dimension_sources = {
+        'artists': 'staging_songs',
+        'users': 'staging_events',
+        'songs': 'staging_songs',
+        'time': None
+    }
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        dimensions=None,
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class LoadDimensionsOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier.
+            dimensions (dict): The dimensions to load, by name. The value of
+                every dimension is a dict with the keys 'target_table',
+                'mode' (truncate by default) and 'pk_field', with the same
+                meaning as in LoadDimensionOperator.
+
+        The rest of the parameters of LoadDimensionOperator, like
+        merge_update or statement_timeout, are shared by all the dimensions.
+        """
+
+        super(LoadDimensionsOperator, self).__init__(
+            redshift_conn_id=redshift_conn_id,
+            *args,
+            **kwargs
+        )
+        self._dimensions = dimensions
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the dimensions dict is valid.
+        if self._dimensions is None \
+                or not isinstance(self._dimensions, dict) \
+                or len(self._dimensions) == 0:
+            raise ValueError('The dimensions dict cannot be null or empty.')
+
+        # Checks if the merge update flag is valid.
+        if self._merge_update is None \
+                or not isinstance(self._merge_update, bool):
+            raise ValueError('The merge update flag must be boolean.')
+
+        # Every dimension is validated as a single dimension load would.
+        for dimension, load in self._dimensions.items():
+            if not isinstance(load, dict):
+                raise ValueError('The load of the dimension {} must be a dict.'.format(dimension))
+            self.check_invalid_load(
+                dimension,
+                load.get('target_table'),
+                load.get('pk_field'),
+                load.get('mode', 'truncate')
+            )
+
+    @reports_failures
+    def execute(self, context):
+
+        """
+        Extracts the data of the given dimensions from the stage tables and
+        writes it to their target tables, in a single transaction. Every
+        staging table read by more than one dimension is scanned once into
+        a temporary table, and the dimensions are extracted from it.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        # Counts how many dimensions read every staging table.
+        readers = {}
+        for dimension in self._dimensions:
+            source = self.dimension_sources[dimension]
+            if source is not None:
+                readers[source] = readers.get(source, 0) + 1
+
+        # The staging tables of the current run.
+        staging_tables = resolve_staging_tables(context, self._staging_tasks)
+
+        with self._session.transaction() as cursor:
+
+            # Materializes the staging tables shared by several dimensions.
+            sources = dict(staging_tables)
+            for source, count in sorted(readers.items()):
+                if count > 1:
+                    sources[source] = 'dimensions_{}'.format(source)
+                    self.run_statement(cursor, """
+                        CREATE TEMPORARY TABLE {} AS
+                        {};
+                    """.format(
+                        sources[source],
+                        getattr(SqlQueries, '{}_dimensions_source'.format(source)).strip().format(
+                            **staging_tables
+                        )
+                    ))
+
+            for dimension, load in sorted(self._dimensions.items()):
+                self.load_statements(
+                    cursor,
+                    dimension,
+                    load['target_table'],
+                    load.get('pk_field'),
+                    load.get('mode', 'truncate'),
+                    sources,
+                    transactional=True,
+                    window=self.get_window(context)
+                )
+                self.log.info('The dimension {} has been loaded.'.format(dimension))
@@ -1,18 +1,31 @@
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
-from helpers import SqlQueries
+from helpers import RedshiftSession, SqlQueries
+from helpers.instrumentation import report_statements, reports_failures
+from helpers.staging import resolve_staging_tables
 
 
 class LoadFactOperator(BaseOperator):
 
     ui_color = '#F98866'
 
+    # The whole range of the ts column, used when the load is not scoped.
+    min_ts = 0
+    max_ts = 2 ** 63 - 1
+
+    publish_modes = ('insert', 'append')
+
     @apply_defaults
     def __init__(
         self,
         redshift_conn_id=None,
         target_table=None,
+        window_scoped=False,
+        lookup_table=SqlQueries.song_lookup_table,
+        staging_tasks=None,
+        publish_mode='insert',
+        statement_timeout=None,
+        metrics_sink=None,
         *args,
         **kwargs
     ):
@@ -24,11 +37,40 @@ class LoadFactOperator(BaseOperator):
             redshift_conn_id (str): The Redshift connection identifier.
             target_table (str): The name of the table where the records
                 will be inserted.
+            window_scoped (bool): When True, only the events of the run
+                interval (from the execution date to the next one) are
+                loaded, replacing those already loaded for the same interval,
+                so retries and backfills are idempotent.
+            lookup_table (str): The name of the table that matches the
+                events with their songs. The songs staged since the last run
+                are added to it before the records are inserted.
+            staging_tasks (dict): The identifier of the task that stages
+                every staging table the queries read, by the name of its
+                placeholder (e.g. {'staging_events': 'Stage_events'}). The
+                table each task pushed to XCom is read instead of the default
+                one, so the queries only scan the data of the current run.
+            publish_mode (str): How the records reach the target table.
+                'insert' inserts them straight away. 'append' builds them in
+                a scratch table created like the target one, validates them,
+                and moves them with ALTER TABLE APPEND, which moves the
+                storage blocks instead of copying the rows, so they arrive
+                sorted and all at once.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
         """
 
         super(LoadFactOperator, self).__init__(*args, **kwargs)
         self._redshift_conn_id = redshift_conn_id
         self._target_table = target_table
+        self._window_scoped = window_scoped
+        self._lookup_table = lookup_table
+        self._staging_tasks = staging_tasks
+        self._publish_mode = publish_mode
+        self._session = RedshiftSession(redshift_conn_id, statement_timeout=statement_timeout)
+        self._metrics_sink = metrics_sink
 
     def check_invalid_params(self):
 
@@ -51,6 +93,56 @@ class LoadFactOperator(BaseOperator):
                 or self._target_table.strip() == '':
             raise ValueError('The target table cannot be null or empty.')
 
+        # Checks if the window scoped flag is valid.
+        if self._window_scoped is None \
+                or not isinstance(self._window_scoped, bool):
+            raise ValueError('The window scoped flag must be boolean.')
+
+        # Checks if the lookup table is valid.
+        if self._lookup_table is None \
+                or not isinstance(self._lookup_table, str) \
+                or self._lookup_table.strip() == '':
+            raise ValueError('The lookup table cannot be null or empty.')
+
+        # Checks if the publish mode is valid.
+        if self._publish_mode not in self.publish_modes:
+            message = 'Available values for the publish mode: {}'
+            raise ValueError(message.format(', '.join(self.publish_modes)))
+
+    def get_window(self, context):
+
+        """
+        Gets the run interval as a range of epoch milliseconds, the unit of
+        the ts column of the staging events.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+
+        Returns:
+            (tuple): The start (included) and end (excluded) of the interval.
+        """
+
+        if not self._window_scoped:
+            return self.min_ts, self.max_ts
+
+        return (
+            int(context['execution_date'].timestamp() * 1000),
+            int(context['next_execution_date'].timestamp() * 1000)
+        )
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
     def execute(self, context):
 
         """
@@ -64,12 +156,239 @@ class LoadFactOperator(BaseOperator):
         # Validates the operator parameteres.
         self.check_invalid_params()
 
-        # Builds the query.
+        start_ts, end_ts = self.get_window(context)
+
+        # The placeholders of the queries.
+        tables = dict(
+            resolve_staging_tables(context, self._staging_tasks),
+            song_lookup=self._lookup_table
+        )
+
+        # Builds the queries. The append mode inserts into a scratch table.
+        insert_table = self._target_table if self._publish_mode == 'insert' \
+            else '{}_publish_{}'.format(self._target_table, context['ts_nodash'].lower())
+        lookup_query = SqlQueries.song_lookup_table_insert.strip().format(**tables)
         query = 'INSERT INTO {} {}'.format(
-            self._target_table,
-            SqlQueries.songplays_table_insert.strip()
+            insert_table,
+            SqlQueries.songplays_table_insert.strip().format(
+                start_ts=start_ts,
+                end_ts=end_ts,
+                **tables
+            )
+        )
+        match_query = SqlQueries.songplays_match_count.strip().format(
+            start_ts=start_ts,
+            end_ts=end_ts,
+            **tables
         )
 
-        # Logs and executes the query.
+        if self._publish_mode == 'append':
+            deleted, inserted, plays, matched = self.publish(context, lookup_query, query, match_query, insert_table)
+            self.report(context, deleted, inserted, plays, matched)
+            return
+
+        # The lookup table is maintained and read in the same transaction
+        # as the load. When the load is window scoped, the slice of the run
+        # interval is deleted and inserted again, so readers never see it
+        # half loaded.
+        with self._session.transaction() as cursor:
+
+            self.log.info(lookup_query)
+            cursor.execute(lookup_query)
+            self.log.info('{} songs added to the table {}.'.format(cursor.rowcount, self._lookup_table))
+
+            if self._window_scoped:
+                delete_query = SqlQueries.songplays_table_delete.strip().format(
+                    self._target_table,
+                    start_ts,
+                    end_ts
+                )
+                self.log.info(delete_query)
+                cursor.execute(delete_query)
+                deleted = cursor.rowcount
+
+            self.log.info(query)
+            cursor.execute(query)
+            inserted = cursor.rowcount
+
+            cursor.execute(match_query)
+            plays, matched = cursor.fetchone()
+
+        self.report(context, deleted if self._window_scoped else None, inserted, plays, matched)
+
+    def report(self, context, deleted, inserted, plays, matched):
+
+        """
+        Logs the outcome of the load, and pushes it to XCom.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            deleted (int): The number of records deleted, or None when the
+                load is not window scoped.
+            inserted (int): The number of records inserted.
+            plays (int): The number of plays of the run.
+            matched (int): The number of plays matched with a song.
+        """
+
+        # Reports the rate of plays matched with a song.
+        unmatched = plays - matched
+        match_rate = float(matched) / plays if plays else 1.0
+        message = 'Songs matched for {} of {} plays ({:.2%}), {} plays unmatched.'
+        self.log.info(message.format(matched, plays, match_rate, unmatched))
+
+        self.xcom_push(context, 'matched_plays', matched)
+        self.xcom_push(context, 'unmatched_plays', unmatched)
+        self.xcom_push(context, 'match_rate', match_rate)
+
+        if not self._window_scoped:
+            self.log.info('The table {} has been loaded: {} records inserted.'.format(self._target_table, inserted))
+            return
+
+        message = 'The table {} has been loaded: {} records deleted, {} records inserted.'
+        self.log.info(message.format(self._target_table, deleted, inserted))
+
+        self.xcom_push(context, 'deleted_rows', deleted)
+        self.xcom_push(context, 'inserted_rows', inserted)
+
+    def publish(self, context, lookup_query, insert_query, match_query, scratch_table):
+
+        """
+        Loads the records through a scratch table, created like the target
+        table. The records are inserted and validated there, and then moved
+        into the target table with ALTER TABLE APPEND, which cannot run in a
+        transaction block but is atomic by itself: readers see either none
+        or all the records of the run.
+
+        When the load is window scoped and the target table already holds
+        records of the run interval, e.g. on a rerun, they are replaced in a
+        single transaction instead: the slice is deleted and the records of
+        the scratch table are inserted, so readers never see the interval
+        empty or half loaded. Should the append or the replacement fail, the
+        scratch table is kept for inspection, and the retry builds it again.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            lookup_query (str): The query that maintains the lookup table.
+            insert_query (str): The query that inserts into the scratch table.
+            match_query (str): The query that counts the matched plays.
+            scratch_table (str): The name of the scratch table.
+
+        Returns:
+            (tuple): The number of records deleted (None when the load is not
+                window scoped), the number of records inserted, the number
+                of plays and the number of plays matched with a song.
+
+        Raises:
+            ValueError: if the records of the scratch table are not valid.
+        """
+
+        start_ts, end_ts = self.get_window(context)
+
+        # A scratch table left behind by a failed try is discarded.
+        with self._session.transaction() as cursor:
+
+            self.log.info(lookup_query)
+            cursor.execute(lookup_query)
+            self.log.info('{} songs added to the table {}.'.format(cursor.rowcount, self._lookup_table))
+
+            cursor.execute(SqlQueries.staging_table_drop.strip().format(scratch_table))
+            cursor.execute(SqlQueries.staging_table_create_like.strip().format(scratch_table, self._target_table))
+
+            self.log.info(insert_query)
+            cursor.execute(insert_query)
+            inserted = cursor.rowcount
+
+            cursor.execute(match_query)
+            plays, matched = cursor.fetchone()
+
+        try:
+            self.validate_scratch_table(scratch_table, start_ts, end_ts)
+        except ValueError:
+            self._session.run(SqlQueries.staging_table_drop.strip().format(scratch_table))
+            raise
+
+        deleted = None
+        if self._window_scoped:
+            deleted = 0
+            loaded = self._session.get_records(SqlQueries.songplays_window_count.strip().format(
+                self._target_table,
+                start_ts,
+                end_ts
+            ))[0][0]
+
+            # The slice of a rerun is replaced in a single transaction.
+            if loaded > 0:
+                with self._session.transaction() as cursor:
+                    delete_query = SqlQueries.songplays_table_delete.strip().format(
+                        self._target_table,
+                        start_ts,
+                        end_ts
+                    )
+                    self.log.info(delete_query)
+                    cursor.execute(delete_query)
+                    deleted = cursor.rowcount
+
+                    query = SqlQueries.fact_table_insert_from.strip().format(self._target_table, scratch_table)
+                    self.log.info(query)
+                    cursor.execute(query)
+
+                    cursor.execute(SqlQueries.staging_table_drop.strip().format(scratch_table))
+
+                return deleted, inserted, plays, matched
+
+        query = SqlQueries.fact_table_append.strip().format(self._target_table, scratch_table)
         self.log.info(query)
-        PostgresHook(postgres_conn_id=self._redshift_conn_id).run(query)
+        self._session.run(query, autocommit=True)
+
+        # The scratch table is only dropped once its records are published.
+        self._session.run(SqlQueries.staging_table_drop.strip().format(scratch_table))
+
+        return deleted, inserted, plays, matched
+
+    def validate_scratch_table(self, scratch_table, start_ts, end_ts):
+
+        """
+        Validates the records of the scratch table before they are published:
+        their keys must be unique, and within the run interval when the load
+        is window scoped, or not loaded yet when it is not.
+
+        Parameters:
+            scratch_table (str): The name of the scratch table.
+            start_ts (int): The start (included) of the run interval.
+            end_ts (int): The end (excluded) of the run interval.
+
+        Raises:
+            ValueError: if any of the records is not valid.
+        """
+
+        # The whole range of the ts column is too wide for a timestamp, and
+        # every record is within it anyway.
+        outside_expression = '0'
+        if self._window_scoped:
+            outside_expression = SqlQueries.songplays_publish_outside.strip().format(start_ts, end_ts)
+
+        records, keys, outside = self._session.get_records(SqlQueries.songplays_publish_validation.strip().format(
+            scratch_table,
+            outside_expression
+        ))[0]
+
+        loaded = 0
+        if not self._window_scoped:
+            loaded = self._session.get_records(SqlQueries.songplays_publish_overlap.strip().format(
+                scratch_table,
+                self._target_table
+            ))[0][0]
+
+        errors = []
+        if keys != records:
+            errors.append('{} duplicated keys'.format(records - keys))
+        if outside:
+            errors.append('{} records outside the run interval'.format(outside))
+        if loaded:
+            errors.append('{} records already loaded'.format(loaded))
+
+        if errors:
+            message = 'The records of the table {} cannot be published: {}.'
+            raise ValueError(message.format(scratch_table, ', '.join(errors)))
+
+        self.log.info('The {} records of the table {} are valid.'.format(records, scratch_table))
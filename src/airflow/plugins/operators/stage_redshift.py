@@ -1,7 +1,40 @@
-from airflow.hooks.postgres_hook import PostgresHook
+from airflow.hooks.S3_hook import S3Hook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
-from helpers import SqlQueries
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from helpers import RedshiftSession, SqlQueries
+from helpers.instrumentation import report_statements, reports_failures
+from helpers.ledger import (
+    loaded_objects,
+    new_objects,
+    record_objects
+)
+from helpers.load_errors import (
+    CopyError,
+    build_quarantine,
+    copy_marker,
+    drop_rejected_lines,
+    failing_files,
+    get_load_errors
+)
+from helpers.local_engine import (
+    LOCAL_FORMATS,
+    list_local_objects,
+    write_local_object
+)
+from helpers.manifest import (
+    build_manifest,
+    join_s3_url,
+    list_objects,
+    render_key,
+    split_s3_url,
+    window_contexts
+)
+from helpers.object_store import ObjectStore
+from helpers.staging import STAGING_MODES, run_table_name
+import hashlib
+import time
 
 
 class StageToRedshiftOperator(BaseOperator):
@@ -16,6 +49,22 @@ class StageToRedshiftOperator(BaseOperator):
         s3_prefix=None,
         target_table=None,
         json_path='auto',
+        format='json',
+        s3_key=None,
+        backfill_start_date=None,
+        backfill_end_date=None,
+        backfill_interval=timedelta(days=1),
+        aws_conn_id='aws_default',
+        manifest_prefix=None,
+        ledger_table=None,
+        fan_out=1,
+        fan_out_by='hash',
+        statement_timeout=None,
+        max_errors=0,
+        fix_up=None,
+        quarantine_prefix=None,
+        staging_mode='shared',
+        metrics_sink=None,
         *args,
         **kwargs
     ):
@@ -34,6 +83,71 @@ class StageToRedshiftOperator(BaseOperator):
             json_path (str): The path to the JSON file that contains the
                 links to the individual files from the source data that
                 must be copied.
+            format (str): The format of the source data. Available options
+                are: 'json', 'json_gzip' (gzipped JSON), 'csv' (gzipped, with
+                no header), 'parquet' and 'orc'. The columns of the columnar
+                formats are loaded by position, so they must follow the order
+                of the target table. The local engine cannot read 'csv' nor
+                'orc'.
+            s3_key (str): An optional key pattern, relative to the S3 prefix,
+                rendered with the task context using the str.format syntax,
+                e.g. '{execution_date:%Y/%m}/{ds}-events.json'. When given,
+                only the matching partition is copied.
+            backfill_start_date (datetime|str): The first date of an optional
+                backfill window. The key pattern is rendered once per step
+                and the whole window is copied at once through a manifest.
+            backfill_end_date (datetime|str): The last date (included) of the
+                backfill window.
+            backfill_interval (timedelta): The distance between two steps of
+                the backfill window.
+            aws_conn_id (str): The AWS connection identifier, used to list
+                the source objects and to write the manifests.
+            manifest_prefix (str): The S3 prefix where the COPY manifests
+                are written.
+            ledger_table (str): The name of an optional table that records
+                every object loaded so far. When given, the prefix is listed
+                and only those objects not loaded yet are copied, through a
+                manifest.
+            fan_out (int): The number of groups the objects are split into
+                when copied through manifests. The groups are copied
+                concurrently, and every group is checkpointed in the ledger
+                table, so a retry resumes the unfinished groups only.
+            fan_out_by (str): How the objects are split: 'hash' spreads
+                them by the hash of their key, while 'date' splits the
+                sorted keys into contiguous ranges.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            max_errors (int): The number of records a COPY query can reject
+                before it fails (MAXERROR). The rejected records are read
+                from STL_LOAD_ERRORS, logged and pushed to XCom under the
+                key 'load_errors', whether the query fails or not.
+            fix_up (callable|str): What to do with the files of a failed
+                COPY query. Their load errors are read, the rest of the
+                files are copied on their own, and then the fix-up is called
+                with the context and the errors of every failing file, by
+                S3 URL. It returns the S3 URL of a fixed copy of every file,
+                by the URL of the file, and the copies are loaded instead,
+                again and again until no errors remain. The source files are
+                never written. The value 'quarantine' writes copies without
+                the rejected lines, and those lines, into the quarantine
+                prefix. It requires the ledger table, so a later retry skips
+                the files already loaded.
+            quarantine_prefix (str): The S3 prefix where the 'quarantine'
+                fix-up writes, under a subdirectory named after the run
+                timestamp (ts_nodash), the cleaned copies of the failing
+                files into 'cleaned' and their rejected lines into
+                'rejected'.
+            staging_mode (str): How the target table is written: 'shared'
+                appends to it, 'truncate' empties it first, and 'run' copies
+                into a table of the current run, created like the target
+                table and named after it and the run timestamp. Either way,
+                the table copied into is pushed to XCom under the key
+                'staging_table'. The ledger table, if any, keeps recording
+                the objects under the name of the target table, so the
+                objects loaded by previous runs are skipped.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
         """
 
         super(StageToRedshiftOperator, self).__init__(*args, **kwargs)
@@ -42,6 +156,28 @@ class StageToRedshiftOperator(BaseOperator):
         self._s3_prefix = s3_prefix
         self._target_table = target_table
         self._json_path = json_path
+        self._format = format
+        self._s3_key = s3_key
+        self._backfill_start_date = backfill_start_date
+        self._backfill_end_date = backfill_end_date
+        self._backfill_interval = backfill_interval
+        self._aws_conn_id = aws_conn_id
+        self._manifest_prefix = manifest_prefix
+        self._ledger_table = ledger_table
+        self._fan_out = fan_out
+        self._fan_out_by = fan_out_by
+        self._max_errors = max_errors
+        self._fix_up = fix_up
+        self._quarantine_prefix = quarantine_prefix
+        self._staging_mode = staging_mode
+        self._staging_table = target_table
+        self._load_errors = []
+        self._session = RedshiftSession(
+            redshift_conn_id,
+            statement_timeout=statement_timeout,
+            max_connections=max(fan_out, 1)
+        )
+        self._metrics_sink = metrics_sink
 
     def check_invalid_params(self):
 
@@ -76,6 +212,344 @@ class StageToRedshiftOperator(BaseOperator):
                 or self._target_table.strip() == '':
             raise ValueError('The target table cannot be null or empty.')
 
+        # Checks if the format is valid.
+        if self._format not in SqlQueries.staging_table_copy_formats:
+            message = 'Available values for the format: {}'
+            raise ValueError(message.format(', '.join(sorted(SqlQueries.staging_table_copy_formats))))
+
+        # Checks if the format can be read by the local engine, if targeted.
+        if self._format not in LOCAL_FORMATS and self._session.data_root is not None:
+            message = 'The {} format is not supported by the local engine. Available values: {}'
+            raise ValueError(message.format(self._format, ', '.join(LOCAL_FORMATS)))
+
+        # Checks if the backfill window is valid.
+        if (self._backfill_start_date is None) != (self._backfill_end_date is None):
+            raise ValueError('The backfill window needs both a start and an end date.')
+
+        if self._backfill_start_date is not None \
+                and (
+                    self._s3_key is None
+                    or not isinstance(self._s3_key, str)
+                    or self._s3_key.strip() == ''
+                ):
+            raise ValueError('The S3 key pattern cannot be null or empty when backfilling.')
+
+        # Checks if the manifest prefix is valid.
+        if (self._backfill_start_date is not None or self._ledger_table is not None) \
+                and (
+                    self._manifest_prefix is None
+                    or not isinstance(self._manifest_prefix, str)
+                    or self._manifest_prefix.strip() == ''
+                ):
+            raise ValueError('The manifest prefix cannot be null or empty when backfilling or using a ledger.')
+
+        # Checks if the fan-out is valid.
+        if not isinstance(self._fan_out, int) or self._fan_out < 1:
+            raise ValueError('The fan-out must be a positive integer.')
+
+        if self._fan_out > 1 and self._ledger_table is None:
+            raise ValueError('The ledger table cannot be null when the fan-out is greater than 1.')
+
+        if self._fan_out_by not in ('hash', 'date'):
+            raise ValueError('Available values for the fan-out split: hash, date')
+
+        # Checks if the staging mode is valid.
+        if self._staging_mode not in STAGING_MODES:
+            message = 'Available values for the staging mode: {}'
+            raise ValueError(message.format(', '.join(STAGING_MODES)))
+
+        if self._staging_mode == 'truncate' and self._ledger_table is not None:
+            raise ValueError('The ledger table cannot be used with the truncate staging mode.')
+
+        # Checks if the maximum number of errors is valid.
+        if not isinstance(self._max_errors, int) or self._max_errors < 0:
+            raise ValueError('The maximum number of errors must be a non-negative integer.')
+
+        # Checks if the fix-up is valid.
+        if self._fix_up is not None and not callable(self._fix_up) and self._fix_up != 'quarantine':
+            raise ValueError("The fix-up must be either a callable or 'quarantine'.")
+
+        if self._fix_up is not None and self._ledger_table is None:
+            raise ValueError('The ledger table cannot be null when a fix-up is given.')
+
+        if self._fix_up == 'quarantine' \
+                and (
+                    self._quarantine_prefix is None
+                    or not isinstance(self._quarantine_prefix, str)
+                    or self._quarantine_prefix.strip() == ''
+                ):
+            raise ValueError("The quarantine prefix cannot be null or empty for the 'quarantine' fix-up.")
+
+        if self._fix_up == 'quarantine' and self._format not in ('json', 'json_gzip', 'csv'):
+            raise ValueError("The 'quarantine' fix-up only supports the line based formats: json, json_gzip, csv")
+
+    def get_source_prefixes(self, context):
+
+        """
+        Gets the S3 prefixes that must be copied by the current run.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+
+        Returns:
+            (list): The S3 prefixes, without duplicates.
+        """
+
+        # Without a key pattern, the whole prefix is copied.
+        if self._s3_key is None:
+            return [self._s3_prefix]
+
+        # Renders the key pattern once per step of the backfill window,
+        # or just once for the current execution date.
+        if self._backfill_start_date is not None:
+            contexts = window_contexts(
+                context,
+                self._backfill_start_date,
+                self._backfill_end_date,
+                self._backfill_interval
+            )
+        else:
+            contexts = [context]
+
+        prefixes = []
+        for step_context in contexts:
+            prefix = join_s3_url(self._s3_prefix, render_key(self._s3_key, step_context))
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+
+        return prefixes
+
+    def list_source_objects(self, prefixes):
+
+        """
+        Lists the objects stored under the given prefixes.
+
+        Parameters:
+            prefixes (list): The S3 prefixes to list.
+
+        Returns:
+            (list): The objects, as returned by list_objects.
+        """
+
+        # All the prefixes live in the bucket of the source S3 prefix.
+        bucket, _ = split_s3_url(self._s3_prefix)
+
+        # The local engine reads the objects from a local directory.
+        data_root = self._session.data_root
+        client = S3Hook(aws_conn_id=self._aws_conn_id).get_conn() if data_root is None else None
+
+        objects = []
+        for prefix in prefixes:
+            _, key = split_s3_url(prefix)
+            if data_root is None:
+                objects.extend(list_objects(client, bucket, key))
+            else:
+                objects.extend(list_local_objects(data_root, bucket, key))
+
+        return objects
+
+    def write_manifest(self, objects, context, suffix=None):
+
+        """
+        Writes a COPY manifest that contains the given objects.
+
+        Parameters:
+            objects (list): The objects, as returned by list_objects.
+            context (dict): Contains info related to the task instance.
+            suffix (str): An optional suffix for the manifest name, used
+                when a run writes more than one manifest.
+
+        Returns:
+            (str): The S3 URL of the manifest.
+        """
+
+        bucket, _ = split_s3_url(self._s3_prefix)
+
+        name = context['ts_nodash'] if suffix is None else '{}-{}'.format(context['ts_nodash'], suffix)
+        manifest_url = join_s3_url(
+            self._manifest_prefix,
+            '{}/{}.manifest'.format(self.task_id, name)
+        )
+        manifest_bucket, manifest_key = split_s3_url(manifest_url)
+
+        # The local engine reads the manifest from a local directory.
+        data_root = self._session.data_root
+
+        if data_root is None:
+            S3Hook(aws_conn_id=self._aws_conn_id).load_string(
+                build_manifest(bucket, objects),
+                key=manifest_key,
+                bucket_name=manifest_bucket,
+                replace=True
+            )
+        else:
+            write_local_object(data_root, manifest_url, build_manifest(bucket, objects))
+
+        self.log.info('Manifest {} written with {} objects.'.format(manifest_url, len(objects)))
+        return manifest_url
+
+    def build_copy_query(self, source, manifest=False):
+
+        """
+        Builds the COPY query for a given source.
+
+        Parameters:
+            source (str): The S3 prefix or manifest URL to copy from.
+            manifest (bool): Whether the source is a manifest.
+
+        Returns:
+            (str): The COPY query.
+        """
+
+        template = SqlQueries.staging_table_manifest_copy if manifest else SqlQueries.staging_table_copy
+
+        options = SqlQueries.staging_table_copy_formats[self._format].strip('\n').format(json_path=self._json_path)
+        if self._max_errors > 0:
+            options += SqlQueries.staging_table_copy_max_errors.format(self._max_errors)
+
+        return template.strip().format(
+            self._staging_table,
+            source,
+            self._iam_role_arn,
+            options
+        )
+
+    def run_copy(self, query, objects=None):
+
+        """
+        Runs a COPY query in its own transaction, which also records the
+        given objects in the ledger table, if any. The records rejected by
+        the query are read from STL_LOAD_ERRORS and logged, unless the
+        session targets the local engine, which has no system tables.
+
+        Parameters:
+            query (str): The COPY query.
+            objects (list): The objects copied, as returned by list_objects.
+
+        Returns:
+            (int): The number of rows copied.
+
+        Raises:
+            CopyError: if the query fails, along with its load errors.
+        """
+
+        capture = self._session.data_root is None
+        marker = None
+
+        try:
+            with self._session.transaction() as cursor:
+                if capture:
+                    marker = copy_marker(cursor)
+
+                self.log.info(query)
+                cursor.execute(query)
+                cursor.execute('SELECT pg_last_copy_count();')
+                rows = cursor.fetchone()[0]
+
+                # The ledger is written in the same transaction as the COPY,
+                # so a file is recorded if and only if it has been loaded.
+                if objects is not None and self._ledger_table is not None:
+                    record_objects(cursor, self._ledger_table, self._target_table, objects)
+
+                errors = get_load_errors(cursor, *marker) if marker is not None else []
+
+        except Exception as e:
+            if marker is None:
+                raise
+
+            # The transaction is aborted, so the errors are read through
+            # another one.
+            with self._session.transaction() as cursor:
+                errors = get_load_errors(cursor, *marker)
+            self.log_load_errors(errors)
+            raise CopyError(str(e), errors) from e
+
+        self.log_load_errors(errors)
+        return rows
+
+    def log_load_errors(self, errors):
+
+        """
+        Logs the load errors of a COPY query, and keeps them for XCom.
+
+        Parameters:
+            errors (list): The load errors, as returned by get_load_errors.
+        """
+
+        for error in errors:
+            message = 'Rejected line {} of {}, column {} ({!r}): {}'
+            self.log.warning(message.format(
+                error['line'],
+                error['file'],
+                error['column'],
+                error['value'],
+                error['reason']
+            ))
+
+        self._load_errors.extend(errors)
+
+    def quarantine_rejected_lines(self, context, failing):
+
+        """
+        The 'quarantine' fix-up: writes a copy of every failing file without
+        its rejected lines, and those lines, into the quarantine prefix. The
+        failing files may be copies written by a previous call, whose lines
+        are quarantined along with those of their source file.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            failing (dict): The load errors of every failing file, by S3 URL.
+
+        Returns:
+            (dict): The S3 URL of the cleaned copy of every file, by URL.
+        """
+
+        store = ObjectStore(self._aws_conn_id, self._session.data_root)
+        run_prefix = join_s3_url(self._quarantine_prefix, context['ts_nodash'])
+
+        fixed = {}
+        for url, errors in failing.items():
+            bucket, key = split_s3_url(url)
+            source_url = self._quarantined.get(url, {}).get('source', url)
+            _, source_key = split_s3_url(source_url)
+
+            content, removed = drop_rejected_lines(
+                store.read_bytes(bucket, key),
+                errors,
+                compressed=self._format != 'json'
+            )
+
+            cleaned_url = join_s3_url(run_prefix, 'cleaned/{}'.format(source_key))
+            store.write(cleaned_url, content)
+
+            # The lines rejected by every round are kept together.
+            lines = self._quarantined.get(source_url, {}).get('lines', []) + removed
+            self._quarantined[source_url] = {'source': source_url, 'lines': lines}
+            self._quarantined[cleaned_url] = self._quarantined[source_url]
+            store.write(join_s3_url(run_prefix, 'rejected/{}'.format(source_key)), build_quarantine(source_url, lines))
+
+            self.log.info('Moved {} lines of {} into quarantine, the rest into {}.'.format(
+                len(removed),
+                source_url,
+                cleaned_url
+            ))
+            fixed[url] = cleaned_url
+
+        return fixed
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
     def execute(self, context):
 
         """
@@ -88,14 +562,256 @@ class StageToRedshiftOperator(BaseOperator):
         # Validates the operator parameteres.
         self.check_invalid_params()
 
-        # Builds the query.
-        query = SqlQueries.staging_table_copy.strip().format(
-            self._target_table,
-            self._s3_prefix,
-            self._iam_role_arn,
-            self._json_path
-        )
+        self._staging_table = self.prepare_staging_table(context)
+        self.xcom_push(context, 'staging_table', self._staging_table)
+
+        # The load errors are pushed whether the task fails or not.
+        self._load_errors = []
+        self._quarantined = {}
+        try:
+            self.stage(context)
+        finally:
+            if self._load_errors:
+                self.xcom_push(context, 'load_errors', self._load_errors)
+
+    def prepare_staging_table(self, context):
+
+        """
+        Prepares the table the current run copies into, as told by the
+        staging mode.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+
+        Returns:
+            (str): The name of the table.
+        """
+
+        if self._staging_mode == 'truncate':
+            self._session.run(SqlQueries.staging_table_truncate.format(self._target_table))
+            return self._target_table
+
+        if self._staging_mode == 'run':
+            table = run_table_name(self._target_table, context)
+            self._session.run(SqlQueries.staging_table_create_like.format(table, self._target_table))
+            self.log.info('Copying into the staging table of the run {}.'.format(table))
+            return table
+
+        return self._target_table
+
+    def stage(self, context):
+
+        """
+        Copies the objects of the current run, either directly or through
+        manifests.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        prefixes = self.get_source_prefixes(context)
+
+        # A single prefix with no ledger is copied directly.
+        if len(prefixes) == 1 and self._ledger_table is None:
+            self.run_copy(self.build_copy_query(prefixes[0]))
+            return
+
+        # Otherwise, the objects are listed and copied through manifests.
+        objects = self.list_source_objects(prefixes)
+
+        # Those objects already loaded are left out of the manifests.
+        if self._ledger_table is not None:
+            with self._session.transaction() as cursor:
+                loaded = loaded_objects(
+                    cursor,
+                    self._ledger_table,
+                    self._target_table,
+                    [split_s3_url(prefix)[1] for prefix in prefixes]
+                )
+            pending = new_objects(objects, loaded)
+            message = 'Found {} objects, {} of them already loaded.'
+            self.log.info(message.format(len(objects), len(objects) - len(pending)))
+            objects = pending
+
+        if len(objects) == 0:
+            self.log.info('There are no new objects to copy.')
+            return
+
+        groups = self.split_objects(objects)
+
+        if len(groups) == 1:
+            self.copy_objects(objects, context)
+            return
+
+        # The groups are copied concurrently, each one through its own
+        # connection. Since every group is recorded in the ledger along
+        # with its COPY, a retry only copies the unfinished groups.
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(self.copy_objects, group, context, str(i))
+                for i, group in enumerate(groups)
+            ]
+            rows = sum(future.result() for future in futures)
+
+        message = 'Copied {} rows from {} objects in {} groups.'
+        self.log.info(message.format(rows, len(objects), len(groups)))
+
+    def split_objects(self, objects):
+
+        """
+        Splits the objects into the groups of the fan-out. Empty groups are
+        discarded.
+
+        Parameters:
+            objects (list): The objects, as returned by list_objects.
+
+        Returns:
+            (list): The groups of objects.
+        """
+
+        if self._fan_out == 1:
+            return [objects]
+
+        if self._fan_out_by == 'hash':
+
+            # The groups are stable for a given key, whatever the listing.
+            groups = [[] for _ in range(self._fan_out)]
+            for obj in objects:
+                digest = hashlib.md5(obj['key'].encode('utf-8')).hexdigest()
+                groups[int(digest, 16) % self._fan_out].append(obj)
+
+        else:
+
+            # The keys are sorted by date, so contiguous ranges of keys
+            # make up contiguous ranges of dates.
+            objects = sorted(objects, key=lambda obj: obj['key'])
+            size = -(-len(objects) // self._fan_out)
+            groups = [objects[i:i + size] for i in range(0, len(objects), size)]
+
+        return [group for group in groups if len(group) > 0]
+
+    def copy_objects(self, objects, context, suffix=None):
+
+        """
+        Copies the given objects through a manifest, in a single transaction
+        that also records them in the ledger table, if any. When the COPY
+        query fails and a fix-up is given, the healthy objects are copied on
+        their own, and the failing ones once again after the fix-up.
+
+        Parameters:
+            objects (list): The objects, as returned by list_objects.
+            context (dict): Contains info related to the task instance.
+            suffix (str): An optional suffix for the manifest name.
+
+        Returns:
+            (int): The number of rows copied.
+        """
+
+        started = time.time()
+
+        query = self.build_copy_query(self.write_manifest(objects, context, suffix), manifest=True)
+
+        try:
+            rows = self.run_copy(query, objects)
+        except CopyError as e:
+            if self._fix_up is None:
+                raise
+            rows = self.recover_objects(objects, context, suffix, e)
+
+        message = 'Copied {} rows from {} objects{} in {:.2f} seconds.'
+        self.log.info(message.format(
+            rows,
+            len(objects),
+            '' if suffix is None else ' (group {})'.format(suffix),
+            time.time() - started
+        ))
+
+        return rows
+
+    def recover_objects(self, objects, context, suffix, error):
+
+        """
+        Recovers from a failed COPY query: the objects with no load errors
+        are copied on their own, then the fix-up is applied to the failing
+        ones, whose fixed copies are copied instead. Should the copies fail
+        too, the fix-up is applied to them in turn, until no errors remain.
+        Since the copies are recorded in the ledger table as their source
+        objects, an Airflow retry only copies what is still missing.
+
+        Parameters:
+            objects (list): The objects, as returned by list_objects.
+            context (dict): Contains info related to the task instance.
+            suffix (str): An optional suffix for the manifest name.
+            error (CopyError): The error of the failed COPY query.
+
+        Returns:
+            (int): The number of rows copied.
+
+        Raises:
+            CopyError: if the load errors name no file, the fix-up makes no
+                progress, or the fixed copies cannot be copied.
+        """
+
+        bucket, _ = split_s3_url(self._s3_prefix)
+
+        failing = failing_files(error.errors)
+        failing_keys = {split_s3_url(url)[1] for url in failing}
+        healthy = [obj for obj in objects if obj['key'] not in failing_keys]
+
+        if len(failing_keys) == 0 or len(healthy) == len(objects):
+            raise error
+
+        message = 'The COPY query failed on {} of {} objects. Copying the rest of them first.'
+        self.log.warning(message.format(len(failing_keys), len(objects)))
+
+        def name(step):
+            return step if suffix is None else '{}-{}'.format(suffix, step)
+
+        rows = 0
+        if healthy:
+            query = self.build_copy_query(self.write_manifest(healthy, context, name('healthy')), manifest=True)
+            rows += self.run_copy(query, healthy)
+
+        # Every pending object keeps its source key, ETag and size for the
+        # ledger, along with the URL of its current copy for the manifest.
+        store = ObjectStore(self._aws_conn_id, self._session.data_root)
+        pending = [
+            dict(obj, url='s3://{}/{}'.format(bucket, obj['key']))
+            for obj in objects if obj['key'] in failing_keys
+        ]
+
+        attempt = 0
+        while True:
+            attempt += 1
+            fixed = self.quarantine_rejected_lines(context, failing) if self._fix_up == 'quarantine' \
+                else self._fix_up(context, failing)
+
+            for obj in pending:
+                copy_url = (fixed or {}).get(obj['url'])
+                if copy_url is None:
+                    continue
+                copy_key = split_s3_url(copy_url)[1]
+                copies = [copy for copy in store.list_objects(copy_url) if copy['key'] == copy_key]
+                if not copies:
+                    raise CopyError('The fixed copy {} does not exist.'.format(copy_url), error.errors)
+                obj.update(url=copy_url, content_length=copies[0]['size'])
+
+            query = self.build_copy_query(
+                self.write_manifest(pending, context, name('retry-{}'.format(attempt))),
+                manifest=True
+            )
+
+            try:
+                rows += self.run_copy(query, pending)
+                break
+            except CopyError as e:
+                previous, failing = failing, failing_files(e.errors)
+                if not failing or not set(failing) <= {obj['url'] for obj in pending} or failing == previous:
+                    raise
+                message = 'The fixed copies still failed on {} files. Fixing them once again.'
+                self.log.warning(message.format(len(failing)))
+
+        message = 'Recovered {} of the failing objects after {} rounds of the fix-up.'
+        self.log.info(message.format(len(pending), attempt))
 
-        # Logs and executes the query.
-        self.log.info(query)
-        PostgresHook(postgres_conn_id=self._redshift_conn_id).run(query)
+        return rows
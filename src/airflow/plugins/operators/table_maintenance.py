@@ -0,0 +1,251 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import RedshiftSession, SqlQueries
+from helpers.instrumentation import report_statements, reports_failures
+from psycopg2.extensions import QueryCanceledError
+import time
+
+
+class TableMaintenanceOperator(BaseOperator):
+
+    ui_color = '#B3B3B3'
+
+    @apply_defaults
+    def __init__(
+        self,
+        redshift_conn_id=None,
+        tables=None,
+        unsorted_threshold=10.0,
+        stats_off_threshold=10.0,
+        deleted_threshold=10.0,
+        time_budget=None,
+        statement_timeout=None,
+        metrics_sink=None,
+        *args,
+        **kwargs
+    ):
+
+        """
+        Initializes a new instance of the class TableMaintenanceOperator.
+
+        Parameters:
+            redshift_conn_id (str): The Redshift connection identifier.
+            tables (iterable): The names of the tables to maintain.
+            unsorted_threshold (float): The percent of unsorted rows above
+                which a table is sorted (VACUUM SORT ONLY).
+            stats_off_threshold (float): The percent of staleness of the
+                statistics above which a table is analyzed (ANALYZE
+                PREDICATE COLUMNS).
+            deleted_threshold (float): The percent of rows marked for
+                deletion above which their space is reclaimed (VACUUM DELETE
+                ONLY).
+            time_budget (int): The number of seconds the maintenance may
+                take. Every statement gets the rest of the budget as its
+                timeout, and is cancelled when it runs out. No statement is
+                started once it is spent, and the most urgent tables go
+                first. No limit when null.
+            statement_timeout (int): The maximum number of seconds a
+                statement can run before it is cancelled. No limit when null.
+            metrics_sink (str): The URL of the sink of the statement metrics,
+                either 'statsd://host:port/prefix' or 'file:///some/file'.
+                They are pushed to XCom anyway.
+        """
+
+        super(TableMaintenanceOperator, self).__init__(*args, **kwargs)
+        self._redshift_conn_id = redshift_conn_id
+        self._tables = tables
+        self._unsorted_threshold = unsorted_threshold
+        self._stats_off_threshold = stats_off_threshold
+        self._deleted_threshold = deleted_threshold
+        self._time_budget = time_budget
+        self._statement_timeout = statement_timeout
+        self._session = RedshiftSession(redshift_conn_id, statement_timeout=statement_timeout)
+        self._metrics_sink = metrics_sink
+
+    def check_invalid_params(self):
+
+        """
+        Checks if the mandatory operator parameters are properly defined.
+
+        Raises:
+            ValueError: if any of the parameters is null or empty.
+        """
+
+        # Checks if the Redshift connection identifier is valid.
+        if self._redshift_conn_id is None \
+                or not isinstance(self._redshift_conn_id, str) \
+                or self._redshift_conn_id.strip() == '':
+            raise ValueError('The Redshift connection identifier cannot be null or empty.')
+
+        # Checks if the tables tuple is valid.
+        if self._tables is None \
+                or isinstance(self._tables, str) \
+                or len(self._tables) == 0:
+            raise ValueError('The tables tuple cannot be null or empty.')
+
+        # Checks if the thresholds are valid.
+        for name, threshold in (
+            ('unsorted', self._unsorted_threshold),
+            ('stats off', self._stats_off_threshold),
+            ('deleted', self._deleted_threshold)
+        ):
+            if not isinstance(threshold, (int, float)) or not 0 <= threshold <= 100:
+                raise ValueError('The {} threshold must be a percent between 0 and 100.'.format(name))
+
+        # Checks if the time budget is valid.
+        if self._time_budget is not None \
+                and (not isinstance(self._time_budget, (int, float)) or self._time_budget <= 0):
+            raise ValueError('The time budget must be a positive number of seconds.')
+
+    def get_health(self):
+
+        """
+        Reads the health of the tables from SVV_TABLE_INFO. The empty tables
+        are not listed there.
+
+        Returns:
+            (dict): The percent of unsorted rows, the staleness of the
+                statistics, the number of rows and the percent of rows
+                marked for deletion of every table, by name.
+        """
+
+        names = {}
+        for table in self._tables:
+            schema, _, name = table.rpartition('.')
+            names[(schema or 'public', name)] = table
+
+        records = self._session.get_records(
+            SqlQueries.table_health,
+            (tuple(name for _, name in names),)
+        )
+
+        health = {}
+        for schema, name, unsorted, stats_off, rows, visible_rows in records:
+            if (schema, name) not in names:
+                continue
+            rows = int(rows or 0)
+            deleted = rows - int(visible_rows if visible_rows is not None else rows)
+            health[names[(schema, name)]] = {
+                'unsorted': float(unsorted or 0),
+                'stats_off': float(stats_off or 0),
+                'rows': rows,
+                'deleted': round(100.0 * deleted / rows, 2) if rows else 0.0
+            }
+
+        return health
+
+    def plan(self, health):
+
+        """
+        Plans the statements each table needs, the most urgent first: the
+        tables are sorted by the number of rows out of place.
+
+        Parameters:
+            health (dict): The health of every table, as returned by
+                get_health.
+
+        Returns:
+            (list): The table and the statement of every operation.
+        """
+
+        def urgency(item):
+            table, info = item
+            return -info['rows'] * max(info['unsorted'], info['deleted'], info['stats_off'])
+
+        operations = []
+        for table, info in sorted(health.items(), key=urgency):
+            if info['deleted'] > self._deleted_threshold:
+                operations.append((table, SqlQueries.table_vacuum_delete.strip().format(table)))
+            if info['unsorted'] > self._unsorted_threshold:
+                operations.append((table, SqlQueries.table_vacuum_sort.strip().format(table)))
+            if info['stats_off'] > self._stats_off_threshold:
+                operations.append((table, SqlQueries.table_analyze.strip().format(table)))
+
+        return operations
+
+    def post_execute(self, context, result=None):
+
+        """
+        Reports the statements run by the task, once it succeeds or fails.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+            result (object): The value returned by execute.
+        """
+
+        report_statements(self, context, self._session, self._metrics_sink)
+
+    @reports_failures
+    def execute(self, context):
+
+        """
+        Runs the VACUUM and ANALYZE statements the tables need, as told by
+        their health, within the time budget. The statement running when the
+        budget is spent is cancelled, and the rest are skipped. The health of
+        every table is logged before and after, and pushed to XCom under the
+        key 'maintenance'.
+
+        Parameters:
+            context (dict): Contains info related to the task instance.
+        """
+
+        # Validates the operator parameteres.
+        self.check_invalid_params()
+
+        # The system views are not available in the local engine.
+        if self._session.data_root is not None:
+            self.log.info('The table maintenance is skipped by the local engine.')
+            return
+
+        started = time.time()
+
+        before = self.get_health()
+        for table, info in sorted(before.items()):
+            self.log.info('Health of {} before the maintenance: {}'.format(table, info))
+
+        operations = self.plan(before)
+        done = []
+        skipped = []
+
+        # VACUUM cannot run within a transaction block. Within a budget, a
+        # statement may run for the rest of it only, so a long VACUUM cannot
+        # overrun it. A cancelled VACUUM keeps the work already done.
+        for table, query in operations:
+            timeout = self._statement_timeout
+            budget_bound = False
+            if self._time_budget is not None:
+                remaining = self._time_budget - (time.time() - started)
+                if remaining <= 0:
+                    skipped.append(query)
+                    continue
+                if timeout is None or remaining < timeout:
+                    timeout = max(remaining, 0.001)
+                    budget_bound = True
+            self.log.info(query)
+            try:
+                self._session.run(query, autocommit=True, statement_timeout=timeout)
+            except QueryCanceledError:
+                if not budget_bound:
+                    raise
+                self.log.warning('The time budget ran out while running: {}'.format(query))
+                skipped.append(query)
+                continue
+            done.append(query)
+
+        if skipped:
+            message = 'The time budget of {} seconds is spent. Skipped: {}'
+            self.log.warning(message.format(self._time_budget, '; '.join(skipped)))
+
+        after = self.get_health() if done else before
+        for table, info in sorted(after.items()):
+            self.log.info('Health of {} after the maintenance: {}'.format(table, info))
+
+        message = '{} maintenance statements run in {:.2f} seconds, {} skipped.'
+        self.log.info(message.format(len(done), time.time() - started, len(skipped)))
+
+        self.xcom_push(context, 'maintenance', {
+            'before': before,
+            'after': after,
+            'statements': done,
+            'skipped': skipped
+        })
@@ -0,0 +1,50 @@
+import psycopg2
+import sys
+import time
+from schema import TABLES
+
+
+# The default DSN of the local PostgreSQL database.
+default_dsn = 'host=localhost port=5432 dbname=sparkify user=sparkify password=sparkify'
+
+# A reference to the builtin function 'print()'.
+builtin_print = print
+
+
+def print(text):
+
+    """
+    Prints a timestamp next to the the given text.
+
+    Args:
+        text (str): The text to print.
+    """
+
+    return builtin_print('{} | {}'.format(
+        time.strftime('%H:%M:%S', time.gmtime()),
+        text
+    ))
+
+
+def create_local_tables(dsn):
+
+    """
+    Creates the staging, dimension and fact tables in a local PostgreSQL
+    database, used by the local engine.
+
+    Args:
+        dsn (str): The DSN of the local database.
+    """
+
+    with psycopg2.connect(dsn) as conn:
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            for table in TABLES:
+                print('Creating table: {}'.format(table.name))
+                cur.execute(table.create_query(local=True))
+
+    print('Local tables created :-)')
+
+
+if __name__ == '__main__':
+    create_local_tables(sys.argv[1] if len(sys.argv) > 1 else default_dsn)
@@ -148,6 +148,12 @@ def create_tables(cluster_endpoint):
             cur.execute(SparkifyQueries.staging_events_table_create)
             print('Creating table: staging_songs')
             cur.execute(SparkifyQueries.staging_songs_table_create)
+            print('Creating table: staging_files')
+            cur.execute(SparkifyQueries.staging_files_table_create)
+            print('Creating table: aggregate_runs')
+            cur.execute(SparkifyQueries.aggregate_runs_table_create)
+            print('Creating table: song_lookup')
+            cur.execute(SparkifyQueries.song_lookup_table_create)
             print('Creating table: time')
             cur.execute(SparkifyQueries.time_table_create)
             print('Creating table: users')
@@ -0,0 +1,128 @@
+import boto3
+import configparser
+import psycopg2
+import os
+import sys
+import time
+from queries import SparkifyQueries
+from schema import TABLES
+
+
+# Loads the Sparkify configuration.
+config = configparser.ConfigParser()
+config.read(os.path.join(os.getcwd(), 'sparkify.cfg'))
+
+# The CloudFormation client.
+cloudformation = boto3.client(
+    'cloudformation',
+    region_name=config['AWS']['REGION'],
+    aws_access_key_id=config['AWS']['ACCESS_KEY_ID'],
+    aws_secret_access_key=config['AWS']['SECRET_ACCESS_KEY']
+)
+
+# A reference to the builtin function 'print()'.
+builtin_print = print
+
+
+def print(text):
+
+    """
+    Prints a timestamp next to the the given text.
+
+    Args:
+        text (str): The text to print.
+    """
+
+    return builtin_print('{} | {}'.format(
+        time.strftime('%H:%M:%S', time.gmtime()),
+        text
+    ))
+
+
+def get_output_value(description, key):
+
+    """
+    Gets an output value of a given stack description.
+
+    Args:
+        description (dict): The stack description object.
+        key (str): The key of the output.
+
+    Returns:
+        (str): The value of the output.
+    """
+
+    outputs = [o for o in description['Outputs'] if o['OutputKey'] == key]
+    return None if len(outputs) != 1 else outputs[0]['OutputValue']
+
+
+def get_cluster_endpoint():
+
+    """
+    Gets the Redshift cluster endpoint from the Sparkify stack.
+
+    Returns:
+        (str): The Redshift cluster endpoint.
+    """
+
+    response = cloudformation.describe_stacks(
+        StackName=config['CLOUDFORMATION']['STACK_NAME']
+    )
+    return get_output_value(response['Stacks'][0], 'SparkifyClusterEndpoint')
+
+
+def migrate_table(conn, table):
+
+    """
+    Migrates a table to its current definition. A table that does not exist
+    yet is just created; otherwise it is deep copied in a single transaction.
+
+    Args:
+        conn (connection): The connection to the Redshift cluster.
+        table (Table): The definition of the table.
+    """
+
+    with conn.cursor() as cur:
+
+        cur.execute(SparkifyQueries.table_columns, (table.name,))
+        columns = [row[0] for row in cur.fetchall()]
+
+        if len(columns) == 0:
+            print('Creating table: {}'.format(table.name))
+            cur.execute(table.create_query())
+        else:
+            print('Deep copying table: {}'.format(table.name))
+            for query in table.deep_copy_queries(columns):
+                cur.execute(query)
+
+    conn.commit()
+
+
+def migrate_tables(names):
+
+    """
+    Migrates the Sparkify tables to their current definition.
+
+    Args:
+        names (list): The names of the tables to migrate. All of them are
+            migrated when empty.
+    """
+
+    dsn = 'host={} port={} dbname={} user={} password={}'.format(
+        get_cluster_endpoint(),
+        config['REDSHIFT']['PORT'],
+        config['REDSHIFT']['DB_NAME'],
+        config['REDSHIFT']['MASTER_USERNAME'],
+        config['REDSHIFT']['MASTER_USER_PASSWORD']
+    )
+
+    with psycopg2.connect(dsn) as conn:
+        for table in TABLES:
+            if len(names) == 0 or table.name in names:
+                migrate_table(conn, table)
+
+    print('Tables migrated :-)')
+
+
+if __name__ == '__main__':
+    migrate_tables(sys.argv[1:])
@@ -1,100 +1,34 @@
+from schema import TABLES
+
+# The Sparkify tables, by name.
+tables = {table.name: table for table in TABLES}
+
 
 class SparkifyQueries():
 
-    artists_table_create = """
-        CREATE TABLE IF NOT EXISTS public.artists (
-            artistid varchar(256) NOT NULL,
-            name varchar(256),
-            location varchar(256),
-            lattitude numeric(18,0),
-            longitude numeric(18,0)
-        );
-    """
+    aggregate_runs_table_create = tables['aggregate_runs'].create_query()
 
-    songplays_table_create = """
-        CREATE TABLE IF NOT EXISTS public.songplays (
-            playid varchar(32) NOT NULL,
-            start_time timestamp NOT NULL,
-            userid int4 NOT NULL,
-            \"level\" varchar(256),
-            songid varchar(256),
-            artistid varchar(256),
-            sessionid int4,
-            location varchar(256),
-            user_agent varchar(256),
-            CONSTRAINT songplays_pkey PRIMARY KEY (playid)
-        );
-    """
+    artists_table_create = tables['artists'].create_query()
 
-    songs_table_create = """
-        CREATE TABLE IF NOT EXISTS public.songs (
-            songid varchar(256) NOT NULL,
-            title varchar(256),
-            artistid varchar(256),
-            \"year\" int4,
-            duration numeric(18,0),
-            CONSTRAINT songs_pkey PRIMARY KEY (songid)
-        );
-    """
+    songplays_table_create = tables['songplays'].create_query()
 
-    staging_events_table_create = """
-        CREATE TABLE IF NOT EXISTS public.staging_events (
-            artist varchar(256),
-            auth varchar(256),
-            firstname varchar(256),
-            gender varchar(256),
-            iteminsession int4,
-            lastname varchar(256),
-            length numeric(18,0),
-            \"level\" varchar(256),
-            location varchar(256),
-            \"method\" varchar(256),
-            page varchar(256),
-            registration numeric(18,0),
-            sessionid int4,
-            song varchar(256),
-            status int4,
-            ts int8,
-            useragent varchar(256),
-            userid int4
-        );
-    """
+    song_lookup_table_create = tables['song_lookup'].create_query()
 
-    staging_songs_table_create = """
-        CREATE TABLE IF NOT EXISTS public.staging_songs (
-            num_songs int4,
-            artist_id varchar(256),
-            artist_name varchar(256),
-            artist_latitude numeric(18,0),
-            artist_longitude numeric(18,0),
-            artist_location varchar(256),
-            song_id varchar(256),
-            title varchar(256),
-            duration numeric(18,0),
-            \"year\" int4
-        );
-    """
+    songs_table_create = tables['songs'].create_query()
 
-    time_table_create = """
-        CREATE TABLE IF NOT EXISTS public.\"time\" (
-            start_time timestamp NOT NULL,
-            \"hour\" int4,
-            \"day\" int4,
-            week int4,
-            \"month\" varchar(256),
-            \"year\" int4,
-            weekday varchar(256),
-            CONSTRAINT time_pkey PRIMARY KEY (start_time)
-        ) ;
-    """
+    staging_events_table_create = tables['staging_events'].create_query()
+
+    staging_files_table_create = tables['staging_files'].create_query()
+
+    staging_songs_table_create = tables['staging_songs'].create_query()
+
+    time_table_create = tables['time'].create_query()
+
+    users_table_create = tables['users'].create_query()
 
-    users_table_create = """
-        CREATE TABLE IF NOT EXISTS public.users (
-            userid int4 NOT NULL,
-            first_name varchar(256),
-            last_name varchar(256),
-            gender varchar(256),
-            \"level\" varchar(256),
-            CONSTRAINT users_pkey PRIMARY KEY (userid)
-        );
+    table_columns = """
+        SELECT column_name
+          FROM information_schema.columns
+         WHERE table_schema = 'public'
+           AND table_name = %s
     """
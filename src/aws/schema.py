@@ -0,0 +1,301 @@
+# Those identifiers that must be quoted, since they are reserved words.
+QUOTED = ('level', 'method', 'year', 'time', 'hour', 'day', 'month')
+
+
+def quote(identifier):
+
+    """
+    Quotes an identifier if it is a reserved word.
+
+    Args:
+        identifier (str): The identifier.
+
+    Returns:
+        (str): The identifier, quoted if needed.
+    """
+
+    return '"{}"'.format(identifier) if identifier in QUOTED else identifier
+
+
+class Table():
+
+    """
+    Describes a Redshift table: its columns, along with their compression
+    encodings, and its distribution style and sort key.
+    """
+
+    def __init__(self, name, columns, diststyle='EVEN', distkey=None, sortkey=(), primary_key=()):
+
+        """
+        Initializes a new instance of the class Table.
+
+        Args:
+            name (str): The name of the table.
+            columns (list): The columns, as (name, type, encoding) tuples.
+                A 'DEFAULT' clause can be added to the type, and a fourth
+                item can hold the column constraints, like 'NOT NULL'.
+            diststyle (str): The distribution style: EVEN, KEY or ALL.
+            distkey (str): The distribution key, when the style is KEY.
+            sortkey (tuple): The columns of the compound sort key.
+            primary_key (tuple): The columns of the primary key.
+        """
+
+        self.name = name
+        self.columns = columns
+        self.diststyle = diststyle
+        self.distkey = distkey
+        self.sortkey = sortkey
+        self.primary_key = primary_key
+
+    @property
+    def column_names(self):
+
+        """
+        Gets the names of the columns of the table.
+
+        Returns:
+            (list): The column names.
+        """
+
+        return [column[0] for column in self.columns]
+
+    def create_query(self, name=None, local=False):
+
+        """
+        Gets the DDL that creates the table.
+
+        Args:
+            name (str): An optional name for the table, used by deep copies.
+            local (bool): Whether the DDL targets a local PostgreSQL
+                database, which knows neither encodings nor distribution.
+
+        Returns:
+            (str): The CREATE TABLE query.
+        """
+
+        definitions = [
+            ' '.join((quote(column[0]), column[1]) + (() if local else ('ENCODE', column[2])) + tuple(column[3:]))
+            for column in self.columns
+        ]
+
+        if self.primary_key:
+            definitions.append('PRIMARY KEY ({})'.format(', '.join(quote(c) for c in self.primary_key)))
+
+        attributes = ['DISTSTYLE {}'.format(self.diststyle)]
+        if self.distkey is not None:
+            attributes.append('DISTKEY ({})'.format(quote(self.distkey)))
+        if self.sortkey:
+            attributes.append('COMPOUND SORTKEY ({})'.format(', '.join(quote(c) for c in self.sortkey)))
+
+        # A local database knows neither distribution nor sort keys.
+        if local:
+            attributes = []
+
+        lines = [
+            '',
+            '        CREATE TABLE IF NOT EXISTS public.{} ('.format(quote(name or self.name)),
+            ',\n'.join('            ' + definition for definition in definitions),
+            '        )'
+        ]
+        lines.extend('        ' + attribute for attribute in attributes)
+        lines[-1] += ';'
+        lines.append('    ')
+
+        return '\n'.join(lines)
+
+    def deep_copy_queries(self, current_columns):
+
+        """
+        Gets the queries that migrate an existing table to the current
+        definition through a deep copy: a new table is created and loaded
+        from the existing one, which is replaced afterwards. The new table
+        comes out fully sorted, with the new encodings and distribution.
+        The queries must run in a single transaction.
+
+        Args:
+            current_columns (iterable): The column names of the existing
+                table. Only those also found in the current definition are
+                copied; the rest of the new columns get their default values.
+
+        Returns:
+            (list): The queries.
+        """
+
+        copy_name = '{}__deep_copy'.format(self.name)
+        old_name = '{}__old'.format(self.name)
+        columns = ', '.join(quote(c) for c in self.column_names if c in current_columns)
+
+        return [
+            'DROP TABLE IF EXISTS public.{};'.format(quote(copy_name)),
+            self.create_query(copy_name),
+            'INSERT INTO public.{} ({}) SELECT {} FROM public.{};'.format(
+                quote(copy_name),
+                columns,
+                columns,
+                quote(self.name)
+            ),
+            'ALTER TABLE public.{} RENAME TO {};'.format(quote(self.name), quote(old_name)),
+            'ALTER TABLE public.{} RENAME TO {};'.format(quote(copy_name), quote(self.name)),
+            'DROP TABLE public.{};'.format(quote(old_name))
+        ]
+
+
+# The Sparkify tables. Small dimensions are copied to every node, so joins
+# against them never redistribute data. The fact table and the time
+# dimension share their distribution key. The staging events are spread
+# evenly: the song is null for every event but the plays, so it would pile
+# them up on a single slice, and the song lookup, copied to every node too,
+# already lets the fact load join the events with their songs on a single
+# fixed width key. Range scans on time columns are pruned by the sort keys.
+# Sort key columns are not compressed, so zone maps stay effective.
+TABLES = (
+    Table(
+        'staging_events',
+        [
+            ('artist', 'varchar(256)', 'zstd'),
+            ('auth', 'varchar(256)', 'zstd'),
+            ('firstname', 'varchar(256)', 'zstd'),
+            ('gender', 'varchar(256)', 'zstd'),
+            ('iteminsession', 'int4', 'az64'),
+            ('lastname', 'varchar(256)', 'zstd'),
+            ('length', 'numeric(18,0)', 'az64'),
+            ('level', 'varchar(256)', 'zstd'),
+            ('location', 'varchar(256)', 'zstd'),
+            ('method', 'varchar(256)', 'zstd'),
+            ('page', 'varchar(256)', 'zstd'),
+            ('registration', 'numeric(18,0)', 'az64'),
+            ('sessionid', 'int4', 'az64'),
+            ('song', 'varchar(256)', 'zstd'),
+            ('status', 'int4', 'az64'),
+            ('ts', 'int8', 'raw'),
+            ('useragent', 'varchar(256)', 'zstd'),
+            ('userid', 'int4', 'az64')
+        ],
+        sortkey=('ts',)
+    ),
+    Table(
+        'staging_songs',
+        [
+            ('num_songs', 'int4', 'az64'),
+            ('artist_id', 'varchar(256)', 'zstd'),
+            ('artist_name', 'varchar(256)', 'zstd'),
+            ('artist_latitude', 'numeric(18,0)', 'az64'),
+            ('artist_longitude', 'numeric(18,0)', 'az64'),
+            ('artist_location', 'varchar(256)', 'zstd'),
+            ('song_id', 'varchar(256)', 'zstd'),
+            ('title', 'varchar(256)', 'raw'),
+            ('duration', 'numeric(18,0)', 'az64'),
+            ('year', 'int4', 'az64')
+        ],
+        diststyle='KEY',
+        distkey='title',
+        sortkey=('title',)
+    ),
+    Table(
+        'staging_files',
+        [
+            ('target_table', 'varchar(256)', 'raw', 'NOT NULL'),
+            ('s3_key', 'varchar(1024)', 'raw', 'NOT NULL'),
+            ('etag', 'varchar(64)', 'zstd', 'NOT NULL'),
+            ('size', 'int8', 'az64'),
+            ('loaded_at', 'timestamp', 'az64', 'NOT NULL')
+        ],
+        sortkey=('target_table', 's3_key')
+    ),
+    Table(
+        'aggregate_runs',
+        [
+            ('target_table', 'varchar(256)', 'raw', 'NOT NULL'),
+            ('window_start', 'timestamp', 'raw', 'NOT NULL'),
+            ('window_end', 'timestamp', 'az64', 'NOT NULL'),
+            ('loaded_at', 'timestamp', 'az64', 'NOT NULL')
+        ],
+        sortkey=('target_table', 'window_start')
+    ),
+    Table(
+        'song_lookup',
+        [
+            ('match_key', 'char(32)', 'raw', 'NOT NULL'),
+            ('song_id', 'varchar(256)', 'zstd'),
+            ('artist_id', 'varchar(256)', 'zstd')
+        ],
+        diststyle='ALL',
+        sortkey=('match_key',),
+        primary_key=('match_key',)
+    ),
+    Table(
+        'time',
+        [
+            ('start_time', 'timestamp', 'raw', 'NOT NULL'),
+            ('hour', 'int4', 'az64'),
+            ('day', 'int4', 'az64'),
+            ('week', 'int4', 'az64'),
+            ('month', 'varchar(256)', 'zstd'),
+            ('year', 'int4', 'az64'),
+            ('weekday', 'varchar(256)', 'zstd')
+        ],
+        diststyle='KEY',
+        distkey='start_time',
+        sortkey=('start_time',),
+        primary_key=('start_time',)
+    ),
+    Table(
+        'users',
+        [
+            ('userid', 'int4', 'raw', 'NOT NULL'),
+            ('first_name', 'varchar(256)', 'zstd'),
+            ('last_name', 'varchar(256)', 'zstd'),
+            ('gender', 'varchar(256)', 'zstd'),
+            ('level', 'varchar(256)', 'zstd'),
+            ('valid_from', 'timestamp DEFAULT \'1970-01-01 00:00:00\'', 'az64', 'NOT NULL'),
+            ('valid_to', 'timestamp DEFAULT \'9999-12-31 00:00:00\'', 'az64', 'NOT NULL'),
+            ('is_current', 'boolean DEFAULT TRUE', 'raw', 'NOT NULL')
+        ],
+        diststyle='ALL',
+        sortkey=('userid',),
+        primary_key=('userid', 'valid_from')
+    ),
+    Table(
+        'artists',
+        [
+            ('artistid', 'varchar(256)', 'raw', 'NOT NULL'),
+            ('name', 'varchar(256)', 'zstd'),
+            ('location', 'varchar(256)', 'zstd'),
+            ('lattitude', 'numeric(18,0)', 'az64'),
+            ('longitude', 'numeric(18,0)', 'az64')
+        ],
+        diststyle='ALL',
+        sortkey=('artistid',)
+    ),
+    Table(
+        'songs',
+        [
+            ('songid', 'varchar(256)', 'raw', 'NOT NULL'),
+            ('title', 'varchar(256)', 'zstd'),
+            ('artistid', 'varchar(256)', 'zstd'),
+            ('year', 'int4', 'az64'),
+            ('duration', 'numeric(18,0)', 'az64')
+        ],
+        diststyle='ALL',
+        sortkey=('songid',),
+        primary_key=('songid',)
+    ),
+    Table(
+        'songplays',
+        [
+            ('playid', 'varchar(32)', 'zstd', 'NOT NULL'),
+            ('start_time', 'timestamp', 'raw', 'NOT NULL'),
+            ('userid', 'int4', 'az64', 'NOT NULL'),
+            ('level', 'varchar(256)', 'zstd'),
+            ('songid', 'varchar(256)', 'zstd'),
+            ('artistid', 'varchar(256)', 'zstd'),
+            ('sessionid', 'int4', 'az64'),
+            ('location', 'varchar(256)', 'zstd'),
+            ('user_agent', 'varchar(256)', 'zstd')
+        ],
+        diststyle='KEY',
+        distkey='start_time',
+        sortkey=('start_time',),
+        primary_key=('playid',)
+    )
+)
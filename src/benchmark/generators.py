@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+# The words the song titles, artist names and user names are made of.
+WORDS = (
+    'love', 'night', 'heart', 'dream', 'fire', 'rain', 'summer', 'blue',
+    'road', 'river', 'light', 'shadow', 'golden', 'wild', 'silver', 'ocean',
+    'city', 'star', 'storm', 'dance', 'echo', 'midnight', 'paper', 'stone'
+)
+
+LOCATIONS = (
+    'San Francisco-Oakland-Hayward, CA',
+    'Portland-South Portland, ME',
+    'Lansing-East Lansing, MI',
+    'Chicago-Naperville-Elgin, IL-IN-WI',
+    'Atlanta-Sandy Springs-Roswell, GA',
+    'New York-Newark-Jersey City, NY-NJ-PA'
+)
+
+USER_AGENTS = (
+    '"Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/36.0.1985.143 Safari/537.36"',
+    '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/36.0.1985.125 Safari/537.36"',
+    'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:31.0) Gecko/20100101 Firefox/31.0',
+    '"Mozilla/5.0 (iPhone; CPU iPhone OS 7_1_2 like Mac OS X) AppleWebKit/537.51.2 (KHTML, like Gecko) '
+    'Version/7.0 Mobile/11D257 Safari/9537.53"'
+)
+
+# The pages of the events that are not song plays.
+OTHER_PAGES = ('Home', 'Login', 'Logout', 'Settings', 'Help', 'About')
+
+# The first timestamp of the events, in epoch milliseconds.
+START_TS = int((datetime(2018, 11, 1) - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+# The number of records written to every file.
+RECORDS_PER_FILE = 100000
+
+
+def digest(seed, kind, index):
+
+    """
+    Gets a deterministic pseudo random number for a given record, so the
+    same record can be generated again from its index alone, without keeping
+    the whole dataset in memory.
+
+    Args:
+        seed (int): The seed of the dataset.
+        kind (str): The kind of record, e.g. 'song'.
+        index (int): The index of the record.
+
+    Returns:
+        (int): A 128 bits number.
+    """
+
+    return int(hashlib.md5('{}:{}:{}'.format(seed, kind, index).encode('utf-8')).hexdigest(), 16)
+
+
+def words(number, count):
+
+    """
+    Builds a title out of a pseudo random number.
+
+    Args:
+        number (int): The pseudo random number.
+        count (int): The number of words.
+
+    Returns:
+        (str): The title.
+    """
+
+    title = []
+    for _ in range(count):
+        number, word = divmod(number, len(WORDS))
+        title.append(WORDS[word].capitalize())
+    return ' '.join(title)
+
+
+def generate_artist(seed, index):
+
+    """
+    Generates the attributes of an artist.
+
+    Args:
+        seed (int): The seed of the dataset.
+        index (int): The index of the artist.
+
+    Returns:
+        (dict): The artist attributes, named as in the song data.
+    """
+
+    number = digest(seed, 'artist', index)
+    location = LOCATIONS[number % len(LOCATIONS)] if number % 3 else ''
+
+    return {
+        'artist_id': 'AR{:016X}'.format(index),
+        'artist_name': '{} {}'.format(words(number >> 8, 2), index),
+        'artist_location': location,
+        'artist_latitude': None if number % 4 == 0 else (number >> 16) % 180 - 90,
+        'artist_longitude': None if number % 4 == 0 else (number >> 24) % 360 - 180
+    }
+
+
+def generate_song(seed, index, artists):
+
+    """
+    Generates a song, as found in the song data.
+
+    Args:
+        seed (int): The seed of the dataset.
+        index (int): The index of the song.
+        artists (int): The number of artists of the dataset.
+
+    Returns:
+        (dict): The song.
+    """
+
+    number = digest(seed, 'song', index)
+
+    song = {
+        'num_songs': 1,
+        'song_id': 'SO{:016X}'.format(index),
+        'title': '{} {}'.format(words(number >> 8, 1 + number % 4), index),
+        'duration': 60 + (number >> 40) % 420 + ((number >> 56) % 100000) / 100000.0,
+        'year': 0 if number % 5 == 0 else 1950 + (number >> 64) % 70
+    }
+    song.update(generate_artist(seed, (number >> 72) % artists))
+
+    return song
+
+
+def generate_songs(seed, count, artists):
+
+    """
+    Generates the songs of the dataset.
+
+    Args:
+        seed (int): The seed of the dataset.
+        count (int): The number of songs.
+        artists (int): The number of artists.
+
+    Returns:
+        (generator): The songs.
+    """
+
+    for index in range(count):
+        yield generate_song(seed, index, artists)
+
+
+def generate_events(seed, count, songs, artists, users, match_rate=0.9):
+
+    """
+    Generates the events of the dataset, one every few seconds from the
+    first of November 2018. Most of them are song plays, skewed towards the
+    most popular songs; the rest of the plays are of songs missing in the
+    song data. The users start at the free level and may upgrade later.
+
+    Args:
+        seed (int): The seed of the dataset.
+        count (int): The number of events.
+        songs (int): The number of songs of the dataset.
+        artists (int): The number of artists of the dataset.
+        users (int): The number of users.
+        match_rate (float): The rate of plays of songs found in the song
+            data, from 0 to 1.
+
+    Returns:
+        (generator): The events, named as in the log data.
+    """
+
+    ts = START_TS
+
+    for index in range(count):
+
+        number = digest(seed, 'event', index)
+        ts += 1 + number % 5000
+
+        user = number >> 16
+        user_index = user % users
+        user_number = digest(seed, 'user', user_index)
+
+        # The users upgrade to the paid level halfway through the dataset.
+        level = 'paid' if user_number % 2 and index > count // 2 else 'free'
+
+        event = {
+            'artist': None,
+            'auth': 'Logged In',
+            'firstName': words(user_number >> 8, 1),
+            'gender': 'F' if user_number % 2 else 'M',
+            'itemInSession': (number >> 32) % 100,
+            'lastName': words(user_number >> 16, 1),
+            'length': None,
+            'level': level,
+            'location': LOCATIONS[user_number % len(LOCATIONS)],
+            'method': 'PUT',
+            'page': 'NextSong',
+            'registration': START_TS - (user_number >> 24) % 10 ** 10,
+            'sessionId': (user_index * 1000 + index // 10000) % 2 ** 31,
+            'song': None,
+            'status': 200,
+            'ts': ts,
+            'userAgent': USER_AGENTS[user_number % len(USER_AGENTS)],
+            'userId': str(user_index + 1)
+        }
+
+        # A fifth of the events are not song plays.
+        if (number >> 40) % 5 == 0:
+            event['page'] = OTHER_PAGES[(number >> 48) % len(OTHER_PAGES)]
+            event['method'] = 'GET'
+            yield event
+            continue
+
+        # The popular songs are played more often.
+        skew = ((number >> 64) % 10 ** 6 / 10.0 ** 6) ** 3
+        if (number >> 96) % 1000 < match_rate * 1000:
+            song = generate_song(seed, int(skew * songs), artists)
+        else:
+            song = generate_song(seed + 1, int(skew * songs), artists)
+
+        event['artist'] = song['artist_name']
+        event['song'] = song['title']
+        event['length'] = song['duration']
+
+        yield event
+
+
+def write_records(directory, name, records):
+
+    """
+    Writes the given records as JSON documents, one per line, split into
+    files of RECORDS_PER_FILE records.
+
+    Args:
+        directory (str): The directory of the files.
+        name (str): The name of the files, followed by their number.
+        records (iterable): The records.
+
+    Returns:
+        (int): The number of files written.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    files = 0
+    output = None
+
+    for index, record in enumerate(records):
+        if index % RECORDS_PER_FILE == 0:
+            if output is not None:
+                output.close()
+            output = open(os.path.join(directory, '{}-{:05d}.json'.format(name, files)), 'w')
+            files += 1
+        output.write(json.dumps(record))
+        output.write('\n')
+
+    if output is not None:
+        output.close()
+
+    return files
+
+
+def write_dataset(data_root, bucket, events, songs, artists, users, seed=0):
+
+    """
+    Writes a synthetic dataset in the layout of the local engine: a
+    directory per bucket, with the prefixes 'log-data' and 'song-data'.
+
+    Args:
+        data_root (str): The local directory that mirrors the buckets.
+        bucket (str): The bucket name.
+        events (int): The number of events.
+        songs (int): The number of songs.
+        artists (int): The number of artists.
+        users (int): The number of users.
+        seed (int): The seed of the dataset.
+
+    Returns:
+        (dict): The number of files written, by prefix.
+    """
+
+    return {
+        'song-data': write_records(
+            os.path.join(data_root, bucket, 'song-data'),
+            'songs',
+            generate_songs(seed, songs, artists)
+        ),
+        'log-data': write_records(
+            os.path.join(data_root, bucket, 'log-data'),
+            'events',
+            generate_events(seed, events, songs, artists, users)
+        )
+    }
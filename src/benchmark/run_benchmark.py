@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import quote_plus
+
+# The benchmark drives the Sparkify operators and table definitions.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'airflow', 'plugins'))
+sys.path.insert(0, os.path.join(root, 'aws'))
+
+import psycopg2  # noqa: E402
+from generators import write_dataset  # noqa: E402
+from helpers import RedshiftSession  # noqa: E402
+from operators import (  # noqa: E402
+    DataQualityOperator,
+    LoadDimensionsOperator,
+    LoadFactOperator,
+    StageToRedshiftOperator
+)
+from schema import TABLES, quote  # noqa: E402
+
+
+# The identifier of the connection used by the operators.
+conn_id = 'benchmark'
+
+# The bucket of the synthetic dataset.
+bucket = 'sparkify-benchmark'
+
+# The tables counted after every stage.
+stage_tables = {
+    'stage_events': ('staging_events',),
+    'stage_songs': ('staging_songs',),
+    'load_fact': ('songplays',),
+    'load_dimensions': ('users', 'songs', 'artists', 'time'),
+    'quality_checks': ('songs', 'artists', 'users', 'time', 'songplays')
+}
+
+# A reference to the builtin function 'print()'.
+builtin_print = print
+
+
+def print(text):
+
+    """
+    Prints a timestamp next to the the given text.
+
+    Args:
+        text (str): The text to print.
+    """
+
+    return builtin_print('{} | {}'.format(
+        time.strftime('%H:%M:%S', time.gmtime()),
+        text
+    ))
+
+
+class TaskInstance():
+
+    """
+    Keeps the values the operators push to XCom, in place of the Airflow
+    task instance.
+    """
+
+    def __init__(self):
+
+        """
+        Initializes a new instance of the class TaskInstance.
+        """
+
+        self.xcom = {}
+
+    def xcom_push(self, key, value, execution_date=None):
+
+        """
+        Keeps a value pushed by an operator.
+
+        Args:
+            key (str): The key of the value.
+            value (object): The value.
+            execution_date (datetime): Ignored.
+        """
+
+        self.xcom[key] = value
+
+
+def get_version():
+
+    """
+    Gets the version of the pipeline, as the current git commit.
+
+    Returns:
+        (str): The abbreviated commit hash, or None out of a git repository.
+    """
+
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=root,
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_context(execution_date):
+
+    """
+    Builds the task context of a run.
+
+    Args:
+        execution_date (datetime): The execution date of the run.
+
+    Returns:
+        (dict): The task context.
+    """
+
+    return {
+        'execution_date': execution_date,
+        'next_execution_date': datetime.utcnow(),
+        'ds': execution_date.strftime('%Y-%m-%d'),
+        'ds_nodash': execution_date.strftime('%Y%m%d'),
+        'ts': execution_date.isoformat(),
+        'ts_nodash': execution_date.strftime('%Y%m%dT%H%M%S'),
+        'ti': TaskInstance()
+    }
+
+
+def create_tables(dsn):
+
+    """
+    Creates the Sparkify tables from scratch in the local database.
+
+    Args:
+        dsn (str): The DSN of the local database.
+    """
+
+    with psycopg2.connect(dsn) as conn:
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            for table in TABLES:
+                cur.execute('DROP TABLE IF EXISTS public.{};'.format(quote(table.name)))
+                cur.execute(table.create_query(local=True))
+
+
+def count_rows(tables):
+
+    """
+    Counts the rows of the given tables.
+
+    Args:
+        tables (iterable): The table names.
+
+    Returns:
+        (int): The total number of rows.
+    """
+
+    session = RedshiftSession(conn_id)
+    return sum(session.get_records('SELECT COUNT(*) FROM {};'.format(table))[0][0] for table in tables)
+
+
+def get_operators():
+
+    """
+    Builds the operators of every stage of the pipeline, configured as in
+    the Sparkify DAG.
+
+    Returns:
+        (list): The stage names along with their operators.
+    """
+
+    return [
+        ('stage_events', StageToRedshiftOperator(
+            task_id='Stage_events',
+            redshift_conn_id=conn_id,
+            iam_role_arn='local',
+            s3_prefix='s3://{}/log-data'.format(bucket),
+            target_table='staging_events'
+        )),
+        ('stage_songs', StageToRedshiftOperator(
+            task_id='Stage_songs',
+            redshift_conn_id=conn_id,
+            iam_role_arn='local',
+            s3_prefix='s3://{}/song-data'.format(bucket),
+            target_table='staging_songs'
+        )),
+        ('load_fact', LoadFactOperator(
+            task_id='Load_songplays_fact_table',
+            redshift_conn_id=conn_id,
+            target_table='songplays'
+        )),
+        ('load_dimensions', LoadDimensionsOperator(
+            task_id='Load_dimension_tables',
+            redshift_conn_id=conn_id,
+            dimensions={
+                'users': {'target_table': 'users'},
+                'songs': {'target_table': 'songs'},
+                'artists': {'target_table': 'artists'},
+                'time': {'target_table': 'time', 'mode': 'incremental', 'pk_field': 'start_time'}
+            }
+        )),
+        ('quality_checks', DataQualityOperator(
+            task_id='Run_data_quality_checks',
+            redshift_conn_id=conn_id,
+            tables=('songs', 'artists', 'users', 'time', 'songplays')
+        ))
+    ]
+
+
+def run_stage(name, operator, context, trace_memory=True):
+
+    """
+    Runs a stage of the pipeline and measures it.
+
+    Args:
+        name (str): The name of the stage.
+        operator (BaseOperator): The operator of the stage.
+        context (dict): The task context.
+        trace_memory (bool): Whether the memory allocated by the stage is
+            traced, which slows it down a little.
+
+    Returns:
+        (dict): The stage name, its wall time in seconds, the rows of the
+            tables it writes (or checks), the rows per second, the peak
+            memory allocated by Python during the stage in kilobytes (None
+            when not traced), any error and the values pushed to XCom.
+    """
+
+    print('Running stage: {}'.format(name))
+
+    # The tracing starts afresh with every stage, so its peak belongs to
+    # the stage alone, unlike the peak resident memory of the process.
+    if trace_memory:
+        tracemalloc.start()
+
+    error = None
+    start = time.perf_counter()
+    try:
+        operator.execute(context)
+        operator.post_execute(context)
+    except Exception as e:
+        error = str(e)
+    seconds = time.perf_counter() - start
+
+    peak_memory_kb = None
+    if trace_memory:
+        peak_memory_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    rows = count_rows(stage_tables[name])
+
+    return {
+        'stage': name,
+        'seconds': round(seconds, 3),
+        'rows': rows,
+        'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_memory_kb': peak_memory_kb,
+        'error': error,
+        'xcom': context['ti'].xcom
+    }
+
+
+def save_result(output, result):
+
+    """
+    Appends a benchmark result to the results file.
+
+    Args:
+        output (str): The path of the JSON results file.
+        result (dict): The result.
+    """
+
+    results = []
+    if os.path.exists(output):
+        with open(output) as f:
+            results = json.load(f)
+
+    results.append(result)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+
+
+def run_benchmark(args):
+
+    """
+    Generates a synthetic dataset of the given scale, runs every stage of
+    the pipeline against the local engine and saves the measurements.
+
+    Args:
+        args (Namespace): The command line arguments.
+    """
+
+    songs = args.songs or max(args.events // 10, 10)
+    artists = max(songs // 4, 1)
+    users = max(args.events // 1000, 10)
+
+    result = {
+        'version': get_version(),
+        'started_at': datetime.utcnow().isoformat(),
+        'events': args.events,
+        'songs': songs,
+        'artists': artists,
+        'users': users,
+        'seed': args.seed,
+        'stages': []
+    }
+
+    if not args.skip_generation:
+        print('Generating {} events and {} songs'.format(args.events, songs))
+        start = time.perf_counter()
+        write_dataset(args.data_root, bucket, args.events, songs, artists, users, args.seed)
+        result['generation_seconds'] = round(time.perf_counter() - start, 3)
+
+    # The operators reach the local engine through an Airflow connection
+    # defined by an environment variable.
+    os.environ['AIRFLOW_CONN_{}'.format(conn_id.upper())] = \
+        'postgres://{}:{}@{}:{}/{}?engine=local&data_root={}'.format(
+            quote_plus(args.user),
+            quote_plus(args.password),
+            args.host,
+            args.port,
+            args.dbname,
+            quote_plus(os.path.abspath(args.data_root))
+        )
+
+    create_tables('host={} port={} dbname={} user={} password={}'.format(
+        args.host,
+        args.port,
+        args.dbname,
+        args.user,
+        args.password
+    ))
+
+    execution_date = datetime(2018, 11, 1)
+    for name, operator in get_operators():
+        stage = run_stage(name, operator, get_context(execution_date), trace_memory=not args.no_memory)
+        print('{stage}: {seconds} s, {rows} rows, {rows_per_second} rows/s, {peak_memory_kb} KB'.format(
+            **stage
+        ))
+        result['stages'].append(stage)
+
+    save_result(args.output, result)
+    print('Results saved in {} :-)'.format(args.output))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Sparkify pipeline benchmark')
+    parser.add_argument('--events', type=int, default=10000, help='the number of events')
+    parser.add_argument(
+        '--songs',
+        type=int,
+        default=None,
+        help='the number of songs, a tenth of the events by default'
+    )
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the dataset')
+    parser.add_argument('--data-root', default='benchmark_data', help='the directory of the dataset')
+    parser.add_argument('--skip-generation', action='store_true', help='reuse the dataset already generated')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace the memory of the stages')
+    parser.add_argument('--output', default='benchmark_results.json', help='the JSON results file')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--dbname', default='sparkify')
+    parser.add_argument('--user', default='airflow')
+    parser.add_argument('--password', default='airflow')
+
+    run_benchmark(parser.parse_args())
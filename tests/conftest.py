@@ -0,0 +1,122 @@
+import importlib.util
+import os
+import pytest
+import sys
+import types
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+
+
+# The plugins directory, which Airflow puts on the path of the workers.
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'airflow', 'plugins')
+
+sys.path.insert(0, PLUGINS_DIR)
+
+# The package helpers re-exports RedshiftSession, which needs Airflow. The
+# helper modules under test do not, so without Airflow the package is loaded
+# without its __init__, and they can still be tested on their own.
+if importlib.util.find_spec('airflow') is None and 'helpers' not in sys.modules:
+    helpers = types.ModuleType('helpers')
+    helpers.__path__ = [os.path.join(PLUGINS_DIR, 'helpers')]
+    sys.modules['helpers'] = helpers
+
+
+# The scripts of the AWS directory, which hold the schema of the tables.
+AWS_DIR = os.path.join(os.path.dirname(PLUGINS_DIR), os.pardir, 'aws')
+
+sys.path.insert(0, os.path.normpath(AWS_DIR))
+
+
+class TaskInstance:
+
+    """
+    Stands for an Airflow task instance in the context of a task, keeping
+    the values pushed to XCom in memory.
+    """
+
+    def __init__(self, xcom=None):
+        self.xcom = dict(xcom or {})
+
+    def xcom_push(self, key, value, execution_date=None):
+        self.xcom[key] = value
+
+    def xcom_pull(self, task_ids=None, key=None, **kwargs):
+        return self.xcom.get(key)
+
+
+@pytest.fixture
+def database():
+
+    """
+    Gets the DSN of a disposable PostgreSQL database, given by the variable
+    SPARKIFY_TEST_DATABASE, after dropping everything it holds. The tests
+    that need one are skipped when the variable is not set.
+    """
+
+    psycopg2 = pytest.importorskip('psycopg2')
+
+    dsn = os.environ.get('SPARKIFY_TEST_DATABASE')
+    if not dsn:
+        pytest.skip('SPARKIFY_TEST_DATABASE is not set')
+
+    with psycopg2.connect(dsn) as conn:
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public;')
+    conn.close()
+
+    return dsn
+
+
+@pytest.fixture
+def local_connection(database, tmpdir, monkeypatch):
+
+    """
+    Sets up an Airflow connection to the test database through the local
+    engine, reading the files of a temporary directory, and creates the
+    tables of the project.
+
+    Returns:
+        (str): The connection identifier, unique to the test since the
+            sessions keep their connections for the whole process.
+    """
+
+    pytest.importorskip('airflow')
+    psycopg2 = pytest.importorskip('psycopg2')
+    from schema import TABLES
+
+    with psycopg2.connect(database) as conn:
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            for table in TABLES:
+                cur.execute(table.create_query(local=True))
+    conn.close()
+
+    params = psycopg2.extensions.parse_dsn(database)
+    conn_id = 'sparkify_test_{}'.format(uuid.uuid4().hex)
+    monkeypatch.setenv('AIRFLOW_CONN_{}'.format(conn_id.upper()), 'postgres://{}:{}@{}:{}/{}?{}'.format(
+        quote(params.get('user', ''), safe=''),
+        quote(params.get('password', ''), safe=''),
+        params.get('host', 'localhost'),
+        params.get('port', 5432),
+        params['dbname'],
+        urlencode({'engine': 'local', 'data_root': str(tmpdir)})
+    ))
+
+    return conn_id
+
+
+@pytest.fixture
+def context():
+
+    """
+    Builds the context of a task run, for the interval of 2018-11-01.
+    """
+
+    return {
+        'ti': TaskInstance(),
+        'ts_nodash': '20181101T000000',
+        'execution_date': datetime(2018, 11, 1, tzinfo=timezone.utc),
+        'next_execution_date': datetime(2018, 11, 2, tzinfo=timezone.utc)
+    }
@@ -0,0 +1,89 @@
+import pytest
+from datetime import datetime
+from helpers.aggregates import (
+    DEFAULT_AGGREGATES,
+    aggregate_keys,
+    bucket_range,
+    compile_aggregate,
+    merge_expressions,
+    validate_aggregate
+)
+
+
+def test_bucket_range_by_hour():
+    spec = DEFAULT_AGGREGATES['song_hourly_plays']
+    assert bucket_range(spec, datetime(2018, 11, 1, 10, 30), datetime(2018, 11, 1, 11, 30)) \
+        == (datetime(2018, 11, 1, 10), datetime(2018, 11, 1, 12))
+    assert bucket_range(spec, datetime(2018, 11, 1, 10), datetime(2018, 11, 1, 11)) \
+        == (datetime(2018, 11, 1, 10), datetime(2018, 11, 1, 11))
+
+
+def test_bucket_range_by_day():
+    spec = DEFAULT_AGGREGATES['user_daily_plays']
+    assert bucket_range(spec, datetime(2018, 11, 1, 23), datetime(2018, 11, 2)) \
+        == (datetime(2018, 11, 1), datetime(2018, 11, 2))
+    assert bucket_range(spec, datetime(2018, 11, 1, 23), datetime(2018, 11, 2, 1)) \
+        == (datetime(2018, 11, 1), datetime(2018, 11, 3))
+
+
+def test_bucket_range_without_time_bucket():
+    assert bucket_range(DEFAULT_AGGREGATES['user_sessions'], datetime(2018, 11, 1), datetime(2018, 11, 2)) is None
+
+
+def test_compile_aggregate_of_an_interval():
+    spec = DEFAULT_AGGREGATES['user_daily_plays']
+    query, columns = compile_aggregate(spec, 'songplays', 'start_time', datetime(2018, 11, 1), datetime(2018, 11, 2))
+
+    assert columns == ['bucket_start', 'userid', 'paid_plays', 'plays']
+    assert aggregate_keys(spec) == ['bucket_start', 'userid']
+    assert 'DATE_TRUNC(\'day\', src.start_time) AS bucket_start' in query
+    assert 'COALESCE(SUM(CASE WHEN level = \'paid\' THEN 1 ELSE 0 END), 0) AS paid_plays' in query
+    assert 'COUNT(*) AS plays' in query
+    assert 'src.userid IS NOT NULL' in query
+    assert 'src.start_time >= \'2018-11-01 00:00:00\' AND src.start_time < \'2018-11-02 00:00:00\'' in query
+    assert 'GROUP BY 1, 2' in query
+
+
+def test_compile_aggregate_of_a_delta_table():
+    spec = dict(DEFAULT_AGGREGATES['user_sessions'], where='level = \'paid\'')
+    query, columns = compile_aggregate(
+        spec,
+        'songplays',
+        'start_time',
+        datetime(2018, 11, 1),
+        datetime(2018, 11, 2),
+        delta_table='user_sessions_delta'
+    )
+
+    assert columns == ['userid', 'sessionid', 'plays', 'session_end', 'session_start']
+    assert 'EXISTS (SELECT 1 FROM user_sessions_delta AS delta ' \
+        'WHERE delta.userid = src.userid AND delta.sessionid = src.sessionid)' in query
+    assert 'src.start_time >=' not in query
+    assert '(level = \'paid\')' in query
+
+
+def test_merge_expressions():
+    assert merge_expressions(DEFAULT_AGGREGATES['user_sessions'], 'target', 'delta') == [
+        'plays = target.plays + delta.plays',
+        'session_end = GREATEST(target.session_end, delta.session_end)',
+        'session_start = LEAST(target.session_start, delta.session_start)'
+    ]
+
+
+@pytest.mark.parametrize('spec', [
+    None,
+    {'target_table': '', 'group_by': ['userid'], 'measures': {'plays': ['count', '*']}},
+    {'target_table': 'plays', 'time_bucket': 'week', 'measures': {'plays': ['count', '*']}},
+    {'target_table': 'plays', 'measures': {'plays': ['count', '*']}},
+    {'target_table': 'plays', 'group_by': ['userid'], 'measures': {}},
+    {'target_table': 'plays', 'group_by': ['userid'], 'measures': {'userid': ['count', '*']}},
+    {'target_table': 'plays', 'group_by': ['userid'], 'measures': {'users': ['count_distinct', 'userid']}}
+])
+def test_validate_aggregate_refuses_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        validate_aggregate(spec)
+
+
+def test_validate_aggregate_accepts_the_defaults():
+    for spec in DEFAULT_AGGREGATES.values():
+        validate_aggregate(spec)
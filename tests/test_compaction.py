@@ -0,0 +1,45 @@
+import gzip
+import os
+import pytest
+from helpers.compaction import CompactedWriter
+
+
+def test_compacted_writer_hands_over_every_file():
+    files = []
+
+    def publish(path, number):
+        with gzip.open(path, 'rt') as f:
+            files.append((number, f.read().splitlines()))
+
+    with CompactedWriter(1, publish) as writer:
+        writer.write('{"a": 1}')
+        writer.write('{"a": 2}')
+
+    assert files == [(0, ['{"a": 1}']), (1, ['{"a": 2}'])]
+    assert writer.lines == 2
+    assert writer.files == 2
+    assert not os.path.exists(writer._directory)
+
+
+def test_compacted_writer_removes_its_files_on_failure():
+    files = []
+
+    with pytest.raises(RuntimeError):
+        with CompactedWriter(1024 * 1024, lambda path, number: files.append(number)) as writer:
+            writer.write('{"a": 1}')
+            raise RuntimeError('The validation failed.')
+
+    assert files == []
+    assert not os.path.exists(writer._directory)
+
+
+def test_compacted_writer_removes_its_files_when_the_upload_fails():
+
+    def publish(path, number):
+        raise IOError('The upload failed.')
+
+    with pytest.raises(IOError):
+        with CompactedWriter(1024 * 1024, publish) as writer:
+            writer.write('{"a": 1}')
+
+    assert not os.path.exists(writer._directory)
@@ -0,0 +1,32 @@
+from helpers.grants import grant_statements, parse_acl
+
+
+ACL = 'sparkify=arwdRxt/sparkify|group analysts=r/sparkify|"etl user"=a*w*/sparkify|=r/sparkify|nobody=/sparkify'
+
+
+def test_parse_acl():
+    assert parse_acl(ACL) == [
+        ('sparkify', ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REFERENCES']),
+        ('GROUP analysts', ['SELECT']),
+        ('"etl user"', ['INSERT', 'UPDATE']),
+        ('PUBLIC', ['SELECT'])
+    ]
+
+
+def test_parse_acl_of_the_default_privileges():
+    assert parse_acl(None) == []
+    assert parse_acl('') == []
+
+
+def test_grant_statements_skip_the_owner():
+    assert grant_statements('songs__new', ACL, 'sparkify') == [
+        'GRANT SELECT ON songs__new TO GROUP analysts;',
+        'GRANT INSERT, UPDATE ON songs__new TO "etl user";',
+        'GRANT SELECT ON songs__new TO PUBLIC;'
+    ]
+
+
+def test_grant_statements_skip_a_quoted_owner():
+    assert grant_statements('songs__new', '"etl user"=arwdRxt/"etl user"|group bi=r/"etl user"', 'etl user') == [
+        'GRANT SELECT ON songs__new TO GROUP bi;'
+    ]
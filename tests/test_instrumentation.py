@@ -0,0 +1,85 @@
+import logging
+import pytest
+
+from helpers.instrumentation import InstrumentedCursor, report_statements, reports_failures
+
+
+class Operator:
+
+    """
+    Stands for an operator whose task fails once it ran its statements.
+    """
+
+    dag_id = 'sparkify'
+    task_id = 'load_songplays_fact_table'
+    log = logging.getLogger(__name__)
+
+    def __init__(self):
+        self.reported = []
+
+    def post_execute(self, context, result=None):
+        self.reported.append(context)
+
+    @reports_failures
+    def execute(self, context):
+        raise RuntimeError('The load failed.')
+
+
+def test_a_failed_task_is_reported():
+    operator = Operator()
+
+    with pytest.raises(RuntimeError, match='The load failed.'):
+        operator.execute({'ti': None})
+
+    assert operator.reported == [{'ti': None}]
+
+
+def test_a_failure_to_report_does_not_hide_the_failure_of_the_task():
+    operator = Operator()
+    operator.post_execute = lambda context: 1 / 0
+
+    with pytest.raises(RuntimeError, match='The load failed.'):
+        operator.execute({})
+
+
+def test_the_statements_are_labelled(database):
+    import psycopg2
+
+    statements = []
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cursor:
+            cursor = InstrumentedCursor(cursor, statements, 'abc123')
+            cursor.execute('SELECT %s AS  value;', (1,))
+            assert cursor.fetchall() == [(1,)]
+            cursor.execute(b'SELECT 2;')
+            assert cursor.query.startswith(b'/* abc123.')
+    conn.close()
+
+    first, second = statements
+    assert first['statement'] == 'SELECT %s AS value;'
+    assert first['rows'] == 1
+    assert first['label'].startswith('abc123.')
+    assert second['statement'] == 'SELECT 2;'
+    assert int(second['label'].split('.')[1]) > int(first['label'].split('.')[1])
+    assert first['query_id'] is None
+
+
+def test_the_local_statements_are_not_labelled(local_connection, context):
+    from helpers.redshift_session import RedshiftSession
+
+    session = RedshiftSession(local_connection)
+    session.run('SELECT 1;')
+    operator = Operator()
+    operator.xcom_push = lambda context, key, value: context['ti'].xcom_push(key, value)
+
+    report_statements(operator, context, session)
+
+    assert session.label is None
+    assert context['ti'].xcom['statements'] == [{
+        'statement': 'SELECT 1;',
+        'duration': session.statements[0]['duration'],
+        'rows': 1,
+        'label': None,
+        'query_id': None,
+        'bytes_scanned': None
+    }]
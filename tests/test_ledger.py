@@ -0,0 +1,106 @@
+import json
+import pytest
+
+pytest.importorskip('airflow')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from helpers.ledger import loaded_objects, new_objects, record_objects  # noqa: E402
+from helpers.local_engine import list_local_objects  # noqa: E402
+from operators.stage_redshift import StageToRedshiftOperator  # noqa: E402
+
+COPY_QUERY = """
+    COPY staging_events
+    FROM 's3://sparkify/log_data/2018/11/{}'
+    CREDENTIALS 'aws_iam_role=arn:aws:iam::123456789012:role/sparkify'
+    TIMEFORMAT AS 'epochmillisecs'
+    JSON 'auto';
+"""
+
+
+def query(database, statement):
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.execute(statement)
+            rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def objects(local_connection, tmpdir):
+    directory = tmpdir.mkdir('sparkify').mkdir('log_data').mkdir('2018').mkdir('11')
+    for day in range(1, 4):
+        directory.join('2018-11-0{}-events.json'.format(day)).write(
+            json.dumps({'page': 'NextSong', 'ts': 1541030400000 + day}) + '\n'
+        )
+    directory.join('2018-11-04-events.json').write('{"page": "NextSong", "ts": ')
+    return list(list_local_objects(str(tmpdir), 'sparkify', 'log_data/'))
+
+
+def stage_operator(local_connection, ledger_table='staging_files'):
+    return StageToRedshiftOperator(
+        task_id='Stage_events',
+        redshift_conn_id=local_connection,
+        iam_role_arn='arn:aws:iam::123456789012:role/sparkify',
+        s3_prefix='s3://sparkify/log_data',
+        target_table='staging_events',
+        ledger_table=ledger_table
+    )
+
+
+def test_only_the_new_and_changed_objects_are_copied(database, objects, tmpdir):
+    etags = {obj['key']: obj['etag'] for obj in objects}
+
+    # The first day was loaded as is, the second one before it was
+    # rewritten, and the third one only into another table. The key of
+    # another prefix is not taken for one of 'log_data/'.
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            record_objects(cur, 'staging_files', 'staging_events', objects[:2])
+            record_objects(cur, 'staging_files', 'staging_songs', objects[2:3])
+            record_objects(cur, 'staging_files', 'staging_events', [
+                {'key': 'logXdata/events.json', 'etag': 'd41d8cd98f00b204e9800998ecf8427e', 'size': 3}
+            ])
+    conn.close()
+    tmpdir.join('sparkify', 'log_data', '2018', '11', '2018-11-02-events.json').write('{"ts": 20}\n')
+
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            loaded = loaded_objects(cur, 'staging_files', 'staging_events', ['log_data/'])
+    conn.close()
+    pending = new_objects(list_local_objects(str(tmpdir), 'sparkify', 'log_data/'), loaded)
+
+    assert loaded == {(key, etags[key]) for key in sorted(etags)[:2]}
+    assert [obj['key'] for obj in pending] == [
+        'log_data/2018/11/2018-11-02-events.json',
+        'log_data/2018/11/2018-11-03-events.json',
+        'log_data/2018/11/2018-11-04-events.json'
+    ]
+
+
+def test_the_copied_objects_are_recorded_with_the_copy(database, local_connection, objects):
+    operator = stage_operator(local_connection)
+
+    rows = operator.run_copy(COPY_QUERY.format('2018-11-01'), objects[:1])
+
+    assert rows == 1
+    assert query(database, 'SELECT target_table, s3_key, etag, size FROM staging_files;') == [
+        ('staging_events', objects[0]['key'], objects[0]['etag'], objects[0]['size'])
+    ]
+
+
+def test_the_objects_of_a_failed_copy_are_not_recorded(database, local_connection, objects):
+    operator = stage_operator(local_connection)
+
+    with pytest.raises(ValueError):
+        operator.run_copy(COPY_QUERY.format('2018-11-0'), objects)
+
+    assert query(database, 'SELECT COUNT(*) FROM staging_events;') == [(0,)]
+    assert query(database, 'SELECT COUNT(*) FROM staging_files;') == [(0,)]
+
+
+def test_the_objects_are_not_recorded_without_a_ledger(database, local_connection, objects):
+    operator = stage_operator(local_connection, ledger_table=None)
+
+    assert operator.run_copy(COPY_QUERY.format('2018-11-01'), objects[:1]) == 1
+    assert query(database, 'SELECT COUNT(*) FROM staging_files;') == [(0,)]
@@ -0,0 +1,119 @@
+import pytest
+from datetime import datetime
+
+pytest.importorskip('airflow')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from operators.load_dimension import LoadDimensionOperator  # noqa: E402
+
+SONGS = [
+    ('SOUPRIS', 'ARMUSE', 'Muse', 'Uprising', 305, 2009),
+    ('SOHYSTE', 'ARMUSE', 'Muse', 'Hysteria', 227, 2003)
+]
+
+
+def query(database, statement, parameters=None):
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.execute(statement, parameters)
+            rows = cur.fetchall() if cur.description is not None else None
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def staged(database, local_connection):
+    for song in SONGS:
+        query(database, """
+            INSERT INTO staging_songs (song_id, artist_id, artist_name, title, duration, year)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, song)
+    return database
+
+
+def test_a_qualified_table_is_merged(staged, local_connection, context):
+    query(staged, "INSERT INTO songs VALUES ('SOHYSTE', 'Hysteria', 'ARMUSE', 2004, 227);")
+    operator = LoadDimensionOperator(
+        task_id='Load_song_dim_table',
+        redshift_conn_id=local_connection,
+        target_table='public.songs',
+        dimension='songs',
+        pk_field='songid',
+        mode='merge'
+    )
+
+    operator.execute(context)
+
+    assert query(staged, 'SELECT songid, year FROM songs ORDER BY songid;') == [
+        ('SOHYSTE', 2003),
+        ('SOUPRIS', 2009)
+    ]
+
+
+def test_the_users_are_swapped(database, local_connection, context):
+    query(database, """
+        INSERT INTO staging_events (page, userid, firstname, lastname, gender, level, ts)
+        VALUES ('NextSong', 7, 'Ada', 'Lovelace', 'F', 'free', 1541030400000),
+               ('NextSong', 7, 'Ada', 'Lovelace', 'F', 'paid', 1541034000000);
+    """)
+    query(database, "INSERT INTO users (userid, level) VALUES (8, 'free');")
+    operator = LoadDimensionOperator(
+        task_id='Load_user_dim_table',
+        redshift_conn_id=local_connection,
+        target_table='users',
+        dimension='users',
+        mode='swap'
+    )
+
+    operator.execute(context)
+
+    assert query(database, 'SELECT userid, level, valid_to, is_current FROM users;') == [
+        (7, 'paid', datetime(9999, 12, 31), True)
+    ]
+    assert query(database, 'SELECT userid FROM users__old;') == [(8,)]
+
+
+@pytest.mark.parametrize('merge_update, merged, years', [
+    (True, '1 records inserted, 1 records updated', [2003, 1999, 2009]),
+    (False, '1 records inserted, 0 records updated', [2004, 1999, 2009])
+])
+def test_the_merged_records_are_counted(staged, local_connection, context, caplog, merge_update, merged, years):
+    query(staged, """
+        INSERT INTO staging_songs (song_id, artist_id, artist_name, title, duration, year)
+        VALUES ('SOSUNBU', 'ARMUSE', 'Muse', 'Sunburn', 234, 1999);
+        INSERT INTO songs VALUES ('SOHYSTE', 'Hysteria', 'ARMUSE', 2004, 227),
+                                 ('SOSUNBU', 'Sunburn', 'ARMUSE', 1999, 234);
+    """)
+    operator = LoadDimensionOperator(
+        task_id='Load_song_dim_table',
+        redshift_conn_id=local_connection,
+        target_table='songs',
+        dimension='songs',
+        pk_field='songid',
+        mode='merge',
+        merge_update=merge_update
+    )
+
+    with caplog.at_level('INFO'):
+        operator.execute(context)
+
+    assert 'The table songs has been merged: {}.'.format(merged) in caplog.text
+    assert query(staged, 'SELECT year FROM songs ORDER BY songid;') == [(year,) for year in years]
+
+
+def test_the_merged_records_of_a_duplicated_key_are_counted(staged, local_connection, context, caplog):
+    query(staged, "INSERT INTO artists (artistid, name) VALUES ('ARMUSE', 'The Muse'), ('ARMUSE', 'Muse!');")
+    operator = LoadDimensionOperator(
+        task_id='Load_artist_dim_table',
+        redshift_conn_id=local_connection,
+        target_table='artists',
+        dimension='artists',
+        pk_field='artistid',
+        mode='merge'
+    )
+
+    with caplog.at_level('INFO'):
+        operator.execute(context)
+
+    assert 'The table artists has been merged: 0 records inserted, 1 records updated.' in caplog.text
+    assert query(staged, 'SELECT artistid, name FROM artists;') == [('ARMUSE', 'Muse')]
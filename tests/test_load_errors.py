@@ -0,0 +1,86 @@
+import gzip
+import json
+from helpers.load_errors import build_quarantine, drop_rejected_lines, failing_files, get_load_errors
+
+
+ERRORS = [
+    {'file': 's3://bucket/log-data/a.json', 'line': 2, 'reason': 'Invalid timestamp'},
+    {'file': 's3://bucket/log-data/a.json', 'line': 4, 'reason': 'Value too long'},
+    {'file': 's3://bucket/log-data/b.json', 'line': 1, 'reason': 'Invalid JSON'}
+]
+
+CONTENT = b'{"a": 1}\n{"a": "x"}\n{"a": 3}\n{"a": "yyyy"}\n'
+
+
+class PagedCursor:
+
+    """
+    A DB-API cursor that returns a list of rows, page by page, the way the
+    LIMIT and OFFSET of the load errors query ask for.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._page = []
+        self.queries = 0
+
+    def execute(self, query, parameters):
+        _, _, limit, offset = parameters
+        self._page = self._rows[offset:offset + limit]
+        self.queries += 1
+
+    def fetchall(self):
+        return self._page
+
+
+def test_failing_files():
+    files = failing_files(ERRORS)
+    assert sorted(files) == ['s3://bucket/log-data/a.json', 's3://bucket/log-data/b.json']
+    assert [error['line'] for error in files['s3://bucket/log-data/a.json']] == [2, 4]
+
+
+def test_drop_rejected_lines():
+    content, removed = drop_rejected_lines(CONTENT, ERRORS[:2])
+
+    assert content == b'{"a": 1}\n{"a": 3}\n'
+    assert removed == [
+        {'line': 2, 'error': 'Invalid timestamp', 'record': '{"a": "x"}'},
+        {'line': 4, 'error': 'Value too long', 'record': '{"a": "yyyy"}'}
+    ]
+
+
+def test_drop_rejected_lines_of_a_gzip_file():
+    content, removed = drop_rejected_lines(gzip.compress(CONTENT), ERRORS[:2], compressed=True)
+
+    assert gzip.decompress(content) == b'{"a": 1}\n{"a": 3}\n'
+    assert len(removed) == 2
+
+
+def test_drop_rejected_lines_of_every_line():
+    content, removed = drop_rejected_lines(b'{"a": "x"}\n', [{'line': 1, 'reason': 'Invalid JSON'}])
+    assert content == b''
+    assert len(removed) == 1
+
+
+def test_build_quarantine():
+    _, removed = drop_rejected_lines(CONTENT, ERRORS[:2])
+    lines = build_quarantine('s3://bucket/log-data/a.json', removed).splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {'key': 's3://bucket/log-data/a.json', 'line': 2, 'error': 'Invalid timestamp', 'record': '{"a": "x"}'},
+        {'key': 's3://bucket/log-data/a.json', 'line': 4, 'error': 'Value too long', 'record': '{"a": "yyyy"}'}
+    ]
+
+
+def test_get_load_errors_reads_every_page():
+    rows = [
+        ('s3://bucket/log-data/a.json', line, 'ts', 'int8', 0, 'x', 1206, 'Invalid timestamp')
+        for line in range(1, 6)
+    ]
+    cursor = PagedCursor(rows)
+
+    errors = get_load_errors(cursor, 1234, 5678, page_size=2)
+
+    assert [error['line'] for error in errors] == [1, 2, 3, 4, 5]
+    assert errors[0]['reason'] == 'Invalid timestamp'
+    assert cursor.queries == 3
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip('airflow')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from operators.load_fact import LoadFactOperator  # noqa: E402
+
+# Two plays of 2018-11-01, the first of a staged song, and a visit of the
+# home page.
+EVENTS = [
+    ('Muse', 'NextSong', 'Uprising', 305, 1541030400000, 7, 'free'),
+    ('Unknown', 'NextSong', 'Unreleased', 200, 1541034000000, 7, 'free'),
+    (None, 'Home', None, None, 1541037600000, 7, 'free')
+]
+
+
+@pytest.fixture
+def staged(database, local_connection):
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO staging_events (artist, page, song, length, ts, userid, level, sessionid)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 1)
+            """, EVENTS)
+            cur.execute("""
+                INSERT INTO staging_songs (song_id, artist_id, artist_name, title, duration)
+                VALUES ('SOUPRIS', 'ARMUSE', 'Muse', 'Uprising', 305)
+            """)
+    conn.close()
+    return database
+
+
+def songplays(database):
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT start_time, songid FROM songplays ORDER BY start_time;')
+            rows = cur.fetchall()
+    conn.close()
+    return [(start_time.isoformat(), songid) for start_time, songid in rows]
+
+
+@pytest.mark.parametrize('window_scoped', [False, True])
+def test_the_records_are_published(staged, local_connection, context, window_scoped):
+    operator = LoadFactOperator(
+        task_id='Load_songplays_fact_table',
+        redshift_conn_id=local_connection,
+        target_table='songplays',
+        window_scoped=window_scoped,
+        publish_mode='append'
+    )
+
+    operator.execute(context)
+
+    assert songplays(staged) == [('2018-11-01T00:00:00', 'SOUPRIS'), ('2018-11-01T01:00:00', None)]
+    assert context['ti'].xcom['matched_plays'] == 1
+    assert context['ti'].xcom['unmatched_plays'] == 1
+
+
+def test_the_records_already_published_are_refused(staged, local_connection, context):
+    operator = LoadFactOperator(
+        task_id='Load_songplays_fact_table',
+        redshift_conn_id=local_connection,
+        target_table='songplays',
+        publish_mode='append'
+    )
+    operator.execute(context)
+
+    with pytest.raises(ValueError, match='2 records already loaded'):
+        operator.execute(context)
+
+    assert len(songplays(staged)) == 2
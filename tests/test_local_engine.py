@@ -0,0 +1,75 @@
+import gzip
+import json
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from helpers.local_engine import copy_files, read_json_documents, translate_query  # noqa: E402
+
+DOCUMENTS = [
+    {'song': 'Yellow', 'length': 269.5, 'ts': 1541903636796},
+    {'song': None, 'page': 'Home', 'ts': 1541903770796},
+    {'song': 'Écoute', 'tags': ['a', 'b'], 'ts': 1541904034796}
+]
+
+
+def test_translate_query_drops_the_table_attributes():
+    query = translate_query("""
+        CREATE TABLE songplays (
+            songplay_id varchar(32) ENCODE zstd NOT NULL,
+            start_time timestamp NOT NULL SORTKEY,
+            songid varchar(256) DISTKEY
+        ) DISTSTYLE KEY DISTKEY (songid) COMPOUND SORTKEY (start_time, songid);
+    """)
+
+    assert 'ENCODE' not in query
+    assert 'DISTSTYLE' not in query
+    assert 'DISTKEY (' not in query
+    assert 'SORTKEY (' not in query
+    assert 'songplay_id varchar(32) NOT NULL' in query
+    assert query.strip().endswith(');')
+
+
+def test_translate_query_rewrites_the_functions():
+    assert translate_query('SELECT EXTRACT(dayofweek FROM start_time)') == 'SELECT EXTRACT(dow FROM start_time)'
+    assert translate_query('SELECT APPROXIMATE COUNT(DISTINCT userid)') == 'SELECT COUNT(DISTINCT userid)'
+    assert translate_query('SELECT md5(events.sessionid || events.ts)') \
+        == 'SELECT md5(CAST(events.sessionid AS varchar) || CAST(events.ts AS varchar))'
+
+
+def test_translate_query_keeps_the_postgresql_syntax():
+    query = 'SELECT userid, COUNT(*) FROM songplays GROUP BY userid;'
+    assert translate_query(query) == query
+
+
+@pytest.mark.parametrize('options', [
+    "TIMEFORMAT AS 'epochmillisecs' CSV GZIP",
+    'FORMAT AS ORC'
+])
+def test_copy_files_refuses_the_formats_it_cannot_read(options):
+    query = "COPY staging_events FROM 's3://bucket/log-data/json/' {};".format(options)
+    with pytest.raises(ValueError, match='not supported by the local engine'):
+        copy_files(None, '/nonexistent', query)
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024 * 1024])
+def test_read_json_documents_by_chunks(tmpdir, compressed, chunk_size):
+    content = '\n'.join(json.dumps(document) for document in DOCUMENTS[:2]) \
+        + '\n' + json.dumps(DOCUMENTS[2], indent=2) + '\n\n'
+    path = str(tmpdir.join('events.json.gz' if compressed else 'events.json'))
+    with (gzip.open(path, 'wt') if compressed else open(path, 'w')) as f:
+        f.write(content)
+
+    assert list(read_json_documents(path, compressed, chunk_size)) == DOCUMENTS
+
+
+def test_read_json_documents_of_a_truncated_file(tmpdir):
+    path = str(tmpdir.join('events.json'))
+    with open(path, 'w') as f:
+        f.write(json.dumps(DOCUMENTS[0]) + '\n{"song": "Yel')
+
+    documents = read_json_documents(path, chunk_size=8)
+    assert next(documents) == DOCUMENTS[0]
+    with pytest.raises(ValueError):
+        next(documents)
@@ -0,0 +1,100 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from helpers.manifest import (
+    build_manifest,
+    join_s3_url,
+    list_objects,
+    render_key,
+    split_s3_url,
+    window_contexts
+)
+
+
+def test_split_and_join_s3_url():
+    assert split_s3_url('s3://bucket/log-data/2018/11') == ('bucket', 'log-data/2018/11')
+    assert split_s3_url('bucket') == ('bucket', '')
+    assert join_s3_url('s3://bucket/log-data/', '/2018/11') == 's3://bucket/log-data/2018/11'
+
+
+def test_render_key_accepts_format_specs():
+    context = {'execution_date': datetime(2018, 11, 5), 'ds': '2018-11-05'}
+    key = render_key('{execution_date:%Y/%m}/{ds}-events.json', context)
+    assert key == '2018/11/2018-11-05-events.json'
+
+
+def test_window_contexts_include_both_ends():
+    context = {'dag_run': 'run', 'ds': '2019-01-01'}
+    steps = list(window_contexts(context, '2018-11-01', datetime(2018, 11, 3)))
+
+    assert [step['ds'] for step in steps] == ['2018-11-01', '2018-11-02', '2018-11-03']
+    assert steps[0]['execution_date'] == datetime(2018, 11, 1)
+    assert steps[0]['ds_nodash'] == '20181101'
+    assert steps[0]['ts_nodash'] == '20181101T000000'
+    assert all(step['dag_run'] == 'run' for step in steps)
+    assert context['ds'] == '2019-01-01'
+
+
+def test_window_contexts_by_hour():
+    steps = list(window_contexts({}, datetime(2018, 11, 1, 22), datetime(2018, 11, 2, 1), timedelta(hours=1)))
+    assert [step['execution_date'].hour for step in steps] == [22, 23, 0, 1]
+
+
+def test_window_contexts_empty_when_reversed():
+    assert list(window_contexts({}, '2018-11-03', '2018-11-01')) == []
+
+
+def test_build_manifest():
+    manifest = json.loads(build_manifest('bucket', [
+        {'key': 'log-data/a.json', 'etag': 'a', 'size': 10},
+        {
+            'key': 'log-data/b.json',
+            'etag': 'b',
+            'size': 20,
+            'url': 's3://quarantine/run/cleaned/log-data/b.json',
+            'content_length': 15
+        }
+    ]))
+
+    assert manifest == {
+        'entries': [
+            {'url': 's3://bucket/log-data/a.json', 'mandatory': True, 'meta': {'content_length': 10}},
+            {
+                'url': 's3://quarantine/run/cleaned/log-data/b.json',
+                'mandatory': True,
+                'meta': {'content_length': 15}
+            }
+        ]
+    }
+
+
+def test_list_objects(monkeypatch):
+    boto3 = pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+
+    # moto 5 mocks every service at once.
+    mock_s3 = getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3')
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_s3():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='sparkify')
+        for day in range(1, 4):
+            client.put_object(
+                Bucket='sparkify',
+                Key='log_data/2018/11/2018-11-0{}-events.json'.format(day),
+                Body='{{"ts": {}}}\n'.format(day).encode('utf-8')
+            )
+        client.put_object(Bucket='sparkify', Key='song_data/A/song.json', Body=b'{}\n')
+
+        objects = list(list_objects(client, 'sparkify', 'log_data/2018/11/'))
+
+    assert [obj['key'] for obj in objects] == [
+        'log_data/2018/11/2018-11-01-events.json',
+        'log_data/2018/11/2018-11-02-events.json',
+        'log_data/2018/11/2018-11-03-events.json'
+    ]
+    assert all(not obj['etag'].startswith('"') for obj in objects)
+    assert all(obj['size'] == 10 for obj in objects)
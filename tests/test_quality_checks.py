@@ -0,0 +1,134 @@
+import pytest
+from datetime import datetime, timedelta
+from helpers.quality_checks import compile_checks, evaluate_checks
+
+
+SPEC = {
+    'min_rows': 1,
+    'null_rates': {'userid': 0.1},
+    'unique': ['songplay_id'],
+    'references': {'songid': ('songs', 'songid', 0.5)},
+    'freshness': ('start_time', timedelta(hours=2))
+}
+
+
+def test_compile_checks_in_a_single_query():
+    query, checks = compile_checks('songplays', SPEC)
+
+    assert query.count('SELECT') == 2
+    assert 'FROM songplays AS src' in query
+    assert 'COUNT(DISTINCT COALESCE(CAST(LENGTH(CAST(src.songplay_id AS varchar)) AS varchar) || \':\' || ' \
+        'CAST(src.songplay_id AS varchar), \'-\'))' in query
+    assert 'LEFT JOIN (SELECT DISTINCT songid AS ref_key FROM songs) AS ref_0' in query
+    assert 'MAX(src.start_time)' in query
+    assert 'WHERE' not in query
+    assert 'APPROXIMATE' not in query
+
+    assert [check['check'] for check in checks] == [
+        'row_count',
+        'null_rate:userid',
+        'unique:songplay_id',
+        'references:songid->songs.songid',
+        'freshness:start_time'
+    ]
+    assert checks[1]['tolerance'] == 0
+    assert checks[4]['threshold'] == 7200
+
+
+def test_compile_checks_in_approximate_mode():
+    query, checks = compile_checks(
+        'songplays',
+        {'unique': ['songplay_id']},
+        approximate=True,
+        window=('start_time', datetime(2018, 11, 1), datetime(2018, 11, 2)),
+        sample_rate=0.25,
+        tolerance=0.05
+    )
+
+    assert 'APPROXIMATE COUNT(DISTINCT' in query
+    assert 'src.start_time >= \'2018-11-01 18:00:00\' AND src.start_time < \'2018-11-02 00:00:00\'' in query
+    assert 'RANDOM()' not in query
+    assert checks == [{
+        'kind': 'approximate_unique',
+        'check': 'unique:songplay_id',
+        'columns': (0, 1),
+        'threshold': 0,
+        'tolerance': 0.05
+    }]
+
+
+def test_evaluate_checks():
+    _, checks = compile_checks('songplays', SPEC)
+    context = {'next_execution_date': datetime(2018, 11, 2)}
+
+    # 100 rows, 20 null users, 1 duplicate, 10 unknown songs, 3 hours old.
+    row = (100, 20, 99, 10, datetime(2018, 11, 1, 21))
+    results = {result['check']: result for result in evaluate_checks('songplays', checks, row, context)}
+
+    assert results['row_count']['passed']
+    assert not results['null_rate:userid']['passed']
+    assert results['null_rate:userid']['value'] == 0.2
+    assert not results['unique:songplay_id']['passed']
+    assert results['references:songid->songs.songid']['passed']
+    assert not results['freshness:start_time']['passed']
+    assert results['freshness:start_time']['value'] == 3 * 3600
+
+
+def test_compile_checks_samples_the_window_only():
+    query, _ = compile_checks('songs', {'unique': ['songid']}, approximate=True, sample_rate=0.25)
+
+    assert 'WHERE' not in query
+
+
+def test_the_unique_key_tells_nulls_and_separators_apart(database):
+    psycopg2 = pytest.importorskip('psycopg2')
+    query, checks = compile_checks('pairs', {'unique': ['a', 'b']})
+
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMPORARY TABLE pairs AS
+                SELECT * FROM (VALUES (NULL, 'x'), ('', 'x'), ('a|', 'b'), ('a', '|b'), ('-', 'x')) AS v (a, b);
+            """)
+            cur.execute(query)
+            row = cur.fetchone()
+    conn.close()
+
+    assert evaluate_checks('pairs', checks, row) == [{
+        'table': 'pairs',
+        'check': 'unique:a,b',
+        'value': 0,
+        'threshold': 0,
+        'passed': True
+    }]
+
+
+def test_the_default_checks_in_approximate_mode(local_connection, database, context):
+    psycopg2 = pytest.importorskip('psycopg2')
+    from operators.data_quality import DataQualityOperator
+
+    with psycopg2.connect(database) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO songplays (playid, start_time, userid)
+                VALUES ('a', '2018-11-01 17:00:00', 7),
+                       ('b', '2018-11-01 22:00:00', 7),
+                       ('c', '2018-11-02 00:00:00', 7);
+            """)
+    conn.close()
+    operator = DataQualityOperator(
+        task_id='Run_data_quality_checks',
+        redshift_conn_id=local_connection,
+        tables=('songplays',),
+        approximate=True,
+        sample_rate=0.25
+    )
+
+    operator.execute(context)
+
+    assert [(r['check'], r['value']) for r in context['ti'].xcom['report']] == [
+        ('row_count', 1),
+        ('null_rate:playid', 0.0),
+        ('null_rate:start_time', 0.0),
+        ('unique:playid', 0.0)
+    ]
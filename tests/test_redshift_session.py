@@ -0,0 +1,67 @@
+import pytest
+import threading
+import time
+
+pytest.importorskip('airflow')
+pytest.importorskip('psycopg2')
+
+from helpers.redshift_session import RedshiftSession  # noqa: E402
+from psycopg2.pool import PoolError  # noqa: E402
+
+
+def test_sessions_of_another_size_get_their_own_pool(local_connection):
+    small = RedshiftSession(local_connection, max_connections=1)
+    large = RedshiftSession(local_connection, max_connections=4)
+
+    assert small.get_pool() is RedshiftSession(local_connection, max_connections=1).get_pool()
+    assert small.get_pool() is not large.get_pool()
+    assert large.get_pool().maxconn == 4
+    assert small.data_root == large.data_root is not None
+
+
+def test_a_session_waits_for_a_free_connection(local_connection):
+    session = RedshiftSession(local_connection, max_connections=1)
+    given_back = []
+
+    def borrow():
+        with session.connection():
+            time.sleep(0.5)
+            given_back.append(time.monotonic())
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    time.sleep(0.1)
+
+    assert session.get_records('SELECT 1;') == [(1,)]
+    assert len(given_back) == 1
+    thread.join()
+
+
+def test_a_session_gives_up_waiting(local_connection, monkeypatch):
+    monkeypatch.setattr(RedshiftSession, 'pool_wait_timeout', 0.1)
+    session = RedshiftSession(local_connection, max_connections=1)
+
+    with session.connection():
+        with pytest.raises(PoolError, match='within 0.1 seconds'):
+            with session.connection():
+                pass
+
+    assert session.get_records('SELECT 1;') == [(1,)]
+
+
+def test_the_statement_timeout_is_kept_by_the_connection(local_connection):
+    session = RedshiftSession(local_connection, statement_timeout=5, max_connections=1)
+
+    with session.connection() as conn:
+        assert conn.statement_timeout == 5000
+        with conn.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout;')
+            assert cursor.fetchone() == ('5s',)
+
+    session.run('SELECT 1;', autocommit=True, statement_timeout=1)
+
+    with RedshiftSession(local_connection, max_connections=1).connection() as conn:
+        assert conn.statement_timeout == 0
+        with conn.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout;')
+            assert cursor.fetchone() == ('0',)